@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+"""Reproducible ytrss benchmarks.
+
+Runs the real refresh pipeline (fetch_feed -> parse -> DB -> menu rows)
+against benchmarks/feedserver.py for synthetic OPML files of several
+sizes, and times the DB helpers against a seen table with many rows. Each
+scenario runs in its own process with its own HOME, so peak RSS is per
+scenario and nothing leaks between them. Results are printed (or written
+with --output) as JSON; compare two runs with benchmarks/compare.py.
+
+    python benchmarks/bench.py --output before.json
+    python benchmarks/bench.py --channels 10,500 --latency 80 --p429 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+sys.path.insert(0, BENCH_DIR)
+import feedserver  # noqa: E402
+
+
+def percentiles(samples):
+    """p50/p90/p99/max of a list of seconds, in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99),
+            "max_ms": round(ordered[-1] * 1000, 3), "count": len(ordered)}
+
+
+def peak_rss_kib():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def import_ytrss():
+    """Imports ytrss.py from the repo root. HOME must already point at the scenario dir."""
+    # On sys.path rather than loaded from a file, so the parse pool's workers can import it too
+    sys.path.insert(0, REPO_DIR)
+    import ytrss
+    return ytrss
+
+
+def write_opml(path, channels, port):
+    outlines = "\n".join(
+        f'        <outline text="Bench Channel {n}" title="Bench Channel {n}" type="rss" '
+        f'xmlUrl="http://127.0.0.1:{port}/feeds/videos.xml?channel_id={feedserver.channel_id(n)}" />'
+        for n in range(channels))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"""<?xml version='1.0' encoding='UTF-8'?>
+<opml version="1.0">
+    <head>
+        <title>Benchmark Subscriptions</title>
+    </head>
+    <body>
+{outlines}
+    </body>
+</opml>
+""")
+
+
+def configure_ytrss(ytrss, options):
+    """Points ytrss at the fake yt-dlp, the feed server and the benchmark's timeouts."""
+    ytrss.YTDLP_CMD = os.path.join(BENCH_DIR, "fake-yt-dlp")
+    ytrss.YOUTUBE_URL = f"http://127.0.0.1:{options.port}"
+    ytrss.have_ytdlp_module = lambda: False
+    ytrss.HTTP_READ_TIMEOUT = options.read_timeout
+
+
+# --- Pipeline scenario ---
+
+async def pipeline_pass(ytrss, fetch_times, metadata_videos=0):
+    """One start-up + refresh the way main_async does it, timed per stage."""
+    fetch_times.clear()
+    ytrss.feed_status.clear()
+    stages = {}
+    mark = time.perf_counter()
+
+    def lap(stage):
+        nonlocal mark
+        now = time.perf_counter()
+        stages[stage] = round(now - mark, 4)
+        mark = now
+
+    start = mark
+    await ytrss.load_state()
+    feeds = ytrss.load_feeds_from_opml()
+    videos_by_feed, feed_titles = await ytrss.load_snapshot(feeds)
+    lap("startup_s")
+
+    feed_cache = {url: ytrss.load_feed_cache(url) for url in feeds}
+    results = await ytrss.fetch_feeds(feeds, feed_cache)
+    lap("fetch_s")
+    resolved = await ytrss.resolve_feeds(feeds, results, feed_cache)
+    lap("parse_s")
+    await ytrss.classify_shorts(resolved)
+    lap("shorts_s")
+    added = await ytrss.apply_refresh(resolved, videos_by_feed, feed_titles)
+    await ytrss.db_flush()
+    lap("db_s")
+
+    all_videos_by_channel = ytrss.group_videos(videos_by_feed, feed_titles)
+    ytrss.count_unread(all_videos_by_channel)
+    page, _ = await ytrss.all_videos_pager(all_videos_by_channel)()
+    rows = [ytrss.video_row(v) for v in page]
+    lap("menu_rows_s")
+
+    resolved_metadata = 0
+    if metadata_videos:
+        items = [(v.id, v.link) for v in added[:metadata_videos]]
+        metadata = await ytrss.resolve_metadata(items)
+        resolved_metadata = sum(1 for meta in metadata.values() if meta)
+        lap("metadata_s")
+    total = time.perf_counter() - start
+
+    statuses = {}
+    for status in ytrss.feed_status.values():
+        key = "failed" if status.startswith("failed") else status
+        statuses[key] = statuses.get(key, 0) + 1
+
+    await ytrss.close_http_session()
+    await ytrss.close_db()
+    result = {
+        "total_s": round(total, 4),
+        "stages": stages,
+        "feeds_per_s": round(len(feeds) / total, 1) if total else None,
+        "videos": sum(len(videos) for videos in all_videos_by_channel.values()),
+        "new_videos": len(added),
+        "new_shorts": sum(1 for v in added if v.is_shorts),
+        "menu_rows": len(rows),
+        "feed_status": statuses,
+        "fetch_latency": percentiles(fetch_times),
+    }
+    if metadata_videos:
+        result["metadata_resolved"] = resolved_metadata
+        result["metadata_per_s"] = round(resolved_metadata / stages["metadata_s"], 1) if stages["metadata_s"] else None
+    return result
+
+
+async def simulate_polling(ytrss, hours, every_minutes):
+    """Replays a day of scheduled refreshes against the cached feeds.
+
+    Counts the feed requests due_feeds lets through, refreshing every
+    every_minutes with every fetch succeeding, against fetching all feeds
+    every time.
+    """
+    feeds = ytrss.load_feeds_from_opml()
+    resolved = {}
+    for url in feeds:
+        cached = ytrss.load_feed_cache(url)
+        if cached:
+            resolved[url] = (cached['channel'], cached['entries'])
+    # Uploads in the feeds are from BASE_TIME on; start right after the newest
+    start = max((published for _, entries in resolved.values() for _, _, _, published, *_ in entries),
+                default=time.time())
+    ytrss.feed_schedule.clear()
+    refreshes = int(hours * 60 / every_minutes)
+    requests = 0
+    for step in range(refreshes):
+        now = start + step * every_minutes * 60
+        due = ytrss.due_feeds(feeds, now)
+        for url in due:
+            ytrss.feed_status[url] = "unchanged"
+        ytrss.schedule_feeds(due, resolved, now)
+        requests += len(due)
+    await ytrss.db_flush()
+    await ytrss.close_db()
+    unscheduled = refreshes * len(feeds)
+    return {"hours": hours, "refresh_every_min": every_minutes, "requests": requests,
+            "requests_unscheduled": unscheduled,
+            "reduction": round(unscheduled / requests, 1) if requests else None}
+
+
+async def simulate_push(ytrss, channels, port, fraction):
+    """Subscribes every feed at the feed server's hub, then times uploads until they are in the DB.
+
+    Latency runs from publishing a share of uploads to each new video being
+    stored by the receiver. The hub's rate limit is lifted like the
+    import's; feed_requests counts the feeds fetched meanwhile.
+    """
+    ytrss.WEBSUB_RATE = 1_000_000
+    receiver_port = free_port()
+    feeds = ytrss.load_feeds_from_opml()
+    videos_by_feed, feed_titles = await ytrss.load_snapshot(feeds)
+    runner = await ytrss.start_websub_receiver("127.0.0.1", receiver_port, videos_by_feed, feed_titles, quiet=True)
+
+    arrivals = []
+    original_ingest_push = ytrss.ingest_push
+
+    async def timed_ingest_push(*args):
+        added = await original_ingest_push(*args)
+        arrivals.extend(time.perf_counter() for _ in added)
+        return added
+
+    ytrss.ingest_push = timed_ingest_push
+    try:
+        started = time.perf_counter()
+        await ytrss.renew_websub(feeds, f"http://127.0.0.1:{port}/hub", f"http://127.0.0.1:{receiver_port}")
+        while not all(ytrss.websub_active(url) for url in feeds) and time.perf_counter() - started < 60:
+            await asyncio.sleep(0.01)
+        subscribe_s = time.perf_counter() - started
+        subscribed = sum(1 for url in feeds if ytrss.websub_active(url))
+
+        before = await feed_server_stats(port)
+        published = time.perf_counter()
+        bumped = await bump_feeds(port, channels, fraction)
+        while len(arrivals) < bumped and time.perf_counter() - published < 30:
+            await asyncio.sleep(0.005)
+        after = await feed_server_stats(port)
+    finally:
+        ytrss.ingest_push = original_ingest_push
+        await runner.cleanup()
+    await ytrss.close_http_session()
+    await ytrss.close_db()
+    fetched = sum(after[key] - before[key] for key in ("200", "304", "429", "hung"))
+    return {"subscribed": subscribed, "subscribe_s": round(subscribe_s, 4), "uploads": bumped,
+            "ingested": len(arrivals), "latency": percentiles([t - published for t in arrivals]),
+            "feed_requests": fetched}
+
+
+async def simulate_import(ytrss, channels):
+    """Imports a Takeout-style CSV of every channel, half of them as @handles, into an empty OPML.
+
+    The rate limit is lifted so the figure is ytrss's own throughput.
+    """
+    ytrss.IMPORT_RATE = 1_000_000
+    ytrss.OPML_FILE = os.path.join(os.path.dirname(ytrss.OPML_FILE), "imported.opml")
+    rows = ["Channel Id,Channel Url,Channel Title"]
+    for n in range(channels):
+        cid = feedserver.channel_id(n)
+        url = f"https://www.youtube.com/@bench{n}" if n % 2 else f"http://www.youtube.com/channel/{cid}"
+        rows.append(f"{cid if not n % 2 else ''},{url},Bench Channel {n}")
+    started = time.perf_counter()
+    result = await ytrss.import_subscriptions(ytrss.read_subscriptions("\n".join(rows)))
+    elapsed = time.perf_counter() - started
+    return {"entries": channels, "added": len(result['added']), "failed": len(result['failed']),
+            "total_s": round(elapsed, 4), "channels_per_s": round(channels / elapsed, 1)}
+
+
+async def feed_server_stats(port):
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{port}/control/stats") as response:
+            return await response.json()
+
+
+async def bump_feeds(port, channels, fraction):
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"http://127.0.0.1:{port}/control/bump",
+                                params={"fraction": str(fraction), "channels": str(channels)}) as response:
+            return (await response.json())["bumped"]
+
+
+async def run_pipeline(options):
+    ytrss = import_ytrss()
+    configure_ytrss(ytrss, options)
+    write_opml(ytrss.OPML_FILE, options.channels, options.port)
+
+    fetch_times = []
+    original_fetch_feed = ytrss.fetch_feed
+
+    async def timed_fetch_feed(session, url, cached=None):
+        started = time.perf_counter()
+        try:
+            return await original_fetch_feed(session, url, cached)
+        finally:
+            fetch_times.append(time.perf_counter() - started)
+
+    ytrss.fetch_feed = timed_fetch_feed
+
+    passes = {}
+    # Empty cache and DB, every feed downloaded and parsed
+    passes["cold"] = await pipeline_pass(ytrss, fetch_times, options.metadata_videos)
+    # Nothing changed, everything should come back 304
+    passes["warm"] = await pipeline_pass(ytrss, fetch_times)
+    # A share of channels uploaded something new
+    bumped = await bump_feeds(options.port, options.channels, options.change_fraction)
+    passes["changed"] = await pipeline_pass(ytrss, fetch_times)
+    passes["changed"]["channels_changed"] = bumped
+    # Requests the adaptive scheduler makes instead of fetching every feed on every refresh
+    polling = await simulate_polling(ytrss, 24, 15)
+    # New uploads pushed by the WebSub hub instead
+    push = await simulate_push(ytrss, options.channels, options.port, options.change_fraction)
+    # Moving the whole subscription list over with `ytrss import`
+    imported = await simulate_import(ytrss, options.channels)
+    await ytrss.close_http_session()
+
+    ytrss.shutdown_metadata_workers()
+    ytrss.shutdown_parse_pool()
+    return {"channels": options.channels, "passes": passes, "polling": polling, "push": push,
+            "import": imported,
+            "peak_rss_kib": peak_rss_kib()}
+
+
+# --- DB scenario ---
+
+def fill_db(conn, ytrss, seen_rows, channels, playlist_items):
+    """Bulk-loads a large history straight into the tables."""
+    rng = random.Random(42)
+    now = int(time.time())
+    with conn:
+        # Random 64-bit keys, like encoded YouTube IDs
+        batch = []
+        for _ in range(seen_rows):
+            batch.append((rng.getrandbits(64) - (1 << 63), now - rng.randrange(5 * 365 * 86400)))
+            if len(batch) == 100_000:
+                conn.executemany("INSERT OR IGNORE INTO seen (vid, seen_ts) VALUES (?, ?)", batch)
+                batch = []
+        conn.executemany("INSERT OR IGNORE INTO seen (vid, seen_ts) VALUES (?, ?)", batch)
+
+        video_rows = []
+        for n in range(channels):
+            feed_url = f"http://127.0.0.1/feeds/videos.xml?channel_id={feedserver.channel_id(n)}"
+            for seq in range(ytrss.SNAPSHOT_CHANNEL_LIMIT):
+                vid = f"yt:video:{feedserver.video_id(n, seq)}"
+                published = feedserver.BASE_TIME + seq * feedserver.upload_interval(n) + n
+                title = feedserver.TITLE_PATTERNS[(n + seq) % len(feedserver.TITLE_PATTERNS)].format(
+                    n=n % 97 + 3, i=seq)
+                description = f"{title}\n\nLinks, sponsors and chapters for episode {seq} of channel {n}."
+                video_rows.append((vid, title, f"Bench Channel {n}", f"https://www.youtube.com/watch?v={vid[9:]}",
+                                   False, "", published, feed_url, description))
+        conn.executemany(ytrss.SQL_INSERT_VIDEO, video_rows)
+        watch_later = conn.execute("SELECT id FROM playlists WHERE is_system_list = 1").fetchone()[0]
+        conn.executemany("INSERT OR IGNORE INTO playlist_items (playlist_id, video_id, added_at) VALUES (?, ?, ?)",
+                         [(watch_later, row[0], f"2024-01-01 00:00:{i / 1000:06.3f}")
+                          for i, row in enumerate(video_rows[:playlist_items])])
+    return [row[0] for row in video_rows], [row[7] for row in video_rows[::ytrss.SNAPSHOT_CHANNEL_LIMIT]]
+
+
+async def time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def run_db(options):
+    ytrss = import_ytrss()
+    configure_ytrss(ytrss, options)
+    await ytrss.load_state()
+
+    started = time.perf_counter()
+    video_ids, feed_urls = await ytrss.db_call(fill_db, ytrss, options.seen_rows, options.db_channels,
+                                               options.playlist_items)
+    results = {"seen_rows": options.seen_rows, "stored_videos": len(video_ids),
+               "fill_s": round(time.perf_counter() - started, 2)}
+
+    # What a refresh of every channel asks: 15 IDs per feed, a third of them seen
+    rng = random.Random(7)
+    lookup_ids = rng.sample(video_ids, min(len(video_ids), options.db_channels * 15))
+    ytrss.mark_ids_as_seen(lookup_ids[::3])
+    await ytrss.db_flush()
+
+    samples = await time_calls(lambda: ytrss.get_seen_among(lookup_ids), options.iterations)
+    results["get_seen_among"] = dict(percentiles(samples), ids=len(lookup_ids),
+                                     ids_per_s=round(len(lookup_ids) * len(samples) / sum(samples)))
+
+    ytrss.SEEN_PREFILTER_MIN_ROWS = 0
+    started = time.perf_counter()
+    await ytrss.init_seen_prefilter()
+    results["prefilter_build_s"] = round(time.perf_counter() - started, 3)
+    samples = await time_calls(lambda: ytrss.get_seen_among(lookup_ids), options.iterations)
+    results["get_seen_among_prefiltered"] = dict(percentiles(samples),
+                                                 ids_per_s=round(len(lookup_ids) * len(samples) / sum(samples)))
+
+    fresh = [f"yt:video:{feedserver.video_id(10**9 + i, 0)}" for i in range(options.mark_rows)]
+    started = time.perf_counter()
+    ytrss.mark_ids_as_seen(fresh)
+    await ytrss.db_flush()
+    elapsed = time.perf_counter() - started
+    results["mark_ids_as_seen"] = {"rows": len(fresh), "rows_per_s": round(len(fresh) / elapsed)}
+
+    samples = await time_calls(lambda: ytrss.load_snapshot(feed_urls), max(3, options.iterations // 20))
+    results["load_snapshot"] = dict(percentiles(samples), feeds=len(feed_urls))
+
+    # What the snapshot's video records hold in memory, and a full sort and
+    # Shorts filter over them
+    tracemalloc.start()
+    videos_by_feed, _ = await ytrss.load_snapshot(feed_urls)
+    await ytrss.db_call(lambda conn: None)  # Lets go of the raw rows the last result held
+    results["snapshot_kib"] = tracemalloc.get_traced_memory()[0] // 1024
+    tracemalloc.stop()
+    videos = [v for feed in videos_by_feed.values() for v in feed]
+    samples = []
+    for _ in range(max(3, options.iterations // 20)):
+        started = time.perf_counter()
+        sorted(videos, key=ytrss.published_key, reverse=True)
+        [v for v in videos if not v.is_shorts]
+        samples.append(time.perf_counter() - started)
+    results["sort_filter_videos"] = dict(percentiles(samples), videos=len(videos))
+    del videos, videos_by_feed
+
+    # Ranked full-text search: a common word, a rare one, and a filtered prefix query
+    for name, words, filters in (
+            ("search_common", "reviewing questions", {}),
+            ("search_rare", f"channel {options.db_channels - 1}", {}),
+            ("search_filtered", "kopf", {'shorts': "hide", 'seen': "unseen", 'min_seconds': 60})):
+        filters = dict(ytrss.search_filters(), **filters)
+        samples = await time_calls(lambda: ytrss.search_videos(words, filters), options.iterations)
+        results[name] = dict(percentiles(samples), videos=len(video_ids))
+
+    samples = await time_calls(lambda: ytrss.get_playlists(), options.iterations)
+    results["get_playlists"] = percentiles(samples)
+
+    samples = await time_calls(lambda: ytrss.get_playlist_videos(ytrss.watch_later_id), options.iterations)
+    results["playlist_page"] = dict(percentiles(samples), items=options.playlist_items)
+
+    started = time.perf_counter()
+    count = 0
+    async for _ in ytrss.iter_stored_videos():
+        count += 1
+    elapsed = time.perf_counter() - started
+    results["iter_stored_videos"] = {"rows": count, "rows_per_s": round(count / elapsed)}
+
+    await ytrss.close_db()
+    results["db_size_kib"] = os.path.getsize(ytrss.DB_FILE) // 1024
+    results["peak_rss_kib"] = peak_rss_kib()
+    return results
+
+
+# --- Orchestration ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_feed_server(options):
+    port = free_port()
+    args = [sys.executable, os.path.join(BENCH_DIR, "feedserver.py"), "--port", str(port),
+            "--latency", str(options.latency), "--jitter", str(options.jitter),
+            "--p429", str(options.p429), "--ptimeout", str(options.ptimeout), "--hang", str(options.hang),
+            "--seed", options.seed]
+    proc = subprocess.Popen(args)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("feed server did not start")
+
+
+def run_scenario(scenario, extra_args, env_home):
+    """Runs one scenario in a child process with HOME=env_home and returns its JSON."""
+    result_file = os.path.join(env_home, "result.json")
+    env = dict(os.environ, HOME=env_home)
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--scenario", scenario,
+                    "--result-file", result_file, *extra_args], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    with open(result_file, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "-C", REPO_DIR, "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ytrss performance benchmarks")
+    parser.add_argument("--channels", default="10,500,5000", help="comma-separated OPML sizes")
+    parser.add_argument("--latency", type=float, default=20, help="feed server latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="feed server latency jitter in ms")
+    parser.add_argument("--p429", type=float, default=0.01, help="fraction of feed requests answered with 429")
+    parser.add_argument("--ptimeout", type=float, default=0.0, help="fraction of feed requests that hang")
+    parser.add_argument("--hang", type=float, default=30, help="seconds a hung request sleeps")
+    parser.add_argument("--read-timeout", type=float, default=2, help="ytrss HTTP read timeout during the run")
+    parser.add_argument("--change-fraction", type=float, default=0.1,
+                        help="share of channels with a new upload before the 'changed' pass")
+    parser.add_argument("--metadata-videos", type=int, default=100,
+                        help="videos resolved through the fake yt-dlp in the cold pass")
+    parser.add_argument("--seen-rows", type=int, default=1_000_000)
+    parser.add_argument("--db-channels", type=int, default=2000,
+                        help="channels stored for the DB benchmarks (50 videos each)")
+    parser.add_argument("--playlist-items", type=int, default=5000)
+    parser.add_argument("--mark-rows", type=int, default=10_000)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--seed", default="ytrss")
+    parser.add_argument("--skip-pipeline", action="store_true")
+    parser.add_argument("--skip-db", action="store_true")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    # Used by the child processes
+    parser.add_argument("--scenario", choices=["pipeline", "db"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def scenario_args(options, **overrides):
+    args = []
+    for name in ("read_timeout", "change_fraction", "metadata_videos", "seen_rows", "db_channels",
+                 "playlist_items", "mark_rows", "iterations"):
+        args += ["--" + name.replace("_", "-"), str(getattr(options, name))]
+    for name, value in overrides.items():
+        args += ["--" + name.replace("_", "-"), str(value)]
+    return args
+
+
+def main():
+    options = parse_args()
+
+    if options.scenario:
+        if options.scenario == "pipeline":
+            options.channels = int(options.channels)
+            result = asyncio.run(run_pipeline(options))
+        else:
+            result = asyncio.run(run_db(options))
+        with open(options.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(options).items()
+                   if k not in ("scenario", "port", "result_file", "output")},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="ytrss-bench-") as workdir:
+        if not options.skip_pipeline:
+            server, port = start_feed_server(options)
+            try:
+                report["pipeline"] = {}
+                for channels in (int(c) for c in options.channels.split(",") if c):
+                    home = os.path.join(workdir, f"pipeline-{channels}")
+                    os.makedirs(home)
+                    print(f"pipeline: {channels} channels...", file=sys.stderr)
+                    report["pipeline"][str(channels)] = run_scenario(
+                        "pipeline", scenario_args(options, channels=channels, port=port), home)
+            finally:
+                server.terminate()
+                server.wait()
+
+        if not options.skip_db:
+            home = os.path.join(workdir, "db")
+            os.makedirs(home)
+            print(f"db: {options.seen_rows} seen rows...", file=sys.stderr)
+            report["db"] = run_scenario("db", scenario_args(options), home)
+
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
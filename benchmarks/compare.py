@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Compares two benchmarks/bench.py reports.
+
+    python benchmarks/compare.py before.json after.json [--threshold 10]
+
+Prints every timing, throughput and memory figure side by side with the
+relative change. Changes beyond the threshold (in %) in the wrong
+direction are flagged, and the exit status is 1 if there are any.
+"""
+import argparse
+import json
+import sys
+
+# Figures where a bigger number is better; everything else is a cost
+HIGHER_IS_BETTER = ("_per_s",)
+COMPARED_SUFFIXES = ("_s", "_ms", "_per_s", "_kib")
+
+
+def flatten(node, prefix=""):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, node
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="flag changes beyond this many percent")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    old = dict(flatten({k: before.get(k) for k in ("pipeline", "db")}))
+    new = dict(flatten({k: after.get(k) for k in ("pipeline", "db")}))
+
+    print(f"{before.get('revision')} -> {after.get('revision')}")
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        if not key.endswith(COMPARED_SUFFIXES):
+            continue
+        a, b = old[key], new[key]
+        change = (b - a) / a * 100 if a else 0.0
+        worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+        flag = ""
+        if worse > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif worse < -args.threshold:
+            flag = "  improved"
+        print(f"{key:<60} {a:>12g} {b:>12g} {change:>+8.1f}%{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""Local stand-in for YouTube's feed endpoint, used by the benchmarks.
+
+Serves /feeds/videos.xml?channel_id=<id> with Atom bodies shaped like the
+real ones (yt:, media: namespaces, 15 entries per channel). Latency, 429s
+and hung requests are configurable, and every response carries an ETag so
+revalidation gets 304s. POST /control/bump?fraction=F publishes a new video
+on that fraction of channels. /@bench<n> is channel n's page, for
+resolving @handles, and /shorts/<id> answers 200 for every fifth video
+and redirects the rest to /watch.
+
+POST /hub is a WebSub hub like YouTube's: it verifies subscribe and
+unsubscribe requests with a GET to the callback, and on every bump POSTs
+the new upload to each subscribed callback, signed with X-Hub-Signature.
+
+Run it on its own to point a real ytrss at it:
+
+    python benchmarks/feedserver.py --port 8800 --latency 50 --p429 0.05
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import random
+import secrets
+import time
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+from urllib.parse import parse_qs, urlsplit
+
+import aiohttp
+from aiohttp import web
+
+ENTRIES_PER_FEED = 15
+HUB_MAX_LEASE = 5 * 24 * 3600  # What YouTube's hub grants
+BASE_TIME = 1_700_000_000
+# Upload cadences and the share of channels with each, roughly what a real
+# subscription list looks like; the polling scheduler learns them back
+UPLOAD_CADENCES = [(3600, 0.05), (24 * 3600, 0.20), (3 * 24 * 3600, 0.25), (7 * 24 * 3600, 0.50)]
+
+# A few title shapes so clean_title sees ASCII, accents, emoji and hashtags
+TITLE_PATTERNS = [
+    "How I rebuilt my {n} server rack in a weekend",
+    "Ep. {n}: Reviewing listener questions (part {i})",
+    "Wir testen {n} Kopfhörer – welcher ist der beste?",
+    "{n} tips you NEED to know 🔥🔥 #shorts",
+    "Livestream archive {i} | Q&A, news & more",
+    "Pourquoi {n} développeurs détestent ça 😅",
+]
+
+
+def channel_id(n):
+    """Channel IDs that encode their index, 24 characters like real ones."""
+    return f"UCbench{n:017d}"
+
+
+def channel_index(cid):
+    return int(cid[len("UCbench"):])
+
+
+def upload_interval(n):
+    """Seconds between channel n's uploads, stable per channel."""
+    roll = random.Random(f"cadence:{n}").random()
+    for interval, share in UPLOAD_CADENCES:
+        if roll < share:
+            return interval
+        roll -= share
+    return UPLOAD_CADENCES[-1][0]
+
+
+def video_id(n, seq):
+    """A valid 11-character video ID, stable for (channel, upload number)."""
+    digest = hashlib.blake2b(f"{n}:{seq}".encode(), digest_size=8).digest()
+    return base64.urlsafe_b64encode(digest).decode()[:11]
+
+
+def make_feed(n, generation):
+    """Atom body for channel n after `generation` extra uploads."""
+    cid = channel_id(n)
+    name = f"Bench Channel {n}"
+    newest = ENTRIES_PER_FEED + generation
+    entries = []
+    for seq in range(newest, newest - ENTRIES_PER_FEED, -1):
+        vid = video_id(n, seq)
+        ts = datetime.fromtimestamp(BASE_TIME + seq * upload_interval(n) + n, timezone.utc).isoformat()
+        title = escape(TITLE_PATTERNS[(n + seq) % len(TITLE_PATTERNS)].format(n=n % 97 + 3, i=seq))
+        entries.append(f"""
+ <entry>
+  <id>yt:video:{vid}</id>
+  <yt:videoId>{vid}</yt:videoId>
+  <yt:channelId>{cid}</yt:channelId>
+  <title>{title}</title>
+  <link rel="alternate" href="https://www.youtube.com/watch?v={vid}"/>
+  <author>
+   <name>{name}</name>
+   <uri>https://www.youtube.com/channel/{cid}</uri>
+  </author>
+  <published>{ts}</published>
+  <updated>{ts}</updated>
+  <media:group>
+   <media:title>{title}</media:title>
+   <media:content url="https://www.youtube.com/v/{vid}?version=3" type="application/x-shockwave-flash" width="640" height="390"/>
+   <media:thumbnail url="https://i{seq % 4 + 1}.ytimg.com/vi/{vid}/hqdefault.jpg" width="480" height="360"/>
+   <media:description>{title}
+
+Links, sponsors and chapters for episode {seq}. Thanks for watching!</media:description>
+   <media:community>
+    <media:starRating count="{seq * 7}" average="5.00" min="1" max="5"/>
+    <media:statistics views="{seq * 1013}"/>
+   </media:community>
+  </media:group>
+ </entry>""")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns:media="http://search.yahoo.com/mrss/" xmlns="http://www.w3.org/2005/Atom">
+ <link rel="self" href="http://www.youtube.com/feeds/videos.xml?channel_id={cid}"/>
+ <id>yt:channel:{cid}</id>
+ <yt:channelId>{cid}</yt:channelId>
+ <title>{name}</title>
+ <link rel="alternate" href="https://www.youtube.com/channel/{cid}"/>
+ <author>
+  <name>{name}</name>
+  <uri>https://www.youtube.com/channel/{cid}</uri>
+ </author>
+ <published>2015-01-01T00:00:00+00:00</published>{"".join(entries)}
+</feed>"""
+
+
+def make_notification(n, generation):
+    """What the hub pushes when channel n uploads: its newest entry, without media:group."""
+    cid = channel_id(n)
+    seq = ENTRIES_PER_FEED + generation
+    vid = video_id(n, seq)
+    ts = datetime.fromtimestamp(BASE_TIME + seq * upload_interval(n) + n, timezone.utc).isoformat()
+    title = escape(TITLE_PATTERNS[(n + seq) % len(TITLE_PATTERNS)].format(n=n % 97 + 3, i=seq))
+    return f"""<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+ <link rel="hub" href="https://pubsubhubbub.appspot.com"/>
+ <link rel="self" href="https://www.youtube.com/xml/feeds/videos.xml?channel_id={cid}"/>
+ <title>YouTube video feed</title>
+ <updated>{ts}</updated>
+ <entry>
+  <id>yt:video:{vid}</id>
+  <yt:videoId>{vid}</yt:videoId>
+  <yt:channelId>{cid}</yt:channelId>
+  <title>{title}</title>
+  <link rel="alternate" href="https://www.youtube.com/watch?v={vid}"/>
+  <author>
+   <name>Bench Channel {n}</name>
+   <uri>https://www.youtube.com/channel/{cid}</uri>
+  </author>
+  <published>{ts}</published>
+  <updated>{ts}</updated>
+ </entry>
+</feed>"""
+
+
+def make_app(options):
+    generations = {}  # channel index -> extra uploads so far
+    request_counts = {}
+    stats = {"requests": 0, "200": 0, "304": 0, "429": 0, "hung": 0,
+             "hub_requests": 0, "subscriptions": 0, "pushed": 0, "push_failed": 0}
+    subscribers = {}  # channel index -> {callback: (secret, expires)}
+    tasks = set()  # Verifications and deliveries in flight
+    client = {}
+
+    def spawn(coro):
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def feed(request):
+        cid = request.query.get("channel_id", "")
+        if not cid.startswith("UCbench"):
+            raise web.HTTPNotFound()
+        n = channel_index(cid)
+        count = request_counts[n] = request_counts.get(n, 0) + 1
+        stats["requests"] += 1
+        # Decisions depend only on (seed, channel, request number), so runs repeat
+        rng = random.Random(f"{options.seed}:{n}:{count}")
+
+        latency = options.latency + rng.uniform(-options.jitter, options.jitter)
+        await asyncio.sleep(max(latency, 0) / 1000)
+
+        roll = rng.random()
+        if roll < options.ptimeout:
+            stats["hung"] += 1
+            await asyncio.sleep(options.hang)
+        elif roll < options.ptimeout + options.p429:
+            stats["429"] += 1
+            return web.Response(status=429, headers={"Retry-After": str(options.retry_after)})
+
+        etag = f'"{n}-{generations.get(n, 0)}"'
+        if request.headers.get("If-None-Match") == etag:
+            stats["304"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        stats["200"] += 1
+        return web.Response(text=make_feed(n, generations.get(n, 0)), content_type="application/atom+xml",
+                            charset="utf-8", headers={"ETag": etag})
+
+    async def channel_page(request):
+        handle = request.match_info["handle"]
+        if not handle.startswith("@bench") or not handle[len("@bench"):].isdigit():
+            raise web.HTTPNotFound()
+        cid = channel_id(int(handle[len("@bench"):]))
+        stats["requests"] += 1
+        return web.Response(text=f'<!DOCTYPE html><html><head><link rel="canonical" '
+                                 f'href="https://www.youtube.com/channel/{cid}"></head><body></body></html>',
+                            content_type="text/html")
+
+    async def shorts(request):
+        # Every fifth upload is a Short; the rest redirect to /watch like YouTube does
+        vid = request.match_info["vid"]
+        stats["requests"] += 1
+        if hashlib.blake2b(vid.encode(), digest_size=1).digest()[0] % 5 == 0:
+            return web.Response(text="<!DOCTYPE html><html><body></body></html>", content_type="text/html")
+        raise web.HTTPSeeOther(f"/watch?v={vid}")
+
+    async def verify_intent(mode, n, topic, callback, secret, lease):
+        challenge = secrets.token_hex(8)
+        params = {"hub.mode": mode, "hub.topic": topic, "hub.challenge": challenge}
+        if mode == "subscribe":
+            params["hub.lease_seconds"] = str(lease)
+        try:
+            async with client["session"].get(callback, params=params) as response:
+                confirmed = response.status == 200 and await response.text() == challenge
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            confirmed = False
+        if not confirmed:
+            return
+        channel_subscribers = subscribers.setdefault(n, {})
+        if mode == "subscribe":
+            channel_subscribers[callback] = (secret, time.time() + lease)
+        else:
+            channel_subscribers.pop(callback, None)
+        stats["subscriptions"] = sum(len(subs) for subs in subscribers.values())
+
+    async def hub(request):
+        form = await request.post()
+        stats["hub_requests"] += 1
+        mode, topic, callback = form.get("hub.mode"), form.get("hub.topic", ""), form.get("hub.callback", "")
+        cid = parse_qs(urlsplit(topic).query).get("channel_id", [""])[0]
+        if mode not in ("subscribe", "unsubscribe") or not cid.startswith("UCbench") or not callback:
+            raise web.HTTPBadRequest()
+        lease = min(int(form.get("hub.lease_seconds") or HUB_MAX_LEASE), HUB_MAX_LEASE)
+        spawn(verify_intent(mode, channel_index(cid), topic, callback, form.get("hub.secret"), lease))
+        return web.Response(status=202)
+
+    async def deliver(callback, secret, body):
+        headers = {"Content-Type": "application/atom+xml"}
+        if secret:
+            digest = hmac.new(secret.encode(), body, "sha1").hexdigest()
+            headers["X-Hub-Signature"] = f"sha1={digest}"
+        try:
+            async with client["session"].post(callback, data=body, headers=headers) as response:
+                ok = 200 <= response.status < 300
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            ok = False
+        stats["pushed" if ok else "push_failed"] += 1
+
+    def publish(n):
+        now = time.time()
+        body = make_notification(n, generations.get(n, 0)).encode()
+        for callback, (secret, expires) in subscribers.get(n, {}).items():
+            if expires > now:
+                spawn(deliver(callback, secret, body))
+
+    async def bump(request):
+        fraction = float(request.query.get("fraction", "0.1"))
+        rng = random.Random(f"{options.seed}:bump:{sum(generations.values())}")
+        channels = int(request.query.get("channels", "0"))
+        bumped = 0
+        for n in range(channels):
+            if rng.random() < fraction:
+                generations[n] = generations.get(n, 0) + 1
+                bumped += 1
+                publish(n)
+        return web.json_response({"bumped": bumped})
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    async def start_client(app):
+        client["session"] = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+
+    async def stop_client(app):
+        for task in list(tasks):
+            task.cancel()
+        await client["session"].close()
+
+    app = web.Application()
+    app.on_startup.append(start_client)
+    app.on_cleanup.append(stop_client)
+    app.router.add_get("/feeds/videos.xml", feed)
+    app.router.add_get("/{handle:@[^/]+}", channel_page)
+    app.router.add_get("/shorts/{vid}", shorts)
+    app.router.add_post("/hub", hub)
+    app.router.add_post("/control/bump", bump)
+    app.router.add_get("/control/stats", get_stats)
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=20, help="mean response latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="latency jitter in ms (uniform +-)")
+    parser.add_argument("--p429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--ptimeout", type=float, default=0.0, help="fraction of requests that hang")
+    parser.add_argument("--hang", type=float, default=30, help="seconds a hung request sleeps")
+    parser.add_argument("--seed", default="ytrss")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    web.run_app(make_app(opts), host=opts.host, port=opts.port, print=None)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Checks ytrss's cold-start budget.
+
+1. `python -X importtime` on ytrss: network, parser and browser modules
+   must not be imported before the first screen.
+2. Time to first paint: ytrss is started in a pseudo-terminal against a
+   warm snapshot (filled once from benchmarks/feedserver.py) and timed
+   until the main menu is drawn. The budget applies to the part ytrss is
+   responsible for: first paint minus the dependency floor, the time an
+   interpreter takes to start and import the modules ytrss imports up
+   front. Both depend on the machine, so by default the budget is the
+   floor times --budget-ratio; --budget-ms sets a fixed one instead.
+
+Exits with status 1 if a lazy module is imported eagerly or the median
+first paint is over budget.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget-ms 150 --runs 7 --json
+"""
+import argparse
+import json
+import os
+import pty
+import select
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+YTRSS = os.path.join(REPO_DIR, "ytrss.py")
+
+sys.path.insert(0, BENCH_DIR)
+from bench import start_feed_server, write_opml  # noqa: E402
+
+# Loaded on first use; importing any of them at start-up is a regression
+LAZY_MODULES = ["aiohttp", "feedparser", "webbrowser", "multiprocessing", "concurrent.futures.process"]
+MENU_MARKER = b"--- PLAYLISTS ---"  # First menu row, visible at any terminal height
+
+
+def import_times(home):
+    """Runs `python -X importtime -c 'import ytrss'`.
+
+    Returns ({module: (self us, cumulative us)}, [modules ytrss itself imports]).
+    """
+    env = dict(os.environ, HOME=home, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import ytrss"],
+                          cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    modules = {}
+    direct = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+        # A module is listed after the ones it imports, one level further in
+        depth = len(name) - len(name.lstrip()) - 1
+        if depth == 0 and name.strip() != "ytrss":
+            direct = []
+        elif depth == 2 and "ytrss" not in modules:
+            direct.append(name.strip())
+    return modules, direct
+
+
+def warm_snapshot(home, channels, options):
+    """Fills HOME's DB and feed cache with one `ytrss fetch` against the local feed server."""
+    config_dir = os.path.join(home, ".config", "ytrss")
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"show_archive_warning": False}, f)
+
+    server, port = start_feed_server(options)
+    try:
+        write_opml(os.path.join(config_dir, "ytRss.opml"), channels, port)
+        subprocess.run([sys.executable, YTRSS, "fetch", "-q"], env=dict(os.environ, HOME=home),
+                       check=True, stdout=subprocess.DEVNULL)
+    finally:
+        server.terminate()
+        server.wait()
+    # The server is gone now, so the background refresh fails fast and can't
+    # compete with the first paint for the network
+
+
+def dependency_start(home, modules):
+    """Seconds for an interpreter to start, import modules and exit."""
+    code = f"import {', '.join(modules)}" if modules else "pass"
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=dict(os.environ, HOME=home), check=True)
+    return time.perf_counter() - started
+
+
+def first_paint(home, timeout=10):
+    """Starts the interactive menu in a pty; returns seconds until it is drawn."""
+    env = dict(os.environ, HOME=home, TERM="xterm", COLUMNS="120", LINES="40")
+    started = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execve(sys.executable, [sys.executable, YTRSS], env)
+
+    output = b""
+    elapsed = None
+    try:
+        while time.perf_counter() - started < timeout:
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                output += os.read(fd, 65536)
+            except OSError:
+                break
+            if MENU_MARKER in output:
+                elapsed = time.perf_counter() - started
+                break
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        os.close(fd)
+    if elapsed is None:
+        raise RuntimeError(f"menu not drawn within {timeout}s:\n{output[-2000:].decode(errors='replace')}")
+    return elapsed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ytrss cold-start check")
+    parser.add_argument("--budget-ratio", type=float, default=1.5,
+                        help="budget for the median first paint minus the dependency floor, "
+                             "as a multiple of that floor (default: 1.5)")
+    parser.add_argument("--budget-ms", type=float,
+                        help="a fixed budget in ms instead of --budget-ratio")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=50, help="channels in the warm snapshot")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    options = parser.parse_args(argv)
+    # Feed server settings start_feed_server expects
+    options.latency, options.jitter, options.p429, options.ptimeout, options.hang = 0, 0, 0.0, 0.0, 30
+    options.seed = "ytrss"
+    return options
+
+
+def main():
+    options = parse_args()
+    failures = []
+
+    with tempfile.TemporaryDirectory(prefix="ytrss-startup-") as home:
+        modules, dependencies = import_times(home)
+        eager = [name for name in LAZY_MODULES if name in modules]
+        if eager:
+            failures.append(f"imported at start-up: {', '.join(eager)}")
+        slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:10]
+
+        warm_snapshot(home, options.channels, options)
+        first_paint(home)  # Warms the OS file cache and writes bytecode
+        # Interleaved, so a busy moment on the machine slows both alike
+        paints, floors = [], []
+        for _ in range(options.runs):
+            paints.append(first_paint(home))
+            floors.append(dependency_start(home, dependencies))
+        baseline_ms = statistics.median(floors) * 1000
+
+    median_ms = statistics.median(paints) * 1000
+    own_ms = median_ms - baseline_ms
+    budget_ms = options.budget_ms if options.budget_ms is not None else baseline_ms * options.budget_ratio
+    if own_ms > budget_ms:
+        failures.append(f"first paint takes {own_ms:.0f} ms after the dependency floor, "
+                        f"over the {budget_ms:.0f} ms budget")
+
+    result = {
+        "import_ytrss_ms": round(modules["ytrss"][1] / 1000, 1),
+        "slowest_imports_ms": {name: round(self_us / 1000, 2) for name, (self_us, _) in slowest},
+        "eager_lazy_modules": eager,
+        "first_paint_ms": {"median": round(median_ms, 1), "min": round(min(paints) * 1000, 1),
+                           "max": round(max(paints) * 1000, 1), "runs": len(paints)},
+        "dependencies": dependencies,
+        "dependency_floor_ms": round(baseline_ms, 1),
+        "ytrss_start_ms": round(own_ms, 1),
+        "budget_ms": round(budget_ms, 1),
+        "ok": not failures,
+    }
+    if options.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"import ytrss: {result['import_ytrss_ms']} ms")
+        for name, ms in result["slowest_imports_ms"].items():
+            print(f"  {name:<40} {ms:>7.2f} ms")
+        paint = result["first_paint_ms"]
+        print(f"first paint: median {paint['median']} ms (min {paint['min']}, max {paint['max']})")
+        print(f"  of which interpreter start-up and imports {result['dependency_floor_ms']} ms, "
+              f"ytrss {result['ytrss_start_ms']} ms (budget {result['budget_ms']:.0f} ms)")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
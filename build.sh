@@ -8,7 +8,17 @@ RED='\033[0;31m'
 YELLOW='\033[1;33m'
 NC='\033[0m' # No Color
 
-echo -e "${BLUE}=== Building YT-RSS Discovery ===${NC}"
+# Build mode: --onefile (default) packs everything into one executable that
+# unpacks itself to a temp dir on every launch; --onedir skips that unpack
+# step and starts noticeably faster, at the cost of shipping a directory.
+BUILD_MODE="onefile"
+case "${1:-}" in
+    ""|--onefile) BUILD_MODE="onefile" ;;
+    --onedir) BUILD_MODE="onedir" ;;
+    *) echo "Usage: $0 [--onefile|--onedir]"; exit 1 ;;
+esac
+
+echo -e "${BLUE}=== Building YT-RSS Discovery (${BUILD_MODE}) ===${NC}"
 
 # Function to show installation help
 show_install_help() {
@@ -55,13 +65,16 @@ if ! command -v pip &> /dev/null; then
 fi
 
 pip install --upgrade pip > /dev/null
-pip install feedparser aiohttp simple-term-menu pyinstaller
+pip install feedparser aiohttp simple-term-menu==1.6.6 pyinstaller
 
 # 6. Build binary with PyInstaller
 
 echo -e "${BLUE}> Building binary with PyInstaller...${NC}"
 
-pyinstaller --clean --onefile --name ytrss --add-data "KEYS.md:." --log-level ERROR ytrss.py
+# Modules ytrss never uses, so they don't have to be collected or unpacked
+EXCLUDES="--exclude-module tkinter --exclude-module unittest --exclude-module pydoc --exclude-module lib2to3"
+
+pyinstaller --clean --${BUILD_MODE} --name ytrss --add-data "KEYS.md:." $EXCLUDES --log-level ERROR ytrss.py
 
 
 
@@ -81,14 +94,28 @@ rm -f ytrss.spec
 
 echo -e "${GREEN}=== Build complete! ===${NC}"
 
-echo -e "Your executable is here: ${GREEN}./dist/ytrss${NC}"
+if [ "$BUILD_MODE" = "onedir" ]; then
+
+    echo -e "Your program is here: ${GREEN}./dist/ytrss/ytrss${NC}"
+
+    echo ""
+
+    echo "Keep the directory together and link the executable into your bin directory:"
+
+    echo "  cp -r dist/ytrss ~/.local/lib/ytrss && ln -sf ~/.local/lib/ytrss/ytrss ~/bin/ytrss"
+
+else
+
+    echo -e "Your executable is here: ${GREEN}./dist/ytrss${NC}"
+
+    echo ""
 
-echo ""
+    echo "You can install it to your bin directory with:"
 
-echo "You can install it to your bin directory with:"
+    echo "  cp dist/ytrss ~/bin/"
 
-echo "  cp dist/ytrss ~/bin/"
+    echo "Or system-wide:"
 
-echo "Or system-wide:"
+    echo "  sudo cp dist/ytrss /usr/local/bin/"
 
-echo "  sudo cp dist/ytrss /usr/local/bin/"
\ No newline at end of file
+fi
\ No newline at end of file
@@ -1,16 +1,32 @@
-import feedparser
+# feedparser, aiohttp, webbrowser and multiprocessing are imported where
+# they're first used; together they cost ~300 ms before the first screen
 import subprocess
 import sys
 import os
 import shutil
 import sqlite3
 import asyncio
-import aiohttp
-import webbrowser
 import unicodedata
 import json
+import re
+import argparse
+import base64
+import functools
+import heapq
+import hashlib
+import io
+import random
+import time
+import threading
+import select
+import signal
+import importlib.util
+import itertools
+import operator
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import simple_term_menu
 from simple_term_menu import TerminalMenu
 
 # Configuration
@@ -19,13 +35,199 @@ CONFIG_DIR = os.path.expanduser("~/.config/ytrss")
 OPML_FILE = os.path.join(CONFIG_DIR, "ytRss.opml")
 DB_FILE = os.path.join(CONFIG_DIR, "ytrss.db")
 CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
+FEED_CACHE_DIR = os.path.join(CONFIG_DIR, "feed_cache")
+FEED_CACHE_VERSION = 3
+# ALL VIDEOS and every playlist as Atom and M3U files, for other readers and
+# players. Kept up to date (newest OUTPUT_ENTRIES each) while the folder exists.
+OUTPUT_DIR = os.path.join(CONFIG_DIR, "output")
+OUTPUT_ENTRIES = 500
+PARSE_POOL_MIN_FEEDS = 8  # Below this, parsing inline beats process start-up
+
+# HTTP client limits. A refresh never has more than FETCH_CONCURRENCY feeds in
+# flight and no single feed may take longer than FETCH_DEADLINE (retries included).
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_CONNECTIONS_PER_HOST = 16
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 15
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_DNS_CACHE_TTL = 300
+FETCH_CONCURRENCY = 32
+FETCH_RETRIES = 3
+FETCH_BACKOFF_BASE = 0.5
+FETCH_MAX_RETRY_AFTER = 10
+FETCH_DEADLINE = 45
+
+# `ytrss import` verifies feeds and looks up channel pages IMPORT_CONCURRENCY
+# at a time, starting at most IMPORT_RATE requests per second.
+IMPORT_CONCURRENCY = 16
+IMPORT_RATE = 50
+YOUTUBE_URL = "https://www.youtube.com"
+# Skips the cookie consent page EU visitors are redirected to from youtube.com
+YOUTUBE_CONSENT_COOKIES = {"SOCS": "CAI"}
+
+# Adaptive polling. A scheduled refresh only fetches feeds that are due. After a
+# successful fetch a feed is due again after POLL_INTERVAL_FRACTION of its
+# typical gap between uploads, kept within [POLL_MIN_INTERVAL, POLL_MAX_INTERVAL].
+# A feed that fails is retried after POLL_RETRY_BASE seconds, doubling per
+# failure up to POLL_RETRY_MAX. Due times are pulled forward by up to
+# POLL_JITTER so feeds with the same cadence don't all fall due together.
+POLL_INTERVAL_FRACTION = 0.25
+POLL_MIN_INTERVAL = 15 * 60
+POLL_MAX_INTERVAL = 24 * 3600
+POLL_RETRY_BASE = 10 * 60
+POLL_RETRY_MAX = 3 * 24 * 3600
+POLL_JITTER = 0.1
+
+# WebSub push (ytrss push). Each YouTube feed is subscribed at WEBSUB_HUB, which
+# then POSTs new uploads to the receiver's callback. Leases are asked for
+# WEBSUB_LEASE seconds (the hub may grant less) and renewed once less than
+# WEBSUB_RENEW_BEFORE is left. Subscriptions are checked every
+# WEBSUB_CHECK_INTERVAL; one the hub hasn't confirmed within
+# WEBSUB_VERIFY_TIMEOUT is requested again. Feeds with a live subscription are
+# only polled every POLL_MAX_INTERVAL, in case a notification got lost.
+WEBSUB_HUB = "https://pubsubhubbub.appspot.com/subscribe"
+WEBSUB_LEASE = 10 * 24 * 3600
+WEBSUB_RENEW_BEFORE = 24 * 3600
+WEBSUB_CHECK_INTERVAL = 15 * 60
+WEBSUB_VERIFY_TIMEOUT = 10 * 60
+WEBSUB_CONCURRENCY = 16
+WEBSUB_RATE = 20
+WEBSUB_MAX_BODY = 1 << 20
+WEBSUB_PORT = 8765
+
+# ytrss serve: one daemon fetches, parses and resolves durations for everyone
+# and answers a JSON API on SERVE_PORT. The due feeds are refreshed every
+# SERVE_REFRESH_INTERVAL. Answers are kept in memory (the SERVE_CACHE_ENTRIES
+# most recent ones) until the data behind them changes, and carry ETags.
+# Each user of the API has their own seen state. With --server the menu
+# becomes a client of such a daemon; a refresh it asks for may take up to
+# SERVE_REFRESH_TIMEOUT, any other request SERVE_REQUEST_TIMEOUT.
+SERVE_PORT = 8766
+SERVE_REFRESH_INTERVAL = 5 * 60
+SERVE_CACHE_ENTRIES = 512
+SERVE_PAGE_LIMIT = 500
+SERVE_USER_RE = re.compile(r'[A-Za-z0-9_.@-]{1,64}')
+SERVE_REQUEST_TIMEOUT = 30
+SERVE_REFRESH_TIMEOUT = 10 * 60
+
+# Queued DB writes are flushed in one transaction after DB_FLUSH_DELAY seconds,
+# or straight away once DB_FLUSH_BATCH of them have piled up.
+DB_FLUSH_DELAY = 0.5
+DB_FLUSH_BATCH = 500
+
+# yt-dlp metadata lookups: METADATA_WORKERS batches of up to METADATA_BATCH_SIZE
+# videos are resolved at once. A batch that takes longer than
+# METADATA_BATCH_TIMEOUT is abandoned.
+YTDLP_CMD = "yt-dlp"
+METADATA_WORKERS = 3
+METADATA_BATCH_SIZE = 20
+METADATA_BATCH_TIMEOUT = 120
+SHORTS_MAX_SECONDS = 60
+SHORTS_MAX_SECONDS_VERTICAL = 180
+
+# Shorts are told apart without yt-dlp where possible: #shorts in the title or
+# description, a portrait media:thumbnail, or else a HEAD request to
+# /shorts/<id>, which answers 200 for a Short and redirects to /watch for
+# anything else. A refresh probes at most SHORTS_PROBE_LIMIT new videos,
+# newest first, SHORTS_PROBE_CONCURRENCY at a time.
+SHORTS_PROBE_CONCURRENCY = 16
+SHORTS_PROBE_LIMIT = 500
+
+# Background metadata prefetch. Failed lookups are retried after
+# METADATA_RETRY_BASE seconds, doubling per failure up to METADATA_RETRY_MAX.
+# A ytrss serve client waits at most METADATA_MENU_WAIT seconds for durations
+# it asks for; open menus pick up new ones every MENU_LIVE_INTERVAL seconds.
+METADATA_RETRY_BASE = 15 * 60
+METADATA_RETRY_MAX = 7 * 24 * 3600
+METADATA_IDLE_POLL = 300
+METADATA_MENU_WAIT = 5
+MENU_LIVE_INTERVAL = 0.5
+MENU_CLOSE_TIMEOUT = 2  # Seconds show_menu waits for an interrupted menu to restore the terminal
+FIRST_RESULTS_POLL = 0.02  # How often a first run checks whether any feed has arrived yet
+PRIORITY_BACKGROUND = 0
+PRIORITY_VISIBLE = 10
+
+# Newest videos per channel kept in memory and loaded from the DB at start-up
+SNAPSHOT_CHANNEL_LIMIT = 50
+
+# Playlist rows loaded per page; "[Load more]" fetches the next page
+PLAYLIST_PAGE_SIZE = 200
+
+# Rows of the "ALL VIDEOS" mix built per page; it is merged lazily from the
+# per-channel lists, which are already newest-first
+ALL_VIDEOS_PAGE_SIZE = 100
+
+# Seen lookups only ask about the IDs at hand, SEEN_QUERY_CHUNK per query.
+# With at least SEEN_PREFILTER_MIN_ROWS seen videos a bitmap of
+# SEEN_PREFILTER_BITS bits is kept in memory, so IDs that were never seen
+# (most new videos) skip the DB entirely. Every refresh adds what other
+# processes (cron mark-seen, serve) marked since the last one, looking back
+# SEEN_PREFILTER_SYNC_SLACK seconds further for writes that were queued
+# before they were flushed. `ytrss compact` forgets seen videos older than
+# COMPACT_KEEP_DAYS that are no longer stored.
+SEEN_QUERY_CHUNK = 500
+SEEN_PREFILTER_BITS = 1 << 23
+SEEN_PREFILTER_MIN_ROWS = 100_000
+SEEN_PREFILTER_SYNC_SLACK = 300
+COMPACT_KEEP_DAYS = 365
+
+# Full-text search over every stored video. Descriptions are stored (and
+# indexed) up to SEARCH_DESCRIPTION_CHARS; title matches weigh the most.
+SEARCH_DESCRIPTION_CHARS = 1000
+SEARCH_PAGE_SIZE = 100
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0)  # bm25 weights of title, channel, description
 USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36"
 
-# Create config directory if it doesn't exist
+# Create config directories if they don't exist
 os.makedirs(CONFIG_DIR, exist_ok=True)
+os.makedirs(FEED_CACHE_DIR, exist_ok=True)
 
 # Global state
-duration_cache = {}
+metadata_cache = {}  # video_id -> {'duration', 'seconds', 'is_live', 'is_shorts'}
+shorts_checks = {}  # video_id -> is_shorts from /shorts/ probes, until merge_feeds stores it
+_parse_pool = None
+_parse_pool_workers = 0  # Worker processes _parse_pool was created with
+_http_session = None
+feed_status = {}  # url -> "updated" / "unchanged" / "failed: <reason>" / "not due" / "backing off: <reason>"
+feed_schedule = {}  # url -> (next_due, interval, failures, last_error)
+refreshed_feeds = {}  # url -> (channel, entries) a streaming refresh resolved, until the menu takes them
+refresh_pending = 0  # Feeds the streaming refresh is still waiting for
+websub_subscriptions = {}  # url -> {'callback', 'secret', 'expires', 'requested'}
+websub_callbacks = {}  # callback key (the last part of the callback URL) -> url
+_db_conn = None
+_db_executor = None
+_db_pending = []  # Write-behind queue of (sql, params)
+_db_flush_handle = None
+_db_flush_task = None  # Background flush started by db_write, kept so it can't be collected
+_metadata_executor = None
+_metadata_local = threading.local()  # Holds each worker thread's YoutubeDL instance
+_metadata_inflight = {}  # video_id -> Future, shared by concurrent lookups
+_metadata_sem = None
+metadata_failures = {}  # video_id -> (attempts, next_attempt) for negative caching
+_metadata_prefetch_task = None
+_metadata_jobs_event = None
+unread_by_channel = {}  # channel name -> unread count, kept in step by mark_video_seen
+unread_total = 0
+video_index = {}  # video_id -> feed Video, so playlist rows can update feed rows
+video_group = {}  # video_id -> the channel list (key of unread_by_channel) its feed Video is in
+watch_later_id = None
+seen_prefilter = None  # bytearray bitmap over encoded seen IDs, or None when not worth it
+seen_prefilter_synced = 0  # When seen_prefilter last read the seen table
+server_generation = 0  # ytrss serve: bumped whenever feeds or playlists change
+server_seen_generation = {}  # ytrss serve: user -> bumped whenever their seen state changes
+_serve_cache = {}  # ytrss serve: (user, path and query) -> (version, etag, body), oldest first
+server_url = None  # Set by --server: the menu then works against a ytrss serve daemon
+server_user = None
+server_token = None
+server_feeds = {}  # --server: url -> feed from the last snapshot
+_server_etags = {}  # --server: path -> (etag, data) of the last answer
+_server_pending_seen = []  # --server: IDs marked seen but not sent yet
+_server_flush_handle = None
+_trace_events = None  # Chrome trace events while tracing is enabled, else None
+_trace_totals = {}  # span name -> [calls, total ns, max ns]
+_trace_lock = threading.Lock()
+_trace_next_id = 0
+menu_notice = ""  # Shown on the next menu drawn, see notify()
 SHOW_SHORTS = True  # Default: Show shorts
 
 def load_config():
@@ -73,47 +275,217 @@ def show_archive_warning():
         config["show_archive_warning"] = False
         save_config(config)
         print("Settings saved. Warning disabled.")
-        asyncio.sleep(1)
 
-def clean_title(text):
-    """Removes emojis and other characters that cause terminal rendering glitches."""
-    if not text: return ""
-    
-    # 1. Normalize characters
-    text = unicodedata.normalize('NFKC', text)
-    
-    # 2. Keep only BMP characters (basic multilingual plane) 
-    # and filter out specific emoji/symbol categories
-    cleaned = []
-    for char in text:
-        if ord(char) > 0xFFFF: # Skip most emojis (non-BMP)
-            continue
-        
-        category = unicodedata.category(char)
+class _CleanTitleTable(dict):
+    """str.translate table for clean_title, filled in one character at a time."""
+    def __missing__(self, code):
+        char = chr(code)
+        if code > 0xFFFF: # Skip most emojis (non-BMP)
+            replacement = None
         # Skip symbols, marks, and other potentially problematic categories
         # So, Cf (Format), Cs (Surrogate), Co (Private), Cn (Unassigned)
         # And also symbols: So (Other symbol), Sm (Math), Sc (Currency), Sk (Modifier)
-        if category.startswith(('C', 'S')):
-            if char in "$-+/%": # Allow common useful symbols
-                cleaned.append(char)
-            else:
-                cleaned.append(" ")
+        elif unicodedata.category(char).startswith(('C', 'S')) and char not in "$-+/%":
+            replacement = " "
         else:
-            cleaned.append(char)
-            
-    text = "".join(cleaned)
-    
-    # 3. Final cleanup of whitespace
-    text = " ".join(text.split())
-    return text
+            replacement = code
+        self[code] = replacement
+        return replacement
+
+_CLEAN_TITLE_TABLE = _CleanTitleTable()
+
+def clean_title(text):
+    """Removes emojis and other characters that cause terminal rendering glitches."""
+    if not text: return ""
+
+    # NFKC is a no-op on ASCII, so most titles skip it
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    # Characters are classified once per process, not once per title
+    return " ".join(text.translate(_CLEAN_TITLE_TABLE).split())
+
+SQL_MARK_SEEN = "INSERT OR IGNORE INTO seen (vid, seen_ts) VALUES (?, ?)"
+SQL_MARK_USER_SEEN = "INSERT OR IGNORE INTO user_seen (user, vid, seen_ts) VALUES (?, ?, ?)"
+SQL_MARK_OTHER_SEEN = "INSERT OR IGNORE INTO seen_other (user, video_id, seen_ts) VALUES (?, ?, ?)"
+SQL_SAVE_METADATA = '''INSERT OR REPLACE INTO video_metadata
+                        (video_id, duration, duration_seconds, is_live, is_shorts)
+                        VALUES (?, ?, ?, ?, ?)'''
+SQL_INSERT_VIDEO = '''INSERT INTO videos (video_id, title, channel, url, is_shorts, published_date, published_ts, feed_url,
+                                         description)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(video_id) DO UPDATE SET feed_url = excluded.feed_url,
+                           published_ts = excluded.published_ts
+                       WHERE videos.feed_url IS NULL'''
+SQL_SET_SHORTS = "UPDATE videos SET is_shorts = ? WHERE video_id = ? AND is_shorts IS NULL"
+SQL_ENQUEUE_METADATA_JOB = "INSERT OR IGNORE INTO metadata_jobs (video_id, url, priority) VALUES (?, ?, ?)"
+SQL_PRIORITIZE_METADATA_JOB = '''INSERT INTO metadata_jobs (video_id, url, priority) VALUES (?, ?, ?)
+                                  ON CONFLICT(video_id) DO UPDATE SET priority = excluded.priority'''
+SQL_SCHEDULE_FEED = '''INSERT OR REPLACE INTO feed_schedule (feed_url, next_due, interval, failures, last_error)
+                       VALUES (?, ?, ?, ?, ?)'''
+SQL_SAVE_WEBSUB = '''INSERT OR REPLACE INTO websub_subscriptions (feed_url, callback, secret, expires)
+                     VALUES (?, ?, ?, ?)'''
+SQL_DELETE_WEBSUB = "DELETE FROM websub_subscriptions WHERE feed_url = ?"
+SQL_METADATA_JOB_DONE = "DELETE FROM metadata_jobs WHERE video_id = ?"
+SQL_METADATA_JOB_FAILED = '''INSERT INTO metadata_jobs (video_id, url, attempts, next_attempt, last_error)
+                              VALUES (?, ?, ?, ?, ?)
+                              ON CONFLICT(video_id) DO UPDATE SET attempts = excluded.attempts,
+                                  next_attempt = excluded.next_attempt, last_error = excluded.last_error'''
 
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
+# Real YouTube IDs are 11 base64url characters carrying 64 bits; the last
+# character only uses its top 4 bits, so it is one of these 16
+VIDEO_ID_RE = re.compile(r'[A-Za-z0-9_-]{10}[AEIMQUYcgkosw048]')
+
+def encode_video_id(video_id):
+    """Packs a YouTube ID (with or without 'yt:video:') into a signed 64-bit int.
+
+    Returns None for anything that isn't a real YouTube ID.
+    """
+    if video_id is None:
+        return None
+    if video_id.startswith("yt:video:"):
+        video_id = video_id[9:]
+    if not VIDEO_ID_RE.fullmatch(video_id):
+        return None
+    return int.from_bytes(base64.urlsafe_b64decode(video_id + "="), "big", signed=True)
+
+def get_db_conn():
+    """Returns the persistent connection. Only ever called on the DB thread."""
+    global _db_conn
+    if _db_conn is None:
+        _db_conn = sqlite3.connect(DB_FILE, cached_statements=256)
+        # Lets queries join text video IDs against the integer seen table
+        _db_conn.create_function("yt_id", 1, encode_video_id, deterministic=True)
+        _db_conn.execute("PRAGMA journal_mode=WAL")
+        _db_conn.execute("PRAGMA synchronous=NORMAL")
+        _db_conn.execute("PRAGMA temp_store=MEMORY")
+        _db_conn.execute("PRAGMA cache_size=-16000")
+        _db_conn.execute("PRAGMA busy_timeout=5000")
+    return _db_conn
+
+def apply_writes(conn, writes):
+    """Applies queued writes in one transaction, batching runs of the same statement."""
+    try:
+        with conn:
+            i = 0
+            while i < len(writes):
+                sql = writes[i][0]
+                j = i
+                while j < len(writes) and writes[j][0] == sql:
+                    j += 1
+                conn.executemany(sql, [params for _, params in writes[i:j]])
+                i = j
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+
+def run_db_job(writes, fn, args):
+    conn = get_db_conn()
+    if writes:
+        apply_writes(conn, writes)
+    if fn is not None:
+        return fn(conn, *args)
+
+def take_pending_writes():
+    global _db_pending, _db_flush_handle
+    if _db_flush_handle is not None:
+        _db_flush_handle.cancel()
+        _db_flush_handle = None
+    writes, _db_pending = _db_pending, []
+    return writes
+
+async def db_call(fn, *args):
+    """Runs fn(conn, *args) on the DB thread.
+
+    Queued writes are applied first, so every read sees earlier writes.
+    """
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ytrss-db")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, run_db_job, take_pending_writes(), fn, args)
+
+async def db_flush():
+    # Also takes the writes queued while an earlier round was running
+    while _db_pending:
+        await db_call(None)
+
+def start_db_flush():
+    """Flushes in the background, reusing the flush task if one is still running."""
+    global _db_flush_task
+    if _db_flush_task is None or _db_flush_task.done():
+        _db_flush_task = asyncio.get_running_loop().create_task(db_flush())
+
+def db_write(sql, params):
+    """Queues a write for the next batched flush."""
+    global _db_flush_handle
+    _db_pending.append((sql, params))
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # Flushed by the next db_call or close_db
+    if len(_db_pending) >= DB_FLUSH_BATCH:
+        start_db_flush()
+    elif _db_flush_handle is None:
+        _db_flush_handle = loop.call_later(DB_FLUSH_DELAY, start_db_flush)
+
+async def close_db():
+    """Flushes pending writes and closes the connection."""
+    global _db_executor
+    if _db_executor is None:
+        return
+    await db_call(close_db_conn)
+    _db_executor.shutdown()
+    _db_executor = None
+
+def close_db_conn(conn):
+    global _db_conn
+    conn.close()
+    _db_conn = None
+
+def _migrate_seen_videos(c, youtube=True, other=True):
+    """Copies the old text-keyed seen_videos table into seen and seen_other. `compact` drops the old table."""
+    rows = []
+    other_rows = []
+    for video_id, seen_date in c.execute("SELECT video_id, seen_date FROM seen_videos"):
+        try:
+            seen_ts = int(datetime.fromisoformat(seen_date).timestamp())
+        except (TypeError, ValueError):
+            seen_ts = int(time.time())
+        vid = encode_video_id(video_id)
+        if vid is not None:
+            rows.append((vid, seen_ts))
+        elif video_id:
+            other_rows.append(("", video_id, seen_ts))
+    if youtube:
+        c.executemany(SQL_MARK_SEEN, rows)
+    if other:
+        c.executemany(SQL_MARK_OTHER_SEEN, other_rows)
+
+def _init_db(conn):
     c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS seen_videos
-                 (video_id TEXT PRIMARY KEY, title TEXT, seen_date TEXT)''')
+    # Seen videos, keyed by the YouTube ID packed into an integer (see encode_video_id)
+    tables = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    c.execute('''CREATE TABLE IF NOT EXISTS seen
+                 (vid INTEGER PRIMARY KEY, seen_ts INTEGER NOT NULL)''')
+    # Lets the seen prefilter pick up what other processes marked since it was built
+    c.execute("CREATE INDEX IF NOT EXISTS idx_seen_ts ON seen (seen_ts)")
+    # Seen state of the named users of ytrss serve; seen stays the local user's
+    c.execute('''CREATE TABLE IF NOT EXISTS user_seen
+                 (user TEXT NOT NULL, vid INTEGER NOT NULL, seen_ts INTEGER NOT NULL,
+                  PRIMARY KEY (user, vid)) WITHOUT ROWID''')
+    # Seen IDs that aren't YouTube IDs (entries of other feeds), kept as text;
+    # user is '' for the local user
+    c.execute('''CREATE TABLE IF NOT EXISTS seen_other
+                 (user TEXT NOT NULL, video_id TEXT NOT NULL, seen_ts INTEGER NOT NULL,
+                  PRIMARY KEY (user, video_id)) WITHOUT ROWID''')
+    if "seen_videos" in tables and ("seen" not in tables or "seen_other" not in tables):
+        _migrate_seen_videos(c, youtube="seen" not in tables, other="seen_other" not in tables)
     c.execute('''CREATE TABLE IF NOT EXISTS video_metadata
                  (video_id TEXT PRIMARY KEY, duration TEXT)''')
+    # Structured metadata columns, added to databases from older versions
+    metadata_columns = {row[1] for row in c.execute("PRAGMA table_info(video_metadata)")}
+    for column, column_type in (("duration_seconds", "INTEGER"), ("is_live", "BOOLEAN"), ("is_shorts", "BOOLEAN")):
+        if column not in metadata_columns:
+            c.execute(f"ALTER TABLE video_metadata ADD COLUMN {column} {column_type}")
     
     # New tables for playlists
     c.execute('''CREATE TABLE IF NOT EXISTS playlists (
@@ -132,6 +504,36 @@ def init_db():
                     published_date TEXT,
                     first_seen TEXT DEFAULT CURRENT_TIMESTAMP
                  )''')
+    # Feed snapshot columns, added to databases from older versions
+    video_columns = {row[1] for row in c.execute("PRAGMA table_info(videos)")}
+    for column, column_type in (("published_ts", "INTEGER"), ("feed_url", "TEXT"), ("description", "TEXT")):
+        if column not in video_columns:
+            c.execute(f"ALTER TABLE videos ADD COLUMN {column} {column_type}")
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_videos_feed
+                 ON videos (feed_url, published_ts DESC)''')
+
+    # Full-text index over the videos table. It reads the text from videos
+    # (external content), so nothing is stored twice; triggers keep it in step.
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS video_search USING fts5(
+                    title, channel, description, content='videos', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2')''')
+    if "video_search" not in tables:
+        c.execute("INSERT INTO video_search (video_search) VALUES ('rebuild')")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS videos_search_insert AFTER INSERT ON videos BEGIN
+                     INSERT INTO video_search (rowid, title, channel, description)
+                     VALUES (NEW.rowid, NEW.title, NEW.channel, NEW.description);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS videos_search_delete AFTER DELETE ON videos BEGIN
+                     INSERT INTO video_search (video_search, rowid, title, channel, description)
+                     VALUES ('delete', OLD.rowid, OLD.title, OLD.channel, OLD.description);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS videos_search_update
+                 AFTER UPDATE OF title, channel, description ON videos BEGIN
+                     INSERT INTO video_search (video_search, rowid, title, channel, description)
+                     VALUES ('delete', OLD.rowid, OLD.title, OLD.channel, OLD.description);
+                     INSERT INTO video_search (rowid, title, channel, description)
+                     VALUES (NEW.rowid, NEW.title, NEW.channel, NEW.description);
+                 END''')
     c.execute('''CREATE TABLE IF NOT EXISTS playlist_items (
                     playlist_id INTEGER NOT NULL,
                     video_id TEXT NOT NULL,
@@ -140,182 +542,977 @@ def init_db():
                     FOREIGN KEY (video_id) REFERENCES videos(video_id) ON DELETE CASCADE,
                     PRIMARY KEY (playlist_id, video_id)
                  )''')
+    # Item counts are kept by triggers so drawing the menu never counts rows
+    playlist_columns = {row[1] for row in c.execute("PRAGMA table_info(playlists)")}
+    if "item_count" not in playlist_columns:
+        c.execute("ALTER TABLE playlists ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0")
+        c.execute('''UPDATE playlists SET item_count =
+                     (SELECT COUNT(*) FROM playlist_items WHERE playlist_id = playlists.id)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS playlist_items_added AFTER INSERT ON playlist_items
+                 BEGIN UPDATE playlists SET item_count = item_count + 1 WHERE id = NEW.playlist_id; END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS playlist_items_removed AFTER DELETE ON playlist_items
+                 BEGIN UPDATE playlists SET item_count = item_count - 1 WHERE id = OLD.playlist_id; END''')
+    # Covers the newest-first page query, which then never touches the table
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_playlist_items_added
+                 ON playlist_items (playlist_id, added_at DESC, video_id DESC)''')
+
+    # Background metadata lookups, with failures kept for backoff
+    c.execute('''CREATE TABLE IF NOT EXISTS metadata_jobs (
+                    video_id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                 )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_metadata_jobs_due
+                 ON metadata_jobs (next_attempt, priority)''')
+
+    # When each feed should be polled next (see schedule_feeds)
+    c.execute('''CREATE TABLE IF NOT EXISTS feed_schedule (
+                    feed_url TEXT PRIMARY KEY,
+                    next_due INTEGER NOT NULL,
+                    interval INTEGER NOT NULL,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                 )''')
+
+    # WebSub subscriptions of ytrss push; expires is 0 until the hub confirms
+    c.execute('''CREATE TABLE IF NOT EXISTS websub_subscriptions (
+                    feed_url TEXT PRIMARY KEY,
+                    callback TEXT NOT NULL,
+                    secret TEXT NOT NULL,
+                    expires INTEGER NOT NULL DEFAULT 0
+                 )''')
     
     # Ensure "Watch Later" exists
     c.execute("INSERT OR IGNORE INTO playlists (name, is_system_list) VALUES (?, ?)", ("Watch Later", 1))
     
     conn.commit()
-    conn.close()
 
-def mark_as_seen(video_id, title):
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO seen_videos (video_id, title, seen_date) VALUES (?, ?, ?)",
-                  (video_id, title, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Database error: {e}")
+async def init_db():
+    await db_call(_init_db)
+
+def prefilter_add(vid):
+    if seen_prefilter is not None:
+        bit = vid & (SEEN_PREFILTER_BITS - 1)
+        seen_prefilter[bit >> 3] |= 1 << (bit & 7)
+
+def prefilter_may_contain(vid):
+    if seen_prefilter is None:
+        return True
+    bit = vid & (SEEN_PREFILTER_BITS - 1)
+    return bool(seen_prefilter[bit >> 3] & (1 << (bit & 7)))
+
+def _build_seen_prefilter(conn):
+    if conn.execute("SELECT count(*) FROM seen").fetchone()[0] < SEEN_PREFILTER_MIN_ROWS:
+        return None
+    bitmap = bytearray(SEEN_PREFILTER_BITS // 8)
+    mask = SEEN_PREFILTER_BITS - 1
+    for (vid,) in conn.execute("SELECT vid FROM seen"):
+        bit = vid & mask
+        bitmap[bit >> 3] |= 1 << (bit & 7)
+    return bitmap
+
+async def init_seen_prefilter():
+    global seen_prefilter, seen_prefilter_synced
+    seen_prefilter_synced = int(time.time())
+    seen_prefilter = await db_call(_build_seen_prefilter)
+
+def _get_seen_since(conn, since):
+    return [row[0] for row in conn.execute("SELECT vid FROM seen WHERE seen_ts >= ?", (since,))]
+
+async def sync_seen_prefilter():
+    """Adds the IDs marked seen since the last sync, e.g. by `ytrss mark-seen` or serve, to the prefilter."""
+    global seen_prefilter_synced
+    if seen_prefilter is None:
+        return
+    since = seen_prefilter_synced - SEEN_PREFILTER_SYNC_SLACK
+    seen_prefilter_synced = int(time.time())
+    for vid in await db_call(_get_seen_since, since):
+        prefilter_add(vid)
+
+def seen_table(user=None):
+    """The seen table of a ytrss serve user (None for the local one), for use in SQL."""
+    if user is None:
+        return "seen"
+    if not SERVE_USER_RE.fullmatch(user):
+        raise ValueError(f"Not a valid user name: {user}")
+    return f"(SELECT vid FROM user_seen WHERE user = '{user}')"
+
+def seen_sql(column, user=None):
+    """An SQL expression that is true if the video ID in column is seen (by a ytrss serve user if given)."""
+    table = seen_table(user)
+    return (f"CASE WHEN yt_id({column}) IS NULL "
+            f"THEN EXISTS (SELECT 1 FROM seen_other o WHERE o.user = '{user or ''}' AND o.video_id = {column}) "
+            f"ELSE EXISTS (SELECT 1 FROM {table} s WHERE s.vid = yt_id({column})) END")
+
+def mark_ids_as_seen(video_ids, user=None):
+    """Marks video IDs as seen (for a ytrss serve user if given). Returns how many were marked."""
+    now = int(time.time())
+    count = 0
+    for video_id in video_ids:
+        if not video_id:
+            continue
+        vid = encode_video_id(video_id)
+        if vid is None:
+            db_write(SQL_MARK_OTHER_SEEN, (user or "", video_id, now))
+        elif user is None:
+            prefilter_add(vid)
+            db_write(SQL_MARK_SEEN, (vid, now))
+        else:
+            db_write(SQL_MARK_USER_SEEN, (user, vid, now))
+        count += 1
+    return count
+
+def mark_as_seen(video_id):
+    mark_ids_as_seen((video_id,))
 
 def mark_all_as_seen(videos):
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        now = datetime.now().isoformat()
-        # Create a list of tuples for executemany
-        data = [(v['id'], v['title'], now) for v in videos]
-        c.executemany("INSERT OR IGNORE INTO seen_videos (video_id, title, seen_date) VALUES (?, ?, ?)", data)
-        conn.commit()
-        conn.close()
-        print(f"Marked {len(videos)} videos as seen.")
-    except Exception as e:
-        print(f"Database error: {e}")
+    mark_ids_as_seen(v.id for v in videos)
+    notify(f"Marked {len(videos)} videos as seen.")
 
-def get_seen_videos():
+def _get_seen_among(conn, vids, other_ids, user=None):
     seen = set()
-    if not os.path.exists(DB_FILE):
-        return seen
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT video_id FROM seen_videos")
-        for row in c.fetchall():
-            seen.add(row[0])
-        conn.close()
-    except:
-        pass
+    table = seen_table(user)
+    for i in range(0, len(vids), SEEN_QUERY_CHUNK):
+        chunk = vids[i:i + SEEN_QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        seen.update(row[0] for row in conn.execute(f"SELECT vid FROM {table} WHERE vid IN ({placeholders})", chunk))
+    for i in range(0, len(other_ids), SEEN_QUERY_CHUNK):
+        chunk = other_ids[i:i + SEEN_QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        seen.update(row[0] for row in conn.execute(
+            f"SELECT video_id FROM seen_other WHERE user = ? AND video_id IN ({placeholders})", (user or "", *chunk)))
     return seen
 
-def get_cached_metadata():
+async def get_seen_among(video_ids, user=None):
+    """Returns which of the given video IDs are marked as seen, looking up only those."""
+    candidates = {}
+    other_ids = set()
+    for video_id in video_ids:
+        vid = encode_video_id(video_id)
+        if vid is None:
+            if video_id:
+                other_ids.add(video_id)
+        elif user is not None or prefilter_may_contain(vid):
+            candidates[vid] = video_id
+    if not candidates and not other_ids:
+        return set()
+    found = await db_call(_get_seen_among, list(candidates), list(other_ids), user)
+    return {candidates.get(key, key) for key in found}
+
+def _get_cached_metadata(conn):
     metadata = {}
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT video_id, duration FROM video_metadata")
-        for row in c.fetchall():
-            metadata[row[0]] = row[1]
-        conn.close()
-    except:
+        for video_id, duration, seconds, is_live, is_shorts in conn.execute(
+                "SELECT video_id, duration, duration_seconds, is_live, is_shorts FROM video_metadata"):
+            if seconds is None and duration:
+                # Row written by an older version, only the display string is known
+                seconds = parse_duration(duration)
+                is_shorts = seconds is not None and seconds <= SHORTS_MAX_SECONDS
+            metadata[video_id] = {
+                'duration': duration,
+                'seconds': seconds,
+                'is_live': bool(is_live),
+                'is_shorts': bool(is_shorts),
+            }
+    except sqlite3.Error:
         pass
     return metadata
 
-def save_metadata(video_id, duration):
+async def get_cached_metadata():
+    return await db_call(_get_cached_metadata)
+
+def save_metadata(video_id, meta):
+    db_write(SQL_SAVE_METADATA, (video_id, meta['duration'], meta['seconds'],
+                                 meta['is_live'], meta['is_shorts']))
+
+def store_videos(feed_url, videos, descriptions, unprobed=()):
+    """Queues newly seen feed entries for insertion into the videos table.
+
+    descriptions maps video IDs to the feed's description text, which is
+    only kept in the DB for search. Videos in unprobed get a NULL is_shorts,
+    so classify_shorts probes them on a later refresh.
+    """
+    for v in videos:
+        db_write(SQL_INSERT_VIDEO, (
+            v.id, v.title, v.channel, v.link, None if v.id in unprobed else v.is_shorts,
+            datetime.fromtimestamp(v.published).isoformat(), v.published, feed_url,
+            descriptions.get(v.id, "")[:SEARCH_DESCRIPTION_CHARS]))
+
+def _load_snapshot(conn, limit):
+    snapshot = {}
+    for feed_url, video_id, title, channel, url, published, is_shorts, is_seen in conn.execute(
+            f'''SELECT feed_url, video_id, title, channel, url, published_ts, is_shorts,
+                      {seen_sql("video_id")} FROM (
+                   SELECT *, ROW_NUMBER() OVER (PARTITION BY feed_url ORDER BY published_ts DESC) AS rn
+                   FROM videos WHERE feed_url IS NOT NULL AND published_ts IS NOT NULL)
+               WHERE rn <= ?
+               ORDER BY feed_url, published_ts DESC''', (limit,)):
+        snapshot.setdefault(feed_url, []).append(
+            (video_id, title, channel, url, published, bool(is_shorts), bool(is_seen)))
+    return snapshot
+
+async def load_snapshot(feeds):
+    """Loads the last-known videos of every feed from the DB.
+
+    Returns (videos_by_feed, feed_titles) in the same shape merge_feeds keeps
+    them, so the menu can be drawn before any network request finishes.
+    """
+    snapshot = await db_call(_load_snapshot, SNAPSHOT_CHANNEL_LIMIT)
+    videos_by_feed = {}
+    feed_titles = {}
+    for url in feeds:
+        rows = snapshot.get(url)
+        if not rows:
+            continue
+        feed_titles[url] = rows[0][2]
+        videos_by_feed[url] = [make_video(video_id, title, link, published, channel, is_shorts, is_seen)
+                               for video_id, title, channel, link, published, is_shorts, is_seen in rows]
+    return videos_by_feed, feed_titles
+
+def _list_videos(conn, after, limit):
+    """Returns one page of stored feed videos, newest first, starting after (published_ts, video_id)."""
+    return conn.execute(f'''SELECT v.video_id, v.title, v.channel, v.url, v.published_ts, v.feed_url,
+                                  coalesce(v.is_shorts, 0) OR coalesce(m.is_shorts, 0),
+                                  m.duration, m.duration_seconds,
+                                  {seen_sql("v.video_id")}
+                           FROM videos v
+                           LEFT JOIN video_metadata m ON m.video_id = v.video_id
+                           WHERE v.feed_url IS NOT NULL AND v.published_ts IS NOT NULL
+                             AND (v.published_ts, v.video_id) < (?, ?)
+                           ORDER BY v.published_ts DESC, v.video_id DESC
+                           LIMIT ?''', (*after, limit)).fetchall()
+
+async def iter_stored_videos(page_size=500):
+    """Yields stored feed videos newest first, one DB page at a time."""
+    after = (2 ** 63 - 1, "")
+    while True:
+        rows = await db_call(_list_videos, after, page_size)
+        for video_id, title, channel, url, published, feed_url, is_shorts, duration, seconds, is_seen in rows:
+            yield Video(video_id, title, url, published, channel, bool(is_shorts), bool(is_seen),
+                        seconds if seconds is not None else parse_duration(duration), feed_url)
+        if len(rows) < page_size:
+            return
+        after = (rows[-1][4], rows[-1][0])
+
+def enqueue_metadata_jobs(items, priority=PRIORITY_BACKGROUND):
+    """Queues (video_id, url) pairs for background metadata lookup."""
+    for video_id, url in items:
+        db_write(SQL_ENQUEUE_METADATA_JOB, (video_id, url, priority))
+    wake_metadata_prefetch()
+
+async def prioritize_metadata_jobs(items):
+    """Moves (video_id, url) pairs to the front of the queue, demoting earlier ones."""
+    def _prioritize(conn):
+        with conn:
+            conn.execute("UPDATE metadata_jobs SET priority = ? WHERE priority > ?",
+                         (PRIORITY_BACKGROUND, PRIORITY_BACKGROUND))
+            conn.executemany(SQL_PRIORITIZE_METADATA_JOB,
+                             [(video_id, url, PRIORITY_VISIBLE) for video_id, url in items])
+    await db_call(_prioritize)
+    wake_metadata_prefetch()
+
+def _get_due_metadata_jobs(conn, now, limit):
+    return conn.execute('''SELECT video_id, url FROM metadata_jobs
+                           WHERE next_attempt <= ?
+                           ORDER BY priority DESC, next_attempt
+                           LIMIT ?''', (now, limit)).fetchall()
+
+def _get_metadata_failures(conn):
+    return {video_id: (attempts, next_attempt) for video_id, attempts, next_attempt in conn.execute(
+        "SELECT video_id, attempts, next_attempt FROM metadata_jobs WHERE attempts > 0")}
+
+async def get_metadata_failures():
+    return await db_call(_get_metadata_failures)
+
+def _get_feed_schedule(conn):
+    return {url: (next_due, interval, failures, last_error)
+            for url, next_due, interval, failures, last_error in conn.execute(
+                "SELECT feed_url, next_due, interval, failures, last_error FROM feed_schedule")}
+
+async def get_feed_schedule():
+    return await db_call(_get_feed_schedule)
+
+def _get_websub_subscriptions(conn):
+    return {url: {'callback': callback, 'secret': secret, 'expires': expires, 'requested': 0}
+            for url, callback, secret, expires in conn.execute(
+                "SELECT feed_url, callback, secret, expires FROM websub_subscriptions")}
+
+async def get_websub_subscriptions():
+    return await db_call(_get_websub_subscriptions)
+
+def _get_playlists(conn):
+    """Returns (id, name, item_count, is_system_list) rows, system lists first."""
+    return conn.execute('''SELECT id, name, item_count, is_system_list FROM playlists
+                           ORDER BY is_system_list DESC, name COLLATE NOCASE''').fetchall()
+
+async def get_playlists():
+    return await db_call(_get_playlists)
+
+def _create_playlist(conn, name):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("INSERT OR REPLACE INTO video_metadata (video_id, duration) VALUES (?, ?)",
-                  (video_id, duration))
+        cursor = conn.execute("INSERT OR IGNORE INTO playlists (name) VALUES (?)", (name,))
         conn.commit()
-        conn.close()
-    except:
-        pass
+        return cursor.rowcount > 0
+    except Exception as e:
+        conn.rollback()
+        print(f"Error creating playlist: {e}")
+        return False
+
+async def create_playlist(name):
+    created = await db_call(_create_playlist, name)
+    if created and outputs_enabled():
+        pl_id = next(pl_id for pl_id, pl_name, _, _ in await get_playlists() if pl_name == name)
+        await write_output(output_name(pl_id, name), name, [])
+    return created
+
+def _delete_playlist(conn, playlist_id):
+    """Returns how many playlists were deleted (0 for a system list or an unknown ID), or None on error."""
+    try:
+        # System lists like Watch Later can't be deleted, and neither can their items
+        deleted = conn.execute("DELETE FROM playlists WHERE id = ? AND is_system_list = 0", (playlist_id,)).rowcount
+        if deleted:
+            conn.execute("DELETE FROM playlist_items WHERE playlist_id = ?", (playlist_id,))
+        conn.commit()
+        return deleted
+    except Exception as e:
+        conn.rollback()
+        print(f"Error deleting playlist: {e}")
+        return None
+
+async def delete_playlist(playlist_id):
+    name = next((name for pl_id, name, _, is_system in await get_playlists()
+                 if pl_id == playlist_id and not is_system), None)
+    deleted = await db_call(_delete_playlist, playlist_id)
+    if deleted and name is not None and outputs_enabled():
+        for path in output_paths(output_name(playlist_id, name)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return deleted
 
-def add_to_playlist(playlist_name, video):
+def _add_to_playlist(conn, playlist_id, video):
     try:
-        conn = sqlite3.connect(DB_FILE)
         c = conn.cursor()
-        
-        # 1. Get playlist id
-        c.execute("SELECT id FROM playlists WHERE name = ?", (playlist_name,))
-        row = c.fetchone()
-        if not row: return False
-        playlist_id = row[0]
-        
-        # 2. Add video to 'videos' table if not exists
-        # Handle 'published' format (struct_time or string)
-        pub_date = ""
-        if video.get('published'):
-            if isinstance(video['published'], (list, tuple)):
-                pub_date = datetime(*video['published'][:6]).isoformat()
-            else:
-                pub_date = str(video['published'])
 
-        c.execute('''INSERT OR REPLACE INTO videos (video_id, title, channel, url, duration, is_shorts, published_date)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (video['id'], video['title'], video.get('channel'), video['link'], 
-                   video.get('duration'), video.get('is_shorts', False), pub_date))
+        # 1. Add video to 'videos' table if not exists
+        pub_date = datetime.fromtimestamp(video.published).isoformat() if video.published is not None else ""
+        duration = video.duration if video.seconds is not None else None
+
+        c.execute('''INSERT INTO videos (video_id, title, channel, url, duration, is_shorts, published_date)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT(video_id) DO UPDATE SET duration = coalesce(excluded.duration, duration),
+                         is_shorts = CASE WHEN excluded.is_shorts THEN 1 ELSE is_shorts END''',
+                  (video.id, video.title, video.channel, video.link,
+                   duration, video.is_shorts, pub_date))
         
-        # 3. Link video to playlist
-        c.execute("INSERT OR IGNORE INTO playlist_items (playlist_id, video_id) VALUES (?, ?)",
-                  (playlist_id, video['id']))
+        # 2. Link video to playlist (millisecond added_at keeps the page order stable)
+        c.execute('''INSERT OR IGNORE INTO playlist_items (playlist_id, video_id, added_at)
+                     VALUES (?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))''',
+                  (playlist_id, video.id))
         
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error adding to playlist: {e}")
         return False
 
-def get_playlist_videos(playlist_name):
+async def add_to_playlist(playlist_id, video):
+    added = await db_call(_add_to_playlist, playlist_id, video)
+    if added:
+        await update_playlist_output(playlist_id, added=[video])
+    return added
+
+SQL_PLAYLIST_PAGE = '''SELECT v.video_id, v.title, v.url, v.channel, v.duration, v.is_shorts,
+                              v.published_date, pi.added_at, {is_seen} AS is_seen
+                       FROM playlist_items pi
+                       JOIN videos v ON v.video_id = pi.video_id
+                       WHERE pi.playlist_id = ? AND (pi.added_at, pi.video_id) < (?, ?)
+                       ORDER BY pi.added_at DESC, pi.video_id DESC
+                       LIMIT ?'''
+
+def _get_playlist_videos(conn, playlist_id, after=None, limit=PLAYLIST_PAGE_SIZE, user=None):
+    """Returns one page of a playlist, newest first, with seen flags joined in.
+
+    after is the (added_at, video_id) of the last row of the previous page.
+    """
     videos = []
+    # '~' sorts after every added_at timestamp, so the first page starts at the top
+    added_at, video_id = after or ("~", "")
     try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        
-        c.execute('''SELECT v.* FROM videos v
-                     JOIN playlist_items pi ON v.video_id = pi.video_id
-                     JOIN playlists p ON pi.playlist_id = p.id
-                     WHERE p.name = ?
-                     ORDER BY pi.added_at DESC''', (playlist_name,))
-        
-        rows = c.fetchall()
-        for row in rows:
-            videos.append({
-                'id': row['video_id'],
-                'title': row['title'],
-                'link': row['url'],
-                'channel': row['channel'],
-                'duration': row['duration'],
-                'is_shorts': bool(row['is_shorts']),
-                'published': row['published_date'],
-                'is_seen': False # Will be updated in show_playlist_ui or main
-            })
-        conn.close()
+        for row in conn.execute(SQL_PLAYLIST_PAGE.format(is_seen=seen_sql("pi.video_id", user)),
+                                (playlist_id, added_at, video_id, limit)):
+            videos.append(Video(row[0], row[1], row[2], parse_published(row[6]), row[3],
+                                bool(row[5]), bool(row[8]), parse_duration(row[4]), added_at=row[7]))
     except Exception as e:
         print(f"Error getting playlist: {e}")
     return videos
 
-def remove_from_playlist(playlist_name, video_id):
+async def get_playlist_videos(playlist_id, after=None, limit=PLAYLIST_PAGE_SIZE, user=None):
+    return await db_call(_get_playlist_videos, playlist_id, after, limit, user)
+
+def playlist_pager(playlist_id):
+    """Returns a loader that yields (page, has_more) for successive playlist pages."""
+    after = None
+    async def load_page():
+        nonlocal after
+        page = await get_playlist_videos(playlist_id, after)
+        if page:
+            after = (page[-1].added_at, page[-1].id)
+        return page, len(page) == PLAYLIST_PAGE_SIZE
+    return load_page
+
+def _remove_from_playlist(conn, playlist_id, video_id):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute('''DELETE FROM playlist_items 
-                     WHERE video_id = ? AND playlist_id = (SELECT id FROM playlists WHERE name = ?)''',
-                  (video_id, playlist_name))
+        conn.execute("DELETE FROM playlist_items WHERE playlist_id = ? AND video_id = ?",
+                     (playlist_id, video_id))
         conn.commit()
-        conn.close()
         return True
     except Exception as e:
+        conn.rollback()
         print(f"Error removing from playlist: {e}")
         return False
 
-async def get_video_duration(video_url, video_id):
-    if video_id in duration_cache and duration_cache[video_id] != "??:??":
-        return duration_cache[video_id]
-    
+async def remove_from_playlist(playlist_id, video_id):
+    removed = await db_call(_remove_from_playlist, playlist_id, video_id)
+    if removed:
+        await update_playlist_output(playlist_id, removed=[video_id])
+    return removed
+
+SEARCH_FILTER_KEYS = ("channel", "since", "until", "longer", "shorter", "shorts", "seen")
+SEARCH_SYNTAX = ("Words match title, channel and description (word prefixes count). Filters: "
+                 "channel:NAME since:YYYY-MM-DD until:YYYY-MM-DD longer:MIN shorter:MIN "
+                 "shorts:show|hide|only seen:all|unseen|seen")
+
+def parse_search_date(text, end_of_day=False):
     try:
-        proc = await asyncio.create_subprocess_exec(
-            "yt-dlp", "--get-duration", video_url,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.DEVNULL
-        )
-        stdout, _ = await proc.communicate()
-        
-        if stdout:
-            duration = stdout.decode().strip()
-            if ':' in duration or duration.isdigit():
-                if duration.isdigit():
-                    duration = f"0:{duration.zfill(2)}"
-                
-                duration_cache[video_id] = duration
-                save_metadata(video_id, duration)
-                return duration
-    except Exception:
-        pass
-    
-    return "??:??"
+        day = datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Not a date (YYYY-MM-DD): {text}")
+    return int(day.timestamp()) + (86400 if end_of_day else 0)
+
+def search_filters(channel=None, since=None, until=None, longer=None, shorter=None, shorts="show", seen="all"):
+    """Validates search filters given as text and returns them in the form _search_videos takes.
+
+    Raises ValueError with a message for the user if one doesn't make sense.
+    """
+    if shorts not in ("show", "hide", "only"):
+        raise ValueError(f"shorts: must be show, hide or only, not {shorts}")
+    if seen not in ("all", "unseen", "seen"):
+        raise ValueError(f"seen: must be all, unseen or seen, not {seen}")
+    filters = {'channel': channel, 'shorts': shorts, 'seen': seen,
+               'since': parse_search_date(since) if since else None,
+               'until': parse_search_date(until, end_of_day=True) if until else None}
+    for name, minutes in (("min_seconds", longer), ("max_seconds", shorter)):
+        try:
+            filters[name] = int(float(minutes) * 60) if minutes is not None else None
+        except ValueError:
+            raise ValueError(f"Not a number of minutes: {minutes}")
+    return filters
+
+def split_search_terms(text):
+    """Splits search input into (words, {filter: text}); key:value words are filters (see SEARCH_SYNTAX)."""
+    words = []
+    options = {}
+    for term in text.split():
+        key, sep, value = term.partition(":")
+        if sep and value and key.lower() in SEARCH_FILTER_KEYS:
+            options[key.lower()] = value
+        else:
+            words.append(term)
+    return " ".join(words), options
+
+def parse_search_terms(text):
+    words, options = split_search_terms(text)
+    return words, search_filters(**options)
+
+def fts_query(text):
+    """Turns free text into an FTS5 query in which every word has to match as a prefix."""
+    return " ".join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+def _search_videos(conn, words, filters, limit=SEARCH_PAGE_SIZE, offset=0, user=None):
+    """Returns one page of stored videos matching words and filters.
+
+    With words, the best matches come first (bm25 over title, channel and
+    description); without, the newest videos that pass the filters. The
+    page is picked on rowids and ranks alone, so only the rows on it are
+    joined with metadata and seen state.
+    """
+    query = fts_query(words)
+    if query:
+        inner = ["SELECT video_search.rowid AS id, video_search.rank AS score FROM video_search"]
+        where = ["video_search MATCH ?", "video_search.rank MATCH ?"]
+        params = [query, "bm25({}, {}, {})".format(*SEARCH_WEIGHTS)]
+        inner_order, order = "score", "page.score, v.published_ts DESC"
+    else:
+        inner = ["SELECT v.rowid AS id, v.published_ts FROM videos v"]
+        where = []
+        params = []
+        inner_order, order = "v.published_ts DESC", "v.published_ts DESC"
+
+    is_shorts = "(coalesce(v.is_shorts, 0) OR coalesce(m.is_shorts, 0))"
+    is_seen = seen_sql("v.video_id", user)
+    conditions = [
+        ("v.channel LIKE ?", f"%{filters['channel']}%" if filters.get('channel') else None),
+        ("v.published_ts >= ?", filters.get('since')),
+        ("v.published_ts < ?", filters.get('until')),
+        ("m.duration_seconds >= ?", filters.get('min_seconds')),
+        ("m.duration_seconds <= ?", filters.get('max_seconds')),
+    ]
+    for condition, value in conditions:
+        if value is not None:
+            where.append(condition)
+            params.append(value)
+    if filters.get('shorts') in ("hide", "only"):
+        where.append(f"NOT {is_shorts}" if filters['shorts'] == "hide" else is_shorts)
+    if filters.get('seen') in ("unseen", "seen"):
+        where.append(f"NOT {is_seen}" if filters['seen'] == "unseen" else is_seen)
+    # Matches are only joined with the tables the filters need
+    if query and len(where) > 2:
+        inner.append("JOIN videos v ON v.rowid = video_search.rowid")
+    if (filters.get('min_seconds') is not None or filters.get('max_seconds') is not None
+            or filters.get('shorts') in ("hide", "only")):
+        inner.append("LEFT JOIN video_metadata m ON m.video_id = v.video_id")
+
+    sql = f"""SELECT v.video_id, v.title, v.channel, v.url, v.published_ts, v.published_date,
+                     {is_shorts}, m.duration, m.duration_seconds, {is_seen}
+              FROM ({" ".join(inner)} WHERE {" AND ".join(where) or "1"}
+                    ORDER BY {inner_order} LIMIT ? OFFSET ?) page
+              JOIN videos v ON v.rowid = page.id
+              LEFT JOIN video_metadata m ON m.video_id = v.video_id
+              ORDER BY {order}"""
+    params.extend((limit, offset))
+
+    videos = []
+    for (video_id, title, channel, url, published_ts, published_date, is_shorts,
+         duration, seconds, is_seen) in conn.execute(sql, params):
+        videos.append(Video(video_id, title, url,
+                            published_ts if published_ts is not None else parse_published(published_date),
+                            channel, bool(is_shorts), bool(is_seen),
+                            seconds if seconds is not None else parse_duration(duration)))
+    return videos
+
+async def search_videos(words, filters, limit=SEARCH_PAGE_SIZE, offset=0, user=None):
+    return await db_call(_search_videos, words, filters, limit, offset, user)
+
+def search_pager(words, filters):
+    """Returns a loader that yields (page, has_more) for successive pages of search results.
+
+    Videos that are in the feed lists come back as those same records, so
+    marking one seen updates the main menu too.
+    """
+    offset = 0
+    async def load_page():
+        nonlocal offset
+        page = await search_videos(words, filters, SEARCH_PAGE_SIZE + 1, offset)
+        has_more = len(page) > SEARCH_PAGE_SIZE
+        page = page[:SEARCH_PAGE_SIZE]
+        offset += len(page)
+        return [video_index.get(v.id, v) for v in page], has_more
+    return load_page
+
+ATOM_ENTRY_RE = re.compile(r'<entry><id>([^<]*)</id>.*<updated>([^<]*)</updated></entry>$')
+XML_INVALID_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+ALL_VIDEOS_OUTPUT = "all-videos"
+_output_lock = threading.Lock()
+
+def outputs_enabled():
+    return os.path.isdir(OUTPUT_DIR)
+
+def output_name(playlist_id, playlist_name):
+    """The file name for a playlist's outputs; the ID keeps names that slug alike apart."""
+    slug = re.sub(r'[^a-z0-9]+', '-', playlist_name.lower()).strip('-')
+    return f"playlist-{playlist_id}-{slug}" if slug else f"playlist-{playlist_id}"
+
+def output_paths(name):
+    base = os.path.join(OUTPUT_DIR, name)
+    return f"{base}.atom", f"{base}.m3u"
+
+def atom_time(ts):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+def xml_text(text):
+    from xml.sax.saxutils import escape
+    return escape(XML_INVALID_RE.sub("", " ".join((text or "").split())), {'"': "&quot;"})
+
+def output_entry(v, updated):
+    """An (updated, video ID, Atom line, M3U lines) entry of an output file.
+
+    Each Atom entry sits on one line, so the files can be patched line by
+    line later on. updated is when the entry joined the list.
+    """
+    published = atom_time(v.published) if v.published else updated
+    atom = (f'<entry><id>{xml_text(v.id)}</id><title>{xml_text(v.title)}</title>'
+            f'<link rel="alternate" href="{xml_text(v.link)}"/><author><name>{xml_text(v.channel)}</name></author>'
+            f'<published>{published}</published><updated>{updated}</updated></entry>\n')
+    title = " ".join(f"{v.channel or ''} - {v.title or ''}".split())
+    m3u = f"#EXTINF:{v.seconds if v.seconds is not None else -1},{title}\n{v.link}\n"
+    return updated, v.id, atom, m3u
+
+def mix_entry(v):
+    return output_entry(v, atom_time(v.published) if v.published else atom_time(time.time()))
+
+def playlist_entry(v):
+    if v.added_at:
+        return output_entry(v, v.added_at[:19].replace(" ", "T") + "Z")
+    return output_entry(v, atom_time(time.time()))
+
+def write_output_files(name, title, entries):
+    """Writes an output's Atom and M3U files, each with one rename."""
+    atom_path, m3u_path = output_paths(name)
+    header = ('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n'
+              f'<id>urn:ytrss:{name}</id><title>{xml_text(title)}</title><updated>{atom_time(time.time())}</updated>'
+              '<author><name>ytrss</name></author><generator>ytrss</generator>\n')
+    write_file_atomic(atom_path, header + "".join(e[2] for e in entries) + "</feed>\n")
+    write_file_atomic(m3u_path, "#EXTM3U\n" + "".join(e[3] for e in entries))
+
+def patch_output_files(name, title, added=(), removed=(), newest_first=True):
+    """Splices added entries into an output and drops removed video IDs.
+
+    The other entries are copied over as they were written, not rendered
+    again. With newest_first the list is kept in order of the entries'
+    updated times (the mix); otherwise added entries go on top unless
+    they're already in (playlists). Returns False if the files are
+    missing or don't line up, so they have to be written from scratch.
+    """
+    atom_path, m3u_path = output_paths(name)
+    try:
+        with open(atom_path, encoding='utf-8') as f:
+            atom_lines = [line for line in f if line.startswith("<entry>")]
+        with open(m3u_path, encoding='utf-8') as f:
+            m3u_lines = f.readlines()[1:]
+    except (OSError, UnicodeDecodeError):
+        return False
+    if len(m3u_lines) != 2 * len(atom_lines):
+        return False
+
+    kept = []
+    present = set()
+    dropped = set(removed)
+    if newest_first:
+        dropped.update(entry[1] for entry in added)
+    for line, extinf, link in zip(atom_lines, m3u_lines[0::2], m3u_lines[1::2]):
+        match = ATOM_ENTRY_RE.match(line)
+        if match is None:
+            return False
+        video_id = match.group(1)
+        present.add(video_id)
+        if video_id not in dropped:
+            kept.append((match.group(2), video_id, line, extinf + link))
+    if newest_first:
+        entries = list(heapq.merge(sorted(added, reverse=True), kept, reverse=True))
+    else:
+        entries = [entry for entry in added if entry[1] not in present] + kept
+    write_output_files(name, title, entries[:OUTPUT_ENTRIES])
+    return True
+
+async def write_output(name, title, entries):
+    def _write():
+        with _output_lock:
+            write_output_files(name, title, entries[:OUTPUT_ENTRIES])
+    await asyncio.to_thread(_write)
+
+async def update_output(name, title, load, added=(), removed=(), newest_first=True):
+    """Patches an output, or writes it from what load() returns if it can't be patched."""
+    def _patch():
+        with _output_lock:
+            return patch_output_files(name, title, added, removed, newest_first)
+    if not await asyncio.to_thread(_patch):
+        await write_output(name, title, await load())
+
+async def load_mix_entries():
+    """The newest OUTPUT_ENTRIES stored videos of the channels in the OPML."""
+    feeds = set(load_feeds_from_opml())
+    entries = []
+    async for v in iter_stored_videos():
+        if v.feed_url in feeds:
+            entries.append(mix_entry(v))
+            if len(entries) >= OUTPUT_ENTRIES:
+                break
+    return entries
+
+async def load_playlist_entries(playlist_id):
+    entries = []
+    load_page = playlist_pager(playlist_id)
+    has_more = True
+    while has_more and len(entries) < OUTPUT_ENTRIES:
+        page, has_more = await load_page()
+        entries.extend(playlist_entry(v) for v in page)
+    return entries
+
+async def update_mix_output(added):
+    if added and outputs_enabled():
+        await update_output(ALL_VIDEOS_OUTPUT, "ALL VIDEOS", load_mix_entries, [mix_entry(v) for v in added])
+
+async def update_playlist_output(playlist_id, added=(), removed=()):
+    if not outputs_enabled():
+        return
+    name = next((name for pl_id, name, _, _ in await get_playlists() if pl_id == playlist_id), None)
+    if name is not None:
+        await update_output(output_name(playlist_id, name), name, lambda: load_playlist_entries(playlist_id),
+                            [playlist_entry(v) for v in added], removed, newest_first=False)
+
+async def export_outputs():
+    """Writes every output from scratch. Returns the names written."""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    await write_output(ALL_VIDEOS_OUTPUT, "ALL VIDEOS", await load_mix_entries())
+    names = [ALL_VIDEOS_OUTPUT]
+    for pl_id, name, _, _ in await get_playlists():
+        await write_output(output_name(pl_id, name), name, await load_playlist_entries(pl_id))
+        names.append(output_name(pl_id, name))
+    return names
+
+def format_duration(seconds):
+    """Formats seconds the way yt-dlp --get-duration does (M:SS or H:MM:SS)."""
+    h, rest = divmod(int(seconds), 3600)
+    m, s = divmod(rest, 60)
+    if h:
+        return f"{h}:{m:02d}:{s:02d}"
+    return f"{m}:{s:02d}"
+
+def parse_duration(text):
+    """Parses a M:SS / H:MM:SS duration string into seconds, or None."""
+    try:
+        seconds = 0
+        for part in text.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except (AttributeError, ValueError):
+        return None
+
+def build_metadata(duration, live_status, width, height):
+    """Builds the structured metadata record from raw yt-dlp fields."""
+    is_live = live_status in ("is_live", "is_upcoming")
+    seconds = int(duration) if duration and not is_live else None
+    vertical = bool(width and height and height > width)
+    is_shorts = seconds is not None and (
+        seconds <= SHORTS_MAX_SECONDS or (vertical and seconds <= SHORTS_MAX_SECONDS_VERTICAL))
+    if is_live:
+        display = "LIVE" if live_status == "is_live" else "SOON"
+    elif seconds is not None:
+        display = format_duration(seconds)
+    else:
+        display = "??:??"
+    return {'duration': display, 'seconds': seconds, 'is_live': is_live, 'is_shorts': is_shorts}
+
+def have_ytdlp_module():
+    return importlib.util.find_spec("yt_dlp") is not None
+
+def extract_metadata_batch(urls):
+    """Resolves a batch in-process with a YoutubeDL instance kept per worker thread.
+
+    Runs on the metadata executor. Returns {url: metadata} for the URLs
+    that could be resolved.
+    """
+    ydl = getattr(_metadata_local, 'ydl', None)
+    if ydl is None:
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL({
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': True,
+            'noplaylist': True,
+            'ignore_no_formats_error': True,
+        })
+        _metadata_local.ydl = ydl
+
+    results = {}
+    for url in urls:
+        try:
+            info = ydl.extract_info(url, download=False)
+        except Exception:
+            continue
+        if info:
+            results[url] = build_metadata(info.get('duration'), info.get('live_status'),
+                                          info.get('width'), info.get('height'))
+    return results
+
+async def run_ytdlp_batch(urls):
+    """Resolves a batch with a single yt-dlp process.
+
+    Used when the yt_dlp module isn't importable (e.g. a standalone yt-dlp
+    binary). One process per batch instead of per video still spreads the
+    start-up cost over the whole batch.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        YTDLP_CMD, "--skip-download", "--ignore-errors", "--no-warnings",
+        "--ignore-no-formats-error", "--no-playlist",
+        "--print", "%(original_url)s\t%(duration)s\t%(live_status)s\t%(width)s\t%(height)s",
+        "--", *urls,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), METADATA_BATCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return {}
+
+    def num(field):
+        try:
+            return float(field)
+        except ValueError:
+            return None
+
+    results = {}
+    for line in stdout.decode(errors='replace').splitlines():
+        fields = line.split('\t')
+        if len(fields) != 5:
+            continue
+        url, duration, live_status, width, height = fields
+        results[url] = build_metadata(num(duration), live_status, num(width), num(height))
+    return results
+
+async def resolve_metadata_batch(batch):
+    """Resolves one batch of (video_id, url) pairs and caches the results."""
+    urls = [url for _, url in batch]
+    async with _metadata_sem:
+        try:
+            if have_ytdlp_module():
+                loop = asyncio.get_running_loop()
+                by_url = await loop.run_in_executor(_metadata_executor, extract_metadata_batch, urls)
+            else:
+                by_url = await run_ytdlp_batch(urls)
+        except Exception:
+            by_url = {}
+
+    results = {}
+    for video_id, url in batch:
+        meta = by_url.get(url)
+        # Live and upcoming streams get a real duration later, don't cache them
+        if meta is not None and not meta['is_live'] and meta['duration'] != "??:??":
+            metadata_cache[video_id] = meta
+            save_metadata(video_id, meta)
+            metadata_failures.pop(video_id, None)
+            db_write(SQL_METADATA_JOB_DONE, (video_id,))
+        else:
+            record_metadata_failure(video_id, url, "live" if meta else "lookup failed")
+        results[video_id] = meta
+    return results
+
+def record_metadata_failure(video_id, url, error):
+    """Backs off exponentially so broken videos aren't retried on every open."""
+    attempts = metadata_failures.get(video_id, (0, 0))[0] + 1
+    delay = min(METADATA_RETRY_BASE * 2 ** (attempts - 1), METADATA_RETRY_MAX)
+    next_attempt = int(time.time()) + delay
+    metadata_failures[video_id] = (attempts, next_attempt)
+    db_write(SQL_METADATA_JOB_FAILED, (video_id, url, attempts, next_attempt, error))
+
+def metadata_backing_off(video_id, now=None):
+    failure = metadata_failures.get(video_id)
+    return failure is not None and failure[1] > (now or time.time())
+
+async def resolve_metadata(items):
+    """Resolves metadata for (video_id, url) pairs using the worker pool.
+
+    Cached entries are returned straight away, IDs that recently failed are
+    skipped until their backoff expires, IDs that another caller is
+    already resolving share that lookup, and the rest are split into
+    batches. Returns {video_id: metadata or None}.
+    """
+    global _metadata_executor, _metadata_sem
+    if _metadata_sem is None:
+        _metadata_sem = asyncio.Semaphore(METADATA_WORKERS)
+        _metadata_executor = ThreadPoolExecutor(max_workers=METADATA_WORKERS,
+                                                thread_name_prefix="ytrss-meta")
+
+    loop = asyncio.get_running_loop()
+    now = time.time()
+    results = {}
+    waiting = {}
+    to_resolve = []
+    for video_id, url in items:
+        if video_id in results or video_id in waiting:
+            continue
+        meta = metadata_cache.get(video_id)
+        if meta and meta['duration'] != "??:??":
+            results[video_id] = meta
+            # A queued job for it (e.g. re-queued by a menu) would otherwise stay due forever
+            db_write(SQL_METADATA_JOB_DONE, (video_id,))
+        elif metadata_backing_off(video_id, now):
+            results[video_id] = None
+        elif video_id in _metadata_inflight:
+            waiting[video_id] = _metadata_inflight[video_id]
+        else:
+            future = loop.create_future()
+            _metadata_inflight[video_id] = future
+            waiting[video_id] = future
+            to_resolve.append((video_id, url))
+
+    async def run_batch(batch):
+        try:
+            batch_results = await resolve_metadata_batch(batch)
+        except BaseException:
+            batch_results = {}
+            raise
+        finally:
+            for video_id, _ in batch:
+                future = _metadata_inflight.pop(video_id)
+                if not future.done():
+                    future.set_result(batch_results.get(video_id))
+
+    tasks = [loop.create_task(run_batch(to_resolve[i:i + METADATA_BATCH_SIZE]))
+             for i in range(0, len(to_resolve), METADATA_BATCH_SIZE)]
+    for video_id, future in waiting.items():
+        results[video_id] = await future
+    for task in tasks:
+        await task
+    return results
+
+async def drain_metadata_jobs():
+    """Resolves every due metadata job now. Used by the headless fetch command."""
+    while True:
+        jobs = await db_call(_get_due_metadata_jobs, int(time.time()),
+                             METADATA_WORKERS * METADATA_BATCH_SIZE)
+        if not jobs:
+            return
+        await resolve_metadata(jobs)
+
+def wake_metadata_prefetch():
+    if _metadata_jobs_event is not None:
+        _metadata_jobs_event.set()
+
+async def metadata_prefetch_loop():
+    """Works through due metadata_jobs, highest priority first, forever."""
+    global _metadata_jobs_event
+    _metadata_jobs_event = asyncio.Event()
+    while True:
+        _metadata_jobs_event.clear()
+        jobs = await db_call(_get_due_metadata_jobs, int(time.time()),
+                             METADATA_WORKERS * METADATA_BATCH_SIZE)
+        if jobs:
+            await resolve_metadata(jobs)
+            continue
+        try:
+            await asyncio.wait_for(_metadata_jobs_event.wait(), METADATA_IDLE_POLL)
+        except asyncio.TimeoutError:
+            pass
+
+def start_metadata_prefetch():
+    global _metadata_prefetch_task
+    if _metadata_prefetch_task is None:
+        _metadata_prefetch_task = asyncio.get_running_loop().create_task(metadata_prefetch_loop())
+
+async def stop_metadata_prefetch():
+    global _metadata_prefetch_task
+    if _metadata_prefetch_task is not None:
+        _metadata_prefetch_task.cancel()
+        try:
+            await _metadata_prefetch_task
+        except asyncio.CancelledError:
+            pass
+        _metadata_prefetch_task = None
+
+def shutdown_metadata_workers():
+    global _metadata_executor
+    if _metadata_executor is not None:
+        _metadata_executor.shutdown(wait=False, cancel_futures=True)
+        _metadata_executor = None
 
 def load_feeds_from_opml():
     if not os.path.exists(OPML_FILE):
@@ -332,56 +1529,268 @@ def load_feeds_from_opml():
         print(f"Error reading OPML: {e}")
     return urls
 
-def add_feed_to_opml(url):
-    print(f"Verifying link: {url} ...")
-    try:
-        d = feedparser.parse(url, agent=USER_AGENT)
-        channel_title = d.feed.get('title', 'Unknown Channel')
-    except Exception as e:
-        print(f"Could not verify URL: {e}")
-        return
+def read_opml():
+    """Returns the parsed OPML tree, or an empty one if there is no file yet."""
+    if os.path.exists(OPML_FILE):
+        return ET.parse(OPML_FILE)
+    root = ET.Element('opml', version="1.0")
+    ET.SubElement(root, 'head')
+    ET.SubElement(root, 'body')
+    return ET.ElementTree(root)
+
+def write_opml(tree):
+    """Replaces the OPML with one rename, so it is never left half written."""
+    data = ET.tostring(tree.getroot(), encoding='UTF-8', xml_declaration=True)
+    write_file_atomic(OPML_FILE, data.decode('utf-8'))
 
+def add_feeds_to_opml(feeds):
+    """Adds (url, title) pairs to the OPML in a single write."""
     try:
-        if os.path.exists(OPML_FILE):
-            tree = ET.parse(OPML_FILE)
-            root = tree.getroot()
-            body = root.find('body')
-        else:
-            root = ET.Element('opml', version="1.0")
-            ET.SubElement(root, 'head')
-            body = ET.SubElement(root, 'body')
-            tree = ET.ElementTree(root)
-
-        ET.SubElement(body, 'outline', {
-            'text': channel_title,
-            'title': channel_title,
-            'type': 'rss',
-            'xmlUrl': url
-        })
-        tree.write(OPML_FILE, encoding='UTF-8', xml_declaration=True)
-        print(f"Added: {channel_title}")
-    except Exception as e:
+        tree = read_opml()
+        body = tree.getroot().find('body')
+        if body is None:
+            body = ET.SubElement(tree.getroot(), 'body')
+        for url, title in feeds:
+            ET.SubElement(body, 'outline', {
+                'text': title,
+                'title': title,
+                'type': 'rss',
+                'xmlUrl': url
+            })
+        write_opml(tree)
+        return True
+    except (OSError, ET.ParseError) as e:
         print(f"Could not save: {e}")
+        return False
 
-def remove_channel_ui():
+async def remove_channel_ui():
     if not os.path.exists(OPML_FILE): return
-    tree = ET.parse(OPML_FILE)
-    root = tree.getroot()
-    body = root.find('body')
+    tree = read_opml()
+    body = tree.getroot().find('body')
     outlines = body.findall('outline')
     
     titles = [node.get('title') or node.get('text') or "Unknown" for node in outlines]
     titles.append("[Cancel]")
     
-    menu = TerminalMenu(titles, title="Select channel to remove:")
-    idx = menu.show()
+    idx = await show_menu(BackgroundMenu(titles, title="Select channel to remove:"))
     
     if idx is not None and idx < len(outlines):
         body.remove(outlines[idx])
-        tree.write(OPML_FILE, encoding='UTF-8', xml_declaration=True)
-        print("Channel removed.")
+        write_opml(tree)
+        notify("Channel removed.")
 
-def get_resource_path(relative_path):
+CHANNEL_ID_RE = re.compile(r'UC[0-9A-Za-z_-]{22}')
+CANONICAL_CHANNEL_RE = re.compile(r'<link rel="canonical" href="[^"]*/channel/(UC[0-9A-Za-z_-]{22})"')
+PAGE_CHANNEL_ID_RE = re.compile(r'"(?:externalId|channelId)":"(UC[0-9A-Za-z_-]{22})"')
+# First path segments of YouTube URLs that aren't channels
+YOUTUBE_NON_CHANNEL_PATHS = {"watch", "playlist", "shorts", "results", "feed", "live", "embed", "hashtag", "post"}
+
+def channel_feed_url(channel_id):
+    return f"{YOUTUBE_URL}/feeds/videos.xml?channel_id={channel_id}"
+
+def feed_key(url):
+    """The channel ID of a YouTube feed URL, or the URL itself; subscriptions are deduplicated on this."""
+    from urllib.parse import parse_qs, urlsplit
+    channel_id = parse_qs(urlsplit(url).query).get('channel_id', [None])[0]
+    return channel_id if channel_id and CHANNEL_ID_RE.fullmatch(channel_id) else url
+
+def normalize_subscription(text):
+    """Turns a feed URL, channel URL, channel ID or @handle into what to fetch.
+
+    Returns ("feed", feed_url), ("page", channel_page_url) for channels
+    whose ID has to be looked up first, or None if text is none of these.
+    """
+    from urllib.parse import urlsplit
+    text = text.strip()
+    if CHANNEL_ID_RE.fullmatch(text):
+        return "feed", channel_feed_url(text)
+    if text.startswith("@"):
+        return "page", f"{YOUTUBE_URL}/{text}"
+    if "://" not in text and text.split("/")[0].lower().endswith("youtube.com"):
+        text = "https://" + text
+    parts = urlsplit(text)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    host = parts.netloc.lower()
+    if not (host == "youtube.com" or host.endswith(".youtube.com") or host == urlsplit(YOUTUBE_URL).netloc):
+        return "feed", text
+
+    segments = [s for s in parts.path.split("/") if s]
+    if segments == ["feeds", "videos.xml"]:
+        key = feed_key(text)
+        return "feed", channel_feed_url(key) if key != text else text
+    if len(segments) >= 2 and segments[0] == "channel" and CHANNEL_ID_RE.fullmatch(segments[1]):
+        return "feed", channel_feed_url(segments[1])
+    if len(segments) >= 2 and segments[0] in ("c", "user"):
+        return "page", f"{YOUTUBE_URL}/{segments[0]}/{segments[1]}"
+    if segments and segments[0] not in YOUTUBE_NON_CHANNEL_PATHS:
+        return "page", f"{YOUTUBE_URL}/{segments[0]}"
+    return None
+
+def read_subscriptions(text):
+    """Reads subscriptions from OPML, CSV or a plain list.
+
+    CSV is what YouTube Takeout exports (subscriptions.csv) or anything
+    else with a channel ID or URL in some column. Plain lists have one
+    URL, channel ID or @handle per line. Returns (entry, title) pairs;
+    title is None when the source doesn't name the channel.
+    """
+    text = text.lstrip("\ufeff \t\r\n")
+    if text.startswith("<"):
+        root = ET.fromstring(text)
+        return [(node.get('xmlUrl'), node.get('title') or node.get('text'))
+                for node in root.iter('outline') if node.get('xmlUrl')]
+
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line and not line.startswith("#")]
+    if not lines or "," not in lines[0]:
+        return [(line.split()[0], None) for line in lines]
+
+    import csv
+    entries = []
+    title_col = None
+    for row in csv.reader(lines):
+        cells = [cell.strip() for cell in row]
+        entry = next((cell for cell in cells if cell and normalize_subscription(cell)), None)
+        if entry is None:
+            if not entries and title_col is None:
+                # Header row; remember which column names the channel
+                names = [cell.lower() for cell in cells]
+                title_col = next((names.index(n) for n in ("channel title", "title", "name") if n in names), None)
+            else:
+                entries.append((cells[0], None))
+            continue
+        title = cells[title_col] if title_col is not None and title_col < len(cells) else None
+        entries.append((entry, title or None))
+    return entries
+
+def rate_limiter(per_second):
+    """Returns a coroutine function that spaces its callers 1/per_second apart."""
+    next_start = 0.0
+    async def wait():
+        nonlocal next_start
+        now = time.monotonic()
+        start = max(now, next_start)
+        next_start = start + 1 / per_second
+        if start > now:
+            await asyncio.sleep(start - now)
+    return wait
+
+async def resolve_channel_page(session, page_url):
+    """Looks up the channel ID behind a channel, /c/, /user/ or @handle page. Returns (feed_url, error)."""
+    status, html, _, error = await fetch_feed(session, page_url)
+    if status != 200:
+        return None, error
+    m = CANONICAL_CHANNEL_RE.search(html) or PAGE_CHANNEL_ID_RE.search(html)
+    if not m:
+        return None, "no channel found on the page"
+    return channel_feed_url(m.group(1)), None
+
+async def verify_feed(session, url):
+    """Fetches and parses a feed. Returns (channel title, error)."""
+    status, xml_data, _, error = await fetch_feed(session, url)
+    if status != 200:
+        return None, error
+    if not re.search(r'<(feed|rss|rdf:RDF)[\s>]', xml_data[:4096]):
+        return None, "not a feed"
+    try:
+        channel_title, _ = parse_feed(xml_data)
+    except Exception as e:
+        return None, f"unreadable feed: {e}"
+    return channel_title or "Unknown Channel", None
+
+async def import_subscriptions(entries, dry_run=False):
+    """Verifies subscriptions in bulk and adds the new ones to the OPML.
+
+    entries are (entry, title) pairs as read_subscriptions returns them.
+    Channel pages and @handles are resolved to feed URLs, then everything
+    is deduplicated by channel ID against the OPML and itself. The rest is
+    fetched concurrently over the shared session, and all feeds that check
+    out are added in one OPML write.
+
+    Returns {'added': [(url, title)], 'known': n, 'duplicates': n,
+    'failed': [(entry, error)]}.
+    """
+    session = get_http_session()
+    sem = asyncio.Semaphore(IMPORT_CONCURRENCY)
+    throttle = rate_limiter(IMPORT_RATE)
+    show_progress = sys.stdout.isatty()
+    done = 0
+
+    async def limited(check, url, total):
+        nonlocal done
+        async with sem:
+            await throttle()
+            try:
+                result = await asyncio.wait_for(check(session, url), FETCH_DEADLINE)
+            except asyncio.TimeoutError:
+                result = None, "deadline exceeded"
+        done += 1
+        if show_progress:
+            print(f"\rChecking {done}/{total}...", end="", flush=True)
+        return result
+
+    failed = []
+    candidates = []  # (entry, feed_url, title)
+    pages = {}  # lowercased page URL -> (page URL, [(entry, title)])
+    for entry, title in entries:
+        target = normalize_subscription(entry)
+        if target is None:
+            failed.append((entry, "not a feed URL, channel URL, channel ID or @handle"))
+        elif target[0] == "page":
+            pages.setdefault(target[1].lower(), (target[1], []))[1].append((entry, title))
+        else:
+            candidates.append((entry, target[1], title))
+
+    total = len(pages)
+    page_results = await asyncio.gather(*(limited(resolve_channel_page, url, total) for url, _ in pages.values()))
+    for (_, page_entries), (feed_url, error) in zip(pages.values(), page_results):
+        for entry, title in page_entries:
+            if feed_url:
+                candidates.append((entry, feed_url, title))
+            else:
+                failed.append((entry, error))
+
+    known_keys = {feed_key(url) for url in load_feeds_from_opml()}
+    known = 0
+    new = {}  # feed key -> (entry, feed_url, title)
+    for entry, feed_url, title in candidates:
+        key = feed_key(feed_url)
+        if key in known_keys:
+            known += 1
+        elif key not in new:
+            new[key] = (entry, feed_url, title)
+    duplicates = len(candidates) - known - len(new)
+
+    done = 0
+    total = len(new)
+    checks = await asyncio.gather(*(limited(verify_feed, feed_url, total) for _, feed_url, _ in new.values()))
+    if show_progress and (pages or new):
+        print()
+    added = []
+    for (entry, feed_url, title), (channel_title, error) in zip(new.values(), checks):
+        if error:
+            failed.append((entry, error))
+        else:
+            added.append((feed_url, channel_title or title))
+
+    if added and not dry_run and not add_feeds_to_opml(added):
+        failed.extend((url, "could not save the OPML") for url, _ in added)
+        added = []
+    return {'added': added, 'known': known, 'duplicates': duplicates, 'failed': failed}
+
+def import_summary(result, dry_run=False):
+    return (f"{len(result['added'])} {'to add' if dry_run else 'added'}, {result['known']} already subscribed, "
+            f"{result['duplicates']} duplicates, {len(result['failed'])} failed.")
+
+def print_import_summary(result, dry_run=False, file=None):
+    for url, title in result['added']:
+        print(f"{'Would add' if dry_run else 'Added'}: {title}  {url}", file=file)
+    for entry, error in result['failed']:
+        print(f"Failed: {entry} ({error})", file=file)
+    print(import_summary(result, dry_run), file=file)
+
+def get_resource_path(relative_path):
     """Get absolute path to resource, works for dev and for PyInstaller"""
     try:
         # PyInstaller creates a temp folder and stores path in _MEIPASS
@@ -410,320 +1819,2587 @@ def show_help():
         print("Help file KEYS.md not found.")
         input("Press Enter...")
 
-async def fetch_feed(session, url):
+def feed_cache_paths(url):
+    """Returns the (metadata, body) cache file paths for a feed URL."""
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return (os.path.join(FEED_CACHE_DIR, key + ".json"),
+            os.path.join(FEED_CACHE_DIR, key + ".xml"))
+
+def load_feed_cache(url):
+    """Loads the cached validators and parsed entries for a feed, or None."""
+    meta_path, _ = feed_cache_paths(url)
+    try:
+        with open(meta_path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('url') != url:
+        return None
+    return cached
+
+def load_feed_cache_body(url):
+    _, body_path = feed_cache_paths(url)
+    try:
+        with open(body_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def write_file_atomic(path, data):
+    """Writes text to a temp file and renames it over path."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def save_feed_cache(url, cached, xml_data=None):
+    """Stores validators, body hash and parsed entries (and the body if given)."""
+    meta_path, body_path = feed_cache_paths(url)
+    try:
+        if xml_data is not None:
+            write_file_atomic(body_path, xml_data)
+        write_file_atomic(meta_path, json.dumps(cached))
+    except OSError as e:
+        print(f"Error saving feed cache: {e}")
+
+def hash_feed_body(xml_data):
+    return hashlib.sha256(xml_data.encode('utf-8')).hexdigest()
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+YT_NS = "{http://www.youtube.com/xml/schemas/2015}"
+MEDIA_NS = "{http://search.yahoo.com/mrss/}"
+
+def parse_timestamp(text):
+    """Converts an ISO 8601 date from a feed to epoch seconds, or None."""
+    if not text:
+        return None
+    try:
+        return int(datetime.fromisoformat(text.replace('Z', '+00:00')).timestamp())
+    except ValueError:
+        return None
+
+def is_portrait(width, height):
+    try:
+        return int(height) > int(width)
+    except (TypeError, ValueError):
+        return False
+
+def parse_youtube_feed(xml_data):
+    """Streams a YouTube Atom feed with iterparse.
+
+    Returns (channel_name, entries) where each entry is a compact
+    (id, title, link, published_epoch, description, vertical) tuple, or
+    None if the body doesn't look like a YouTube channel feed. vertical
+    says whether the entry's thumbnail is portrait.
+    """
+    ch_name = None
+    entries = []
+    in_entry = False
+    for event, elem in ET.iterparse(io.BytesIO(xml_data.encode('utf-8')), events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == ATOM_NS + 'entry':
+                in_entry = True
+            continue
+
+        if elem.tag == ATOM_NS + 'entry':
+            in_entry = False
+            video_id = elem.findtext(YT_NS + 'videoId')
+            if not video_id:
+                return None
+            link = None
+            for link_elem in elem.iterfind(ATOM_NS + 'link'):
+                if link_elem.get('rel', 'alternate') == 'alternate':
+                    link = link_elem.get('href')
+                    break
+            thumbnail = elem.find(f"{MEDIA_NS}group/{MEDIA_NS}thumbnail")
+            entries.append((
+                elem.findtext(ATOM_NS + 'id') or f"yt:video:{video_id}",
+                elem.findtext(ATOM_NS + 'title') or "",
+                link or f"https://www.youtube.com/watch?v={video_id}",
+                parse_timestamp(elem.findtext(ATOM_NS + 'published')),
+                elem.findtext(f"{MEDIA_NS}group/{MEDIA_NS}description") or "",
+                thumbnail is not None and is_portrait(thumbnail.get('width'), thumbnail.get('height')),
+            ))
+            elem.clear()
+        elif elem.tag == ATOM_NS + 'title' and not in_entry and ch_name is None:
+            ch_name = elem.text or 'Unknown'
+
+    if ch_name is None:
+        return None
+    return ch_name, entries
+
+def parse_feed_fallback(xml_data):
+    """Parses any feed feedparser understands into the same compact records."""
+    import calendar
+    import feedparser
+    d = feedparser.parse(xml_data)
+    ch_name = d.feed.get('title', 'Unknown')
+    entries = []
+    for entry in d.entries:
+        published = entry.get('published_parsed')
+        thumbnail = (entry.get('media_thumbnail') or [{}])[0]
+        entries.append((
+            entry.get('id', entry.link),
+            entry.title,
+            entry.link,
+            calendar.timegm(published) if published else None,
+            entry.get('summary', ''),
+            is_portrait(thumbnail.get('width'), thumbnail.get('height')),
+        ))
+    return ch_name, entries
+
+def parse_feed(xml_data):
+    """Parses a feed body into (channel_name, entries).
+
+    Uses the YouTube Atom fast path and only falls back to feedparser for
+    bodies it doesn't recognise.
+    """
+    try:
+        parsed = parse_youtube_feed(xml_data)
+        if parsed is not None:
+            return parsed
+    except ET.ParseError:
+        pass
+    return parse_feed_fallback(xml_data)
+
+def parse_feed_batch(bodies):
+    """Parses a batch of feed bodies. Runs in the parse pool worker processes."""
+    results = []
+    for xml_data in bodies:
+        try:
+            results.append(parse_feed(xml_data))
+        except Exception:
+            results.append(None)
+    return results
+
+def get_parse_pool():
+    global _parse_pool, _parse_pool_workers
+    if _parse_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        _parse_pool_workers = os.cpu_count() or 1
+        # spawn, not fork: the parent has aiohttp resolver threads running
+        _parse_pool = ProcessPoolExecutor(max_workers=_parse_pool_workers,
+                                          mp_context=multiprocessing.get_context('spawn'))
+    return _parse_pool
+
+def shutdown_parse_pool():
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
+
+async def parse_feeds(bodies):
+    """Parses feed bodies, spread over a process pool when there are enough."""
+    if len(bodies) < PARSE_POOL_MIN_FEEDS:
+        return parse_feed_batch(bodies)
+
+    pool = get_parse_pool()
+    chunk_size = max(1, -(-len(bodies) // (_parse_pool_workers * 4)))
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(pool, parse_feed_batch, bodies[i:i + chunk_size])
+        for i in range(0, len(bodies), chunk_size)
+    ))
+    return [parsed for chunk in chunks for parsed in chunk]
+
+def get_http_session():
+    """Returns the shared aiohttp session, creating it on first use.
+
+    One session lives for the whole process so keep-alive connections and
+    the DNS cache survive between refreshes.
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        import aiohttp
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_MAX_CONNECTIONS,
+            limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=HTTP_CONNECT_TIMEOUT,
+            sock_read=HTTP_READ_TIMEOUT,
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={"User-Agent": USER_AGENT},
+        )
+        from yarl import URL
+        _http_session.cookie_jar.update_cookies(YOUTUBE_CONSENT_COOKIES, URL(YOUTUBE_URL))
+    return _http_session
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
+def retry_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, honouring a numeric Retry-After."""
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), FETCH_MAX_RETRY_AFTER)
+    return random.uniform(0, FETCH_BACKOFF_BASE * (2 ** attempt))
+
+async def fetch_feed(session, url, cached=None):
+    """Fetches a feed, revalidating against the cached copy if there is one.
+
+    Connection errors, timeouts, 429 and 5xx are retried with backoff.
+    Returns (status, xml_data, validators, error). status is 200 for a new
+    body, 304 when the server says nothing changed, and None on failure, in
+    which case error says why.
+    """
+    import aiohttp
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers["If-None-Match"] = cached['etag']
+        if cached.get('last_modified'):
+            headers["If-Modified-Since"] = cached['last_modified']
+
+    error = None
+    for attempt in range(FETCH_RETRIES + 1):
+        retry_after = None
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return 304, None, {}, None
+                if response.status == 200:
+                    validators = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                    }
+                    return 200, await response.text(), validators, None
+                error = f"HTTP {response.status}"
+                if response.status != 429 and response.status < 500:
+                    break
+                retry_after = response.headers.get('Retry-After')
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except aiohttp.ClientError as e:
+            error = str(e) or type(e).__name__
+        except UnicodeDecodeError:
+            error = "undecodable body"
+            break
+
+        if attempt < FETCH_RETRIES:
+            await asyncio.sleep(retry_delay(attempt, retry_after))
+
+    return None, None, {}, error
+
+def feed_fetcher(feed_cache):
+    """Returns fetch(url), which runs fetch_feed over the shared session, at most FETCH_CONCURRENCY at a time."""
+    session = get_http_session()
+    sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def fetch_bounded(url):
+        async with sem:
+            try:
+                return await asyncio.wait_for(
+                    fetch_feed(session, url, feed_cache.get(url)), FETCH_DEADLINE)
+            except asyncio.TimeoutError:
+                return None, None, {}, "deadline exceeded"
+    return fetch_bounded
+
+async def fetch_feeds(feeds, feed_cache):
+    """Fetches all feeds. Returns fetch_feed results in the same order as feeds."""
+    fetch = feed_fetcher(feed_cache)
+    return await asyncio.gather(*(fetch(url) for url in feeds))
+
+async def fetch_feeds_as_completed(feeds, feed_cache):
+    """Fetches all feeds, yielding (urls, results) for the ones that finished since the last batch.
+
+    Whatever completes while the caller works on a batch arrives together
+    in the next one, so a slow parse never falls behind one feed at a time.
+    """
+    fetch = feed_fetcher(feed_cache)
+    tasks = {asyncio.ensure_future(fetch(url)): url for url in feeds}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            yield [tasks[task] for task in done], [task.result() for task in done]
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def resolve_feeds(feeds, results, feed_cache):
+    """Turns fetch results into {url: (channel_name, entries)}, reusing the cache.
+
+    A 304 or a body whose hash matches the cached one reuses the stored
+    entries without parsing. Everything else is parsed in one batch. A feed
+    that failed to fetch keeps its cached entries so the channel doesn't
+    vanish. Feeds with nothing usable are left out. The outcome for every
+    feed is recorded in feed_status.
+    """
+    resolved = {}
+    to_parse = []  # (url, xml_data, body_hash, validators)
+
+    for url, (status, xml_data, validators, error) in zip(feeds, results):
+        cached = feed_cache.get(url)
+        cache_valid = bool(cached) and cached.get('version') == FEED_CACHE_VERSION
+
+        if status is None:
+            feed_status[url] = f"failed: {error}"
+            if cache_valid:
+                resolved[url] = (cached['channel'], cached['entries'])
+            continue
+
+        if status == 304 and cached:
+            feed_status[url] = "unchanged"
+            if cache_valid:
+                resolved[url] = (cached['channel'], cached['entries'])
+                continue
+            # Parsed entries are from an older format, re-parse the stored body
+            xml_data = load_feed_cache_body(url)
+            if xml_data is None:
+                continue
+            validators = {'etag': cached.get('etag'), 'last_modified': cached.get('last_modified')}
+        elif status != 200:
+            feed_status[url] = f"failed: HTTP {status}"
+            continue
+        else:
+            feed_status[url] = "updated"
+
+        body_hash = hash_feed_body(xml_data)
+        if cache_valid and cached.get('body_hash') == body_hash:
+            feed_status[url] = "unchanged"
+            if validators != {'etag': cached.get('etag'), 'last_modified': cached.get('last_modified')}:
+                cached.update(validators)
+                save_feed_cache(url, cached)
+            resolved[url] = (cached['channel'], cached['entries'])
+            continue
+
+        to_parse.append((url, xml_data, body_hash, validators))
+
+    parsed_feeds = await parse_feeds([xml_data for _, xml_data, _, _ in to_parse])
+    for (url, xml_data, body_hash, validators), parsed in zip(to_parse, parsed_feeds):
+        if parsed is None:
+            feed_status[url] = "failed: unparseable feed"
+            continue
+        ch_name, entries = parsed
+        resolved[url] = parsed
+        save_feed_cache(url, {
+            'url': url,
+            'version': FEED_CACHE_VERSION,
+            'etag': validators.get('etag'),
+            'last_modified': validators.get('last_modified'),
+            'body_hash': body_hash,
+            'channel': ch_name,
+            'entries': entries,
+        }, xml_data)
+
+    return resolved
+
+def feed_says_shorts(title, summary, vertical):
+    """Whether a feed entry itself gives away a Short."""
+    return vertical or "#shorts" in title.lower() or "#shorts" in summary.lower()
+
+def _get_stored_among(conn, video_ids, classified=False):
+    stored = set()
+    extra = " AND is_shorts IS NOT NULL" if classified else ""
+    for i in range(0, len(video_ids), SEEN_QUERY_CHUNK):
+        chunk = video_ids[i:i + SEEN_QUERY_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        stored.update(row[0] for row in conn.execute(
+            f"SELECT video_id FROM videos WHERE video_id IN ({placeholders}){extra}", chunk))
+    return stored
+
+async def probe_shorts(session, video_id):
+    """Asks youtube.com whether a video is a Short. Returns True, False, or None if the answer was unclear."""
+    import aiohttp
     try:
-        async with session.get(url, headers={"User-Agent": USER_AGENT}) as response:
+        async with session.head(f"{YOUTUBE_URL}/shorts/{bare_video_id(video_id)}",
+                                allow_redirects=False) as response:
             if response.status == 200:
-                return await response.text()
-    except:
+                return True
+            if 300 <= response.status < 400 and "/watch" in response.headers.get('Location', ''):
+                return False
+    except (asyncio.TimeoutError, aiohttp.ClientError):
+        pass
+    return None
+
+async def classify_shorts(resolved):
+    """Finds out which new videos in a refresh are Shorts, without yt-dlp.
+
+    Entries that aren't stored yet, or were stored before a probe gave a
+    clear answer, are looked at; merge_feeds keeps the answer in the videos
+    table. Entries the feed itself marks, and those whose duration is
+    already known, need no request. The rest are probed on the shared
+    session, newest first, and those past SHORTS_PROBE_LIMIT wait for a
+    later refresh.
+    """
+    candidates = []
+    for _, entries in resolved.values():
+        for vid_id, title, _, published, summary, vertical in entries:
+            if (published and vid_id.startswith("yt:video:") and vid_id not in metadata_cache
+                    and vid_id not in shorts_checks and not feed_says_shorts(title, summary, vertical)):
+                candidates.append((published, vid_id))
+    if not candidates:
+        return
+    stored = await db_call(_get_stored_among, [vid_id for _, vid_id in candidates], True)
+    candidates = sorted((c for c in candidates if c[1] not in stored), reverse=True)[:SHORTS_PROBE_LIMIT]
+
+    session = get_http_session()
+    sem = asyncio.Semaphore(SHORTS_PROBE_CONCURRENCY)
+    async def probe(vid_id):
+        async with sem:
+            shorts_checks[vid_id] = await probe_shorts(session, vid_id)
+    await asyncio.gather(*(probe(vid_id) for _, vid_id in candidates))
+
+def upload_gap(entries, now):
+    """Typical seconds between a feed's uploads, or None with fewer than two.
+
+    The median of the gaps between its entries and the time since the
+    newest one, so a channel that went quiet slowly drifts to a longer gap.
+    """
+    stamps = sorted((published for _, _, _, published, *_ in entries if published), reverse=True)
+    if len(stamps) < 2:
         return None
+    gaps = [newer - older for newer, older in zip(stamps, stamps[1:])]
+    gaps.append(max(now - stamps[0], 0))
+    gaps.sort()
+    return gaps[len(gaps) // 2]
 
-async def show_video_menu(videos, playlist_name=None):
-    global SHOW_SHORTS
+def poll_interval(entries, now):
+    gap = upload_gap(entries, now)
+    if gap is None:
+        return POLL_MAX_INTERVAL
+    return int(min(max(gap * POLL_INTERVAL_FRACTION, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL))
 
-    if not SHOW_SHORTS:
-        videos = [v for v in videos if not v.get('is_shorts')]
-        if not videos:
-            print("No videos to show (Shorts are hidden).")
-            await asyncio.sleep(1.5)
-            return
+def due_feeds(feeds, now=None):
+    """Feeds a scheduled refresh fetches: ones never fetched and ones whose time has come."""
+    now = now or time.time()
+    return [url for url in feeds if url not in feed_schedule or feed_schedule[url][0] <= now]
 
-    to_fetch = [v for v in videos[:40] if v['duration'] == "??:??"]
-    
-    if to_fetch:
-        print(f"Fetching metadata for {len(to_fetch)} videos...")
-        sem = asyncio.Semaphore(5)
-        
-        async def fetch_and_update(v):
-            async with sem:
-                dur = await get_video_duration(v['link'], v['id'])
-                v['duration'] = dur
-                if dur != "??:??":
-                    try:
-                        parts = dur.split(':')
-                        if len(parts) == 2:
-                            m, s = int(parts[0]), int(parts[1])
-                            if m == 0 or (m == 1 and s == 0):
-                                v['is_shorts'] = True
-                    except: pass
-
-        await asyncio.gather(*(fetch_and_update(v) for v in to_fetch))
-        
-        if not SHOW_SHORTS:
-            videos = [v for v in videos if not v.get('is_shorts')]
-            if not videos:
-                print("All videos were Shorts and were filtered out.")
-                await asyncio.sleep(1.5)
-                return
+def schedule_feeds(feeds, resolved, now):
+    """Sets the next due time of every fetched feed from its outcome in feed_status.
 
-    current_cursor_index = 0
-    while True:
-        menu_entries = []
+    A feed that worked is due again after its poll_interval. One that failed
+    keeps its interval and backs off exponentially, like metadata lookups.
+    """
+    for url in feeds:
+        _, interval, failures, _ = feed_schedule.get(url, (0, POLL_MAX_INTERVAL, 0, None))
+        status = feed_status.get(url, "")
+        if status.startswith("failed"):
+            failures += 1
+            delay = min(POLL_RETRY_BASE * 2 ** (failures - 1), POLL_RETRY_MAX)
+            error = status[len("failed: "):]
+        else:
+            interval = poll_interval(resolved[url][1] if url in resolved else [], now)
+            delay, failures, error = interval, 0, None
+        next_due = int(now + delay * random.uniform(1 - POLL_JITTER, 1))
+        feed_schedule[url] = (next_due, interval, failures, error)
+        db_write(SQL_SCHEDULE_FEED, (url, next_due, interval, failures, error))
+
+def feed_failing(url):
+    """True if the feed failed on its last fetch, including ones now backing off."""
+    return feed_status.get(url, "").startswith(("failed", "backing off"))
+
+def feed_status_summary(feeds):
+    statuses = [feed_status.get(url, "") for url in feeds]
+    failed = sum(1 for status in statuses if status.startswith("failed"))
+    updated = statuses.count("updated")
+    unchanged = statuses.count("unchanged")
+    not_due = statuses.count("not due")
+    backing_off = sum(1 for status in statuses if status.startswith("backing off"))
+    summary = (f"Fetched {len(feeds) - not_due - backing_off} feeds: "
+               f"{updated} updated, {unchanged} unchanged, {failed} failed.")
+    if not_due or backing_off:
+        summary += f" Skipped {not_due} not due yet, {backing_off} backing off."
+    return summary
+
+def print_feed_status(feeds):
+    """Prints a one-line refresh summary plus the feeds that are failing."""
+    failing = [url for url in feeds if feed_failing(url)]
+    print(feed_status_summary(feeds))
+    for url in failing[:10]:
+        state, _, reason = feed_status[url].partition(": ")
+        print(f"  {url}: {reason}" + (" (backing off)" if state == "backing off" else ""))
+    if len(failing) > 10:
+        print(f"  ... and {len(failing) - 10} more.")
+
+async def refresh_feeds(feeds, due=None, stream=False):
+    """Fetches and parses the feeds in due (all feeds if None). Runs as a background task.
+
+    The other feeds keep their stored videos; feed_status only says why they
+    were skipped. Fetched feeds get their next due time from schedule_feeds.
+    With stream, each feed is parsed as soon as it arrives and also put in
+    refreshed_feeds, so the menu can show it before the slowest one is in.
+    Shorts are probed once all feeds are in; the feeds then go back into
+    refreshed_feeds so merge_feeds marks the videos the menu already has.
+    """
+    global refresh_pending
+    now = time.time()
+    if due is None:
+        due = feeds
+    due_set = set(due)
+    for url in feeds:
+        if url not in due_set:
+            error = feed_schedule[url][3] if url in feed_schedule else None
+            feed_status[url] = f"backing off: {error}" if error else "not due"
+    if not due:
+        return {}
+
+    # Reading every cache file and importing aiohttp would hold up the first paint
+    feed_cache = await asyncio.to_thread(lambda: {url: load_feed_cache(url) for url in due})
+    await asyncio.to_thread(importlib.import_module, "aiohttp")
+    if not stream:
+        results = await fetch_feeds(due, feed_cache)
+        resolved = await resolve_feeds(due, results, feed_cache)
+        schedule_feeds(due, resolved, now)
+        await classify_shorts(resolved)
+        return resolved
+
+    resolved = {}
+    remaining = len(due)
+    refresh_pending += remaining
+    batches = fetch_feeds_as_completed(due, feed_cache)
+    try:
+        async for urls, results in batches:
+            batch = await resolve_feeds(urls, results, feed_cache)
+            schedule_feeds(urls, batch, now)
+            resolved.update(batch)
+            refreshed_feeds.update(batch)
+            remaining -= len(urls)
+            refresh_pending -= len(urls)
+    finally:
+        await batches.aclose()  # Cancels the fetches still running if the refresh was
+        refresh_pending -= remaining
+    await classify_shorts(resolved)
+    if shorts_checks:
+        refreshed_feeds.update(resolved)
+    return resolved
+
+def take_refreshed_feeds():
+    """Returns the feeds a streaming refresh resolved since the last call."""
+    global refreshed_feeds
+    taken, refreshed_feeds = refreshed_feeds, {}
+    return taken
+
+def start_refresh(feeds, force=False):
+    """Starts a background refresh of the due feeds, or of all feeds if forced.
+
+    Feeds are streamed into refreshed_feeds as they arrive. Returns
+    (refresh_task, number of feeds being fetched).
+    """
+    due = list(feeds) if force else due_feeds(feeds)
+    return asyncio.ensure_future(refresh_feeds(feeds, due, stream=True)), len(due)
+
+def restart_refresh(refresh_task, videos_by_feed):
+    """Re-reads the OPML after a subscription change and starts a new refresh.
+
+    Channels that are no longer subscribed are dropped from videos_by_feed.
+    Returns (feeds, refresh_task, number of feeds being fetched).
+    """
+    if refresh_task is not None:
+        refresh_task.cancel()
+    feeds = load_feeds_from_opml()
+    for url in set(videos_by_feed) - set(feeds):
+        del videos_by_feed[url]
+    return (feeds, *start_refresh(feeds))
+
+def websub_topic(url):
+    """The hub topic of a YouTube channel feed, or None for feeds that can't be pushed."""
+    channel_id = feed_key(url)
+    if channel_id == url:
+        return None
+    return f"{YOUTUBE_URL}/xml/feeds/videos.xml?channel_id={channel_id}"
+
+def websub_key(sub):
+    return sub['callback'].rsplit("/", 1)[-1]
+
+def websub_callback_ok(url, sub, callback_base):
+    """Whether a subscription's callback is at callback_base and behind a random key.
+
+    Keys from older versions were a hash of the feed URL, which anyone can
+    work out; those subscriptions are made again with a new key.
+    """
+    key = websub_key(sub)
+    return (sub['callback'] == f"{callback_base}/websub/{key}"
+            and key != hashlib.sha1(url.encode('utf-8')).hexdigest()[:16])
+
+def websub_active(url, now=None):
+    sub = websub_subscriptions.get(url)
+    return sub is not None and sub['expires'] > (now or time.time())
+
+def save_websub(url):
+    sub = websub_subscriptions[url]
+    db_write(SQL_SAVE_WEBSUB, (url, sub['callback'], sub['secret'], sub['expires']))
+
+def websub_signature_ok(secret, body, header):
+    """Checks an X-Hub-Signature header ("sha1=<hex HMAC of the body>", or sha256/384/512)."""
+    import hmac
+    method, _, digest = (header or "").partition("=")
+    if method not in ("sha1", "sha256", "sha384", "sha512") or not digest:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, method).hexdigest()
+    return hmac.compare_digest(expected, digest.strip().lower())
+
+def defer_poll(url, now=None):
+    """Pushes a feed's next poll out to POLL_MAX_INTERVAL while the hub keeps it up to date."""
+    now = now or time.time()
+    _, interval, _, _ = feed_schedule.get(url, (0, POLL_MAX_INTERVAL, 0, None))
+    next_due = int(now + POLL_MAX_INTERVAL * random.uniform(1 - POLL_JITTER, 1))
+    feed_schedule[url] = (next_due, interval, 0, None)
+    db_write(SQL_SCHEDULE_FEED, (url, next_due, interval, 0, None))
+
+def websub_requests(feeds, callback_base, now):
+    """Returns the (mode, url) requests the hub needs to get.
+
+    Feeds without a subscription at this callback, or whose lease runs out
+    within WEBSUB_RENEW_BEFORE, are (re)subscribed. Subscriptions of feeds
+    that are no longer in the OPML are cancelled. Nothing is asked twice
+    within WEBSUB_VERIFY_TIMEOUT.
+    """
+    import secrets
+    wanted = set()
+    requests = []
+    for url in feeds:
+        if websub_topic(url) is None:
+            continue
+        wanted.add(url)
+        sub = websub_subscriptions.get(url)
+        if sub is None or not websub_callback_ok(url, sub, callback_base):
+            callback = f"{callback_base}/websub/{secrets.token_urlsafe(16)}"
+            sub = websub_subscriptions[url] = {'callback': callback, 'secret': secrets.token_hex(20),
+                                               'expires': 0, 'requested': 0}
+        websub_callbacks[websub_key(sub)] = url
+        if sub['expires'] - now > WEBSUB_RENEW_BEFORE or now - sub['requested'] < WEBSUB_VERIFY_TIMEOUT:
+            continue
+        requests.append(("subscribe", url))
+    for url, sub in websub_subscriptions.items():
+        if url not in wanted and now - sub['requested'] >= WEBSUB_VERIFY_TIMEOUT:
+            websub_callbacks[websub_key(sub)] = url
+            requests.append(("unsubscribe", url))
+    return requests
+
+async def websub_request(session, hub, mode, url):
+    """Sends one subscribe/unsubscribe request to the hub. Returns an error, or None if it was accepted."""
+    import aiohttp
+    sub = websub_subscriptions[url]
+    data = {"hub.mode": mode, "hub.topic": websub_topic(url), "hub.callback": sub['callback'],
+            "hub.verify": "async"}
+    if mode == "subscribe":
+        data["hub.secret"] = sub['secret']
+        data["hub.lease_seconds"] = str(WEBSUB_LEASE)
+    try:
+        async with session.post(hub, data=data) as response:
+            if response.status in (202, 204):
+                return None
+            return f"HTTP {response.status}"
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        return str(e) or type(e).__name__
+
+async def renew_websub(feeds, hub, callback_base):
+    """Sends the hub every request websub_requests finds. Returns the number of failed requests.
+
+    The hub confirms each one with a GET to the callback, which
+    websub_verify answers; only then does a subscription count as live.
+    """
+    now = time.time()
+    requests = websub_requests(feeds, callback_base, now)
+    if not requests:
+        return 0
+    session = get_http_session()
+    sem = asyncio.Semaphore(WEBSUB_CONCURRENCY)
+    throttle = rate_limiter(WEBSUB_RATE)
+
+    async def send(mode, url):
+        async with sem:
+            await throttle()
+            # Set first: a hub that verifies synchronously calls back before the POST returns
+            websub_subscriptions[url]['requested'] = now
+            if mode == "subscribe":
+                save_websub(url)
+            error = await websub_request(session, hub, mode, url)
+            if error:
+                print(f"WebSub {mode} failed for {url}: {error}")
+            return error
+
+    errors = await asyncio.gather(*(send(mode, url) for mode, url in requests))
+    return sum(1 for error in errors if error)
+
+def websub_verify(url, query):
+    """Answers the hub's verification of intent. Returns the challenge to echo, or None to refuse."""
+    sub = websub_subscriptions.get(url)
+    mode = query.get("hub.mode")
+    # Only intents ytrss has asked for are confirmed, and only a pending request can be denied
+    if sub is None or query.get("hub.topic") != websub_topic(url) or not sub['requested']:
+        return None
+    if mode == "denied":
+        print(f"WebSub subscription denied for {url}: {query.get('hub.reason', 'no reason given')}")
+        sub['expires'] = 0
+        save_websub(url)
+        return ""
+    if mode == "subscribe":
+        try:
+            lease = int(query.get("hub.lease_seconds", WEBSUB_LEASE))
+        except ValueError:
+            lease = WEBSUB_LEASE
+        # A hub may grant less than was asked for, never more
+        lease = max(0, min(lease, WEBSUB_LEASE))
+        now = time.time()
+        sub['expires'] = int(now + lease)
+        sub['requested'] = 0
+        save_websub(url)
+        defer_poll(url, now)
+    elif mode == "unsubscribe":
+        del websub_subscriptions[url]
+        db_write(SQL_DELETE_WEBSUB, (url,))
+    else:
+        return None
+    return query.get("hub.challenge", "")
+
+async def ingest_push(url, xml_data, videos_by_feed, feed_titles):
+    """Stores the new videos of a pushed notification. Returns them.
+
+    Notifications also arrive when an old video is edited, so entries that
+    are already stored are dropped first.
+    """
+    try:
+        ch_name, entries = parse_feed(xml_data)
+    except Exception as e:
+        print(f"Unreadable notification for {url}: {e}")
+        return []
+    stored = await db_call(_get_stored_among, [vid_id for vid_id, *_ in entries])
+    entries = [entry for entry in entries if entry[0] not in stored]
+    defer_poll(url)
+    if not entries:
+        return []
+    # The pushed feed is titled "YouTube video feed", not after the channel
+    cached = load_feed_cache(url) if url not in feed_titles else None
+    ch_name = feed_titles.get(url) or (cached and cached.get('channel')) or ch_name
+    resolved = {url: (ch_name, entries)}
+    await classify_shorts(resolved)
+    added = await apply_refresh(resolved, videos_by_feed, feed_titles)
+    await db_flush()
+    return added
+
+def make_websub_app(videos_by_feed, feed_titles, quiet=False):
+    """The aiohttp app behind the callback URLs: GET /websub/<key> verifies, POST delivers."""
+    from aiohttp import web
+
+    async def callback(request):
+        url = websub_callbacks.get(request.match_info["key"])
+        if url is None:
+            raise web.HTTPNotFound()
+        if request.method == "GET":
+            challenge = websub_verify(url, request.query)
+            if challenge is None:
+                raise web.HTTPNotFound()
+            return web.Response(text=challenge)
+
+        body = await request.read()
+        sub = websub_subscriptions.get(url)
+        # Unsigned or forged notifications are acknowledged but ignored, as WebSub asks
+        if sub is None or not websub_signature_ok(sub['secret'], body, request.headers.get("X-Hub-Signature")):
+            print(f"Ignored a notification for {url} with a missing or wrong signature")
+            return web.Response(status=202)
+        added = await ingest_push(url, body.decode('utf-8', errors='replace'), videos_by_feed, feed_titles)
+        if not quiet:
+            for v in added:
+                print(f"{datetime.now():%H:%M:%S}  {v.channel}: {v.title}", flush=True)
+        return web.Response(status=204)
+
+    app = web.Application(client_max_size=WEBSUB_MAX_BODY)
+    app.router.add_route("GET", "/websub/{key}", callback)
+    app.router.add_route("POST", "/websub/{key}", callback)
+    return app
+
+async def start_websub_receiver(host, port, videos_by_feed, feed_titles, quiet=False):
+    """Starts serving the callback URLs. Returns the aiohttp runner; cleanup() stops it."""
+    from aiohttp import web
+    websub_subscriptions.update(await get_websub_subscriptions())
+    runner = web.AppRunner(make_websub_app(videos_by_feed, feed_titles, quiet), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def serve_cache_version(user):
+    # Resolved durations only ever add to metadata_cache, so its size tells when one came in
+    return server_generation, server_seen_generation.get(user, 0), len(metadata_cache)
+
+def server_changed(user=None):
+    """Invalidates cached API answers: all of them, or those of one user after a seen change."""
+    global server_generation
+    if user is None:
+        server_generation += 1
+    server_seen_generation[user] = server_seen_generation.get(user, 0) + 1
+
+async def records_for(videos, user):
+    """JSON records of videos, with the durations known by now and the user's seen flags."""
+    update_from_metadata([v for v in videos if v.seconds is None])
+    seen = await get_seen_among([v.id for v in videos], user)
+    records = []
+    for v in videos:
+        record = video_record(v)
+        record['is_seen'] = v.id in seen
+        records.append(record)
+    return records
+
+async def serve_refresh(state, force=False):
+    """Refreshes the due feeds (all if forced), or waits for the refresh that is already running."""
+    if state['refresh'] is None:
+        state['refresh'] = asyncio.ensure_future(_serve_refresh(state, force))
+    return await asyncio.shield(state['refresh'])
+
+async def _serve_refresh(state, force):
+    try:
+        # Re-read every time, so `ytrss import` on the server's host takes effect
+        feeds = state['feeds'] = load_feeds_from_opml()
+        videos_by_feed, feed_titles = state['videos_by_feed'], state['feed_titles']
+        for url in set(videos_by_feed) - set(feeds):
+            del videos_by_feed[url]
+        resolved = await refresh_feeds(feeds, feeds if force else due_feeds(feeds))
+        added = await apply_refresh(resolved, videos_by_feed, feed_titles)
+        await db_flush()
+        state['channels'] = group_videos(videos_by_feed, feed_titles)
+        count_unread(state['channels'])
+        state['summary'] = feed_status_summary(feeds)
+        server_changed()
+        return added
+    finally:
+        state['refresh'] = None
+
+def make_server_app(state, token=None):
+    """The aiohttp app of `ytrss serve`; the README lists the endpoints."""
+    import hmac
+    from aiohttp import web
+
+    def request_user(request):
+        user = request.headers.get("X-Ytrss-User") or request.query.get("user") or None
+        if user is not None and not SERVE_USER_RE.fullmatch(user):
+            raise web.HTTPBadRequest(text="invalid user name")
+        return user
+
+    def int_param(request, name, default, maximum=None):
+        try:
+            value = int(request.query.get(name, default))
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"{name} must be a number")
+        if value < 0:
+            raise web.HTTPBadRequest(text=f"{name} must not be negative")
+        return min(value, maximum) if maximum is not None else value
+
+    async def read_json(request):
+        try:
+            data = await request.json() if request.can_read_body else {}
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise web.HTTPBadRequest(text="expected a JSON object")
+        return data
+
+    def json_response(data, status=200):
+        return web.json_response(data, status=status, dumps=lambda o: json.dumps(o, ensure_ascii=False))
+
+    async def cached(request, build):
+        """Answers a GET from the cache while nothing it depends on has changed."""
+        user = request_user(request)
+        key = (user, request.path_qs)
+        version = serve_cache_version(user)
+        entry = _serve_cache.pop(key, None)
+        if entry is None or entry[0] != version:
+            body = json.dumps(await build(user), ensure_ascii=False).encode('utf-8')
+            entry = (version, f'"{hashlib.sha1(body).hexdigest()[:20]}"', body)
+        # Re-inserted at the end, so the first key is always the least recently used
+        _serve_cache[key] = entry
+        while len(_serve_cache) > SERVE_CACHE_ENTRIES:
+            del _serve_cache[next(iter(_serve_cache))]
+        _, etag, body = entry
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", charset="utf-8", headers=headers)
+
+    @web.middleware
+    async def check_token(request, handler):
+        if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            raise web.HTTPUnauthorized(text="missing or wrong token")
+        return await handler(request)
+
+    async def status(request):
+        return json_response({'feeds': len(state['feeds']), 'refreshing': state['refresh'] is not None,
+                              'summary': state['summary']})
+
+    async def snapshot(request):
+        async def build(user):
+            videos_by_feed, feed_titles = state['videos_by_feed'], state['feed_titles']
+            return {'feeds': [{'url': url, 'title': feed_titles[url], 'status': feed_status.get(url, ""),
+                               'failing': feed_failing(url), 'videos': await records_for(videos_by_feed[url], user)}
+                              for url in state['feeds'] if url in videos_by_feed]}
+        return await cached(request, build)
+
+    async def channels(request):
+        async def build(user):
+            names = sorted(state['channels'])
+            seen = await get_seen_among([v.id for name in names for v in state['channels'][name]], user)
+            failing = {state['feed_titles'][url] for url in state['feeds']
+                       if url in state['feed_titles'] and feed_failing(url)}
+            return {'channels': [{'name': name, 'failing': name in failing,
+                                  'unread': sum(1 for v in state['channels'][name] if v.id not in seen)}
+                                 for name in names]}
+        return await cached(request, build)
+
+    async def videos(request):
+        offset = int_param(request, "offset", 0)
+        limit = int_param(request, "limit", ALL_VIDEOS_PAGE_SIZE, SERVE_PAGE_LIMIT)
+        name = request.query.get("channel")
+        if name is not None and name not in state['channels']:
+            raise web.HTTPNotFound(text="no such channel")
+        async def build(user):
+            source = state['channels'][name] if name is not None else newest_first(state['channels'].values())
+            page = list(itertools.islice(source, offset, offset + limit + 1))
+            return {'videos': await records_for(page[:limit], user), 'has_more': len(page) > limit}
+        return await cached(request, build)
+
+    async def search(request):
+        offset = int_param(request, "offset", 0)
+        limit = int_param(request, "limit", SEARCH_PAGE_SIZE, SERVE_PAGE_LIMIT)
+        try:
+            words, filters = parse_search_terms(request.query.get("q", ""))
+            # Filters can also come as parameters, already parsed (what the --server client sends)
+            for key in ("channel", "shorts", "seen"):
+                filters[key] = request.query.get(key, filters[key])
+            for key in ("since", "until", "min_seconds", "max_seconds"):
+                if key in request.query:
+                    filters[key] = int(request.query[key])
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        async def build(user):
+            page = await search_videos(words, filters, limit + 1, offset, user)
+            return {'videos': [video_record(v) for v in page[:limit]], 'has_more': len(page) > limit}
+        return await cached(request, build)
+
+    async def playlists(request):
+        if request.method == "POST":
+            name = str((await read_json(request)).get('name', "")).strip()
+            if not name:
+                raise web.HTTPBadRequest(text="name missing")
+            if not await create_playlist(name):
+                return json_response({'error': f"A playlist named '{name}' already exists."}, 409)
+            server_changed()
+            return json_response({'created': name}, 201)
+        async def build(user):
+            return {'playlists': [{'id': pl_id, 'name': name, 'count': count, 'system': bool(is_system)}
+                                  for pl_id, name, count, is_system in await get_playlists()]}
+        return await cached(request, build)
+
+    async def playlist(request):
+        playlist_id = int(request.match_info["id"])
+        deleted = await delete_playlist(playlist_id)
+        if deleted is None:
+            raise web.HTTPInternalServerError(text="could not delete the playlist")
+        if not deleted:
+            if any(pl_id == playlist_id for pl_id, _, _, _ in await get_playlists()):
+                raise web.HTTPForbidden(text="system playlists can't be deleted")
+            raise web.HTTPNotFound(text="no such playlist")
+        server_changed()
+        return json_response({'deleted': playlist_id})
+
+    async def playlist_videos(request):
+        playlist_id = int(request.match_info["id"])
+        if request.method == "POST":
+            record = await read_json(request)
+            if not record.get('id'):
+                raise web.HTTPBadRequest(text="video missing")
+            if not await add_to_playlist(playlist_id, video_from_record(record)):
+                raise web.HTTPInternalServerError(text="could not add the video")
+            server_changed()
+            return json_response({'added': record['id']})
+        limit = int_param(request, "limit", PLAYLIST_PAGE_SIZE, SERVE_PAGE_LIMIT)
+        after = (request.query["after"], request.query.get("after_id", "")) if "after" in request.query else None
+        async def build(user):
+            page = await get_playlist_videos(playlist_id, after, limit, user)
+            return {'videos': [video_record(v) for v in page], 'has_more': len(page) == limit}
+        return await cached(request, build)
+
+    async def playlist_item(request):
+        video_id = request.match_info["video_id"]
+        if not await remove_from_playlist(int(request.match_info["id"]), video_id):
+            raise web.HTTPInternalServerError(text="could not remove the video")
+        server_changed()
+        return json_response({'removed': video_id})
+
+    async def seen(request):
+        user = request_user(request)
+        ids = (await read_json(request)).get('ids') or []
+        marked = mark_ids_as_seen([str(video_id) for video_id in ids], user)
+        await db_flush()
+        server_changed(user)
+        return json_response({'marked': marked})
+
+    async def refresh(request):
+        added = await serve_refresh(state, bool((await read_json(request)).get('all')))
+        return json_response({'summary': state['summary'], 'new_videos': len(added)})
+
+    async def metadata(request):
+        """Queues duration lookups for the given IDs first; waits up to `wait` seconds for them."""
+        data = await read_json(request)
+        ids = [str(video_id) for video_id in data.get('ids') or []]
+        items = [(video_id, video_index[video_id].link if video_id in video_index else watch_url(video_id))
+                 for video_id in ids if video_id not in metadata_cache]
+        if items:
+            await prioritize_metadata_jobs(items)
+            try:
+                wait = min(float(data.get('wait') or 0), METADATA_MENU_WAIT)
+            except (TypeError, ValueError):
+                raise web.HTTPBadRequest(text="wait must be a number")
+            if wait > 0:
+                lookup = asyncio.ensure_future(resolve_metadata(
+                    [item for item in items if not metadata_backing_off(item[0])]))
+                await asyncio.wait({lookup}, timeout=wait)
+        return json_response({'metadata': {video_id: metadata_cache[video_id]
+                                           for video_id in ids if video_id in metadata_cache}})
+
+    app = web.Application(middlewares=[check_token])
+    app.router.add_get("/api/status", status)
+    app.router.add_get("/api/snapshot", snapshot)
+    app.router.add_get("/api/channels", channels)
+    app.router.add_get("/api/videos", videos)
+    app.router.add_get("/api/search", search)
+    app.router.add_route("GET", "/api/playlists", playlists)
+    app.router.add_route("POST", "/api/playlists", playlists)
+    app.router.add_delete(r"/api/playlists/{id:\d+}", playlist)
+    app.router.add_route("GET", r"/api/playlists/{id:\d+}/videos", playlist_videos)
+    app.router.add_route("POST", r"/api/playlists/{id:\d+}/videos", playlist_videos)
+    app.router.add_delete(r"/api/playlists/{id:\d+}/videos/{video_id}", playlist_item)
+    app.router.add_post("/api/seen", seen)
+    app.router.add_post("/api/refresh", refresh)
+    app.router.add_post("/api/metadata", metadata)
+    return app
+
+def bare_video_id(video_id):
+    return video_id[9:] if video_id.startswith("yt:video:") else video_id
+
+def watch_url(video_id):
+    return f"https://www.youtube.com/watch?v={bare_video_id(video_id)}"
+
+class Video:
+    """One video, the same record for feed lists, DB pages and menus.
+
+    published is in epoch seconds and seconds is the duration; either is
+    None while unknown. Channel names and feed URLs are interned, and the
+    link is only stored when it isn't the video's plain watch URL.
+    """
+    __slots__ = ('id', 'title', 'channel', 'published', 'seconds', 'is_seen', 'is_shorts',
+                 'feed_url', 'added_at', '_link', 'row', 'row_key')
+
+    def __init__(self, video_id, title, link, published, channel, is_shorts=False, is_seen=False,
+                 seconds=None, feed_url=None, added_at=None):
+        self.id = video_id
+        self.title = title
+        self.channel = sys.intern(channel) if channel else channel
+        self.published = published
+        self.seconds = seconds
+        self.is_seen = is_seen
+        self.is_shorts = is_shorts
+        self.feed_url = sys.intern(feed_url) if feed_url else feed_url
+        self.added_at = added_at
+        self._link = None if link == watch_url(video_id) else link
+        self.row = self.row_key = None
+
+    @property
+    def link(self):
+        return self._link or watch_url(self.id)
+
+    @property
+    def duration(self):
+        """The duration the way the menus and `ytrss list` show it."""
+        return format_duration(self.seconds) if self.seconds is not None else "??:??"
+
+    def __repr__(self):
+        return f"Video({self.id!r}, {self.title!r})"
+
+published_key = operator.attrgetter('published')
+
+def parse_published(text):
+    """Parses an ISO date string from the DB into epoch seconds, or None."""
+    try:
+        return int(datetime.fromisoformat(text).timestamp())
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+def format_published(published):
+    """Formats epoch seconds for the date column."""
+    try:
+        if published is not None:
+            return datetime.fromtimestamp(published).strftime("%m-%d %H:%M")
+    except (ValueError, OverflowError, OSError):
+        pass
+    return "??-?? ??:??"
+
+def video_row(v):
+    """Returns the menu row for a video, built on first display and again when its flags or duration change."""
+    key = (v.is_seen, v.is_shorts, v.seconds)
+    if v.row_key != key:
+        seen_mark = "✔" if v.is_seen else " "
+        shorts_mark = "[SHORTS] " if v.is_shorts else ""
+        v.row = (f"[{seen_mark}] {format_published(v.published)}  {v.duration:<6}  "
+                 f"{(v.channel or '')[:12]:<12}  {shorts_mark}{clean_title(v.title)}")
+        v.row_key = key
+    return v.row
+
+def make_video(vid_id, title, link, published, channel, is_shorts, is_seen):
+    meta = metadata_cache.get(vid_id)
+    return Video(vid_id, title, link, published, channel,
+                 is_shorts or bool(meta and meta['is_shorts']), is_seen, meta['seconds'] if meta else None)
+
+def update_from_metadata(videos):
+    """Copies durations resolved since the videos were loaded onto them."""
+    for v in videos:
+        meta = metadata_cache.get(v.id)
+        if meta:
+            v.seconds = meta['seconds']
+            if meta['is_shorts']:
+                v.is_shorts = True
+
+def count_unread(all_videos_by_channel):
+    """Recounts unread videos per channel. Only needed after the lists change."""
+    global unread_total
+    unread_by_channel.clear()
+    video_index.clear()
+    video_group.clear()
+    for name, videos in all_videos_by_channel.items():
+        unread_by_channel[name] = sum(1 for v in videos if not v.is_seen)
         for v in videos:
-            # Handle date format (RSS struct_time vs DB string)
-            if isinstance(v['published'], str):
-                try:
-                    dt_obj = datetime.fromisoformat(v['published'])
-                    dt = dt_obj.strftime("%m-%d %H:%M")
-                except:
-                    dt = "??-?? ??:??"
-            else:
+            video_index[v.id] = v
+            video_group[v.id] = name
+    unread_total = sum(unread_by_channel.values())
+
+def mark_video_seen(video):
+    """Marks a video as seen and keeps the unread counters in step."""
+    global unread_total
+    # A playlist row is a separate record from the feed row for the same video
+    feed_video = video_index.get(video.id)
+    if feed_video is not None and not feed_video.is_seen:
+        feed_video.is_seen = True
+        # Not feed_video.channel: older rows keep the name the channel had when they were stored
+        unread_by_channel[video_group[video.id]] -= 1
+        unread_total -= 1
+    if not video.is_seen or feed_video is video:
+        video.is_seen = True
+        mark_as_seen(video.id)
+
+def merge_feeds(resolved, videos_by_feed, feed_titles, seen_ids):
+    """Merges freshly resolved feeds into the in-memory lists.
+
+    Only entries that aren't known yet become new videos and get stored, so
+    existing rows are only touched to fill in a Shorts probe that had no
+    answer when they were stored. Returns the new videos.
+    """
+    added = []
+    for url, (ch_name, entries) in resolved.items():
+        feed_titles[url] = ch_name
+        existing = videos_by_feed.get(url, [])
+        known = {v.id: v for v in existing}
+
+        new_videos = []
+        descriptions = {}
+        unprobed = set()
+        for vid_id, title, link, published, summary, vertical in entries:
+            check = shorts_checks.pop(vid_id, None)
+            if vid_id in known:
+                if check is not None:
+                    known[vid_id].is_shorts = known[vid_id].is_shorts or check
+                    db_write(SQL_SET_SHORTS, (check, vid_id))
+                continue
+            if not published:
+                continue
+            is_shorts = feed_says_shorts(title, summary, vertical) or check
+            if is_shorts is None and vid_id.startswith("yt:video:") and vid_id not in metadata_cache:
+                unprobed.add(vid_id)
+            new_videos.append(make_video(vid_id, title, link, published, ch_name, bool(is_shorts), vid_id in seen_ids))
+            descriptions[vid_id] = summary
+
+        if new_videos:
+            store_videos(url, new_videos, descriptions, unprobed)
+            merged = existing + new_videos
+            merged.sort(key=published_key, reverse=True)
+            videos_by_feed[url] = merged[:SNAPSHOT_CHANNEL_LIMIT]
+            added.extend(new_videos)
+        else:
+            videos_by_feed[url] = existing
+    return added
+
+async def apply_refresh(resolved, videos_by_feed, feed_titles):
+    """Merges a finished refresh and queues metadata lookups for the new videos."""
+    await sync_seen_prefilter()
+    seen_ids = await get_seen_among(vid_id for _, entries in resolved.values() for vid_id, *_ in entries)
+    added = merge_feeds(resolved, videos_by_feed, feed_titles, seen_ids)
+    enqueue_metadata_jobs([(v.id, v.link) for v in added
+                           if v.seconds is None and v.id not in metadata_failures])
+    await update_mix_output(added)
+    return added
+
+def newest_first(lists):
+    """Lazily merges newest-first video lists into one newest-first iterator."""
+    return heapq.merge(*lists, key=published_key, reverse=True)
+
+def group_videos(videos_by_feed, feed_titles):
+    """Builds the per-channel lists the menus show, newest first.
+
+    Feed lists are already newest-first, so a channel with one feed shares
+    its feed's list; feeds with the same title are merged.
+    """
+    feeds_by_channel = {}
+    for url, videos in videos_by_feed.items():
+        feeds_by_channel.setdefault(feed_titles[url], []).append(videos)
+    return {name: lists[0] if len(lists) == 1 else list(newest_first(lists))
+            for name, lists in feeds_by_channel.items()}
+
+def all_videos_pager(all_videos_by_channel):
+    """Returns a loader that yields (page, has_more) for successive pages of the "ALL VIDEOS" mix."""
+    merged = newest_first(list(all_videos_by_channel.values()))
+    pending = []
+    async def load_page():
+        page = pending + list(itertools.islice(merged, ALL_VIDEOS_PAGE_SIZE + 1 - len(pending)))
+        pending[:] = page[ALL_VIDEOS_PAGE_SIZE:]
+        return page[:ALL_VIDEOS_PAGE_SIZE], bool(pending)
+    return load_page
+
+# The shim, the terminfo lookups and BackgroundMenu below reach into
+# simple_term_menu internals, which only the pinned release is known to have
+MENU_CLASS_INTERNALS = ("_query_terminfo_database", "_codename_to_capname", "_num_lines", "_num_cols",
+                        "_read_next_key", "_paint_menu")
+MENU_INSTANCE_INTERNALS = ("_menu_entries", "_shortcut_keys", "_preview_arguments", "_skip_indices",
+                           "_title_lines", "_view", "_search", "_tty_in", "_reading_next_key",
+                           "_paint_before_next_read")
+
+def check_menu_internals(obj, names):
+    missing = [name for name in names if not hasattr(obj, name)]
+    if missing:
+        raise RuntimeError(f"Unsupported simple-term-menu {getattr(simple_term_menu, '__version__', '?')} "
+                           f"(missing {', '.join(missing)}); install the version in requirements.txt")
+
+check_menu_internals(TerminalMenu, MENU_CLASS_INTERNALS)
+
+class _MenuSignalShim:
+    """Stands in for the signal module inside simple_term_menu.
+
+    TerminalMenu.show() installs a SIGWINCH handler, which Python only allows
+    on the main thread. For menus shown from a worker thread the handler is
+    kept here and called from the event loop's SIGWINCH handler instead.
+    """
+    SIGWINCH = signal.SIGWINCH
+    SIG_DFL = signal.SIG_DFL
+
+    def __init__(self):
+        self.winch_handler = None
+
+    def signal(self, signum, handler):
+        if threading.current_thread() is threading.main_thread():
+            return signal.signal(signum, handler)
+        self.winch_handler = handler if callable(handler) else None
+
+    def on_winch(self):
+        if self.winch_handler is not None:
+            self.winch_handler(signal.SIGWINCH, None)
+
+_menu_signals = _MenuSignalShim()
+simple_term_menu.signal = _menu_signals
+
+# simple_term_menu runs `tput` once per terminal capability before the first
+# menu (~40 processes) and `tput cols` on every redraw. The lookups below
+# answer the same questions in-process through curses, falling back to tput.
+# They replace private TerminalMenu methods, so simple-term-menu is pinned
+# (requirements.txt, build.sh).
+_tput_query = TerminalMenu._query_terminfo_database
+_terminfo_cache = {}
+_TERMINFO_PADDING_RE = re.compile(r'\$<[\d.*/]*>')
+
+def _read_terminfo(capname):
+    import curses
+    if not _terminfo_cache:
+        curses.setupterm()
+    name, *params = capname.split()
+    if name == "colors":
+        return str(curses.tigetnum(name))
+    value = curses.tigetstr(name)
+    if value is None:
+        return ""  # Capability missing, which tput reports the same way
+    if params:
+        value = curses.tparm(value, *map(int, params))
+    if name == "clear":
+        value += curses.tigetstr("E3") or b""  # tput clears the scrollback too
+    return _TERMINFO_PADDING_RE.sub("", value.decode())
+
+def query_terminfo(cls, codename):
+    capname = cls._codename_to_capname.get(codename, codename)
+    value = _terminfo_cache.get(capname)
+    if value is None:
+        try:
+            value = _read_terminfo(capname)
+        except Exception:
+            value = _tput_query(codename)
+        _terminfo_cache[capname] = value
+    return value
+
+TerminalMenu._query_terminfo_database = classmethod(query_terminfo)
+TerminalMenu._num_lines = classmethod(lambda cls: shutil.get_terminal_size().lines)
+TerminalMenu._num_cols = classmethod(lambda cls: shutil.get_terminal_size().columns)
+
+class BackgroundMenu(TerminalMenu):
+    """A TerminalMenu that can be shown from a worker thread with show_menu().
+
+    Key reads also watch a wake-up pipe so the event loop can interrupt the
+    menu, e.g. for Ctrl-C, which is delivered to the main thread, or hand
+    it new rows with update(). data travels with the rows: after show()
+    it belongs to the rows the choice was made from.
+    """
+
+    def __init__(self, *args, data=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        check_menu_internals(self, MENU_INSTANCE_INTERNALS)
+        self.data = data
+        self._wake_r, self._wake_w = os.pipe()
+        self._pending = None
+        self._pending_lock = threading.Lock()
+
+    def wake(self):
+        os.write(self._wake_w, b"\0")
+
+    def update(self, entries, title=None, data=None):
+        """Replaces the rows (and title, if it has as many lines) while the menu is open."""
+        # Parsed here with the same rules as the constructor, off the menu thread
+        parsed = TerminalMenu(entries)
+        with self._pending_lock:
+            self._pending = (parsed, tuple(title.split("\n")) if title is not None else None, data)
+        os.write(self._wake_w, b"u")
+
+    def close(self):
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def _apply_update(self):
+        with self._pending_lock:
+            parsed, title_lines, self.data = self._pending
+            self._pending = None
+        active = self._view.active_menu_index
+        active_entry = self._menu_entries[active] if active is not None else None
+        for name in ("_menu_entries", "_shortcut_keys", "_preview_arguments", "_skip_indices"):
+            getattr(self, name)[:] = getattr(parsed, name)
+        if title_lines is not None and len(title_lines) == len(self._title_lines):
+            self._title_lines = title_lines
+        self._view._menu_entries = list(self._menu_entries)
+        # Re-runs the search over the new rows and rebuilds the view
+        self._search.search_text = self._search.search_text
+        if active is not None and self._menu_entries:
+            # Stay on the same row if it's still there
+            try:
+                active = self._menu_entries.index(active_entry)
+            except ValueError:
+                active = min(active, len(self._menu_entries) - 1)
+            if self._view.convert_menu_index_to_displayed_index(active) is not None:
+                self._view.active_menu_index = active
+
+    def _read_next_key(self, ignore_case=True):
+        self._reading_next_key = True
+        if self._paint_before_next_read:
+            self._paint_menu()
+            self._paint_before_next_read = False
+        while True:
+            ready, _, _ = select.select([self._tty_in.fileno(), self._wake_r], [], [])
+            if self._wake_r not in ready:
+                return super()._read_next_key(ignore_case)
+            if b"\0" in os.read(self._wake_r, 64):
+                self._reading_next_key = False
+                raise KeyboardInterrupt
+            if self._pending is not None:
+                self._apply_update()
+                self._paint_menu()
+
+async def show_menu(menu, live=None):
+    """Shows a BackgroundMenu in a worker thread so background tasks keep running.
+
+    live, if given, is awaited every MENU_LIVE_INTERVAL while the menu is
+    open; when it returns (entries, title, data) the menu is redrawn with them.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(outcome, value):
+        # A cancelled show_menu has cancelled future along with itself
+        if not future.done():
+            outcome(value)
+
+    def show():
+        try:
+            result = menu.show()
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(settle, future.set_result, result)
+
+    # Daemon thread: a menu blocked on the tty must never keep the process alive
+    thread = threading.Thread(target=show, name="ytrss-menu", daemon=True)
+    loop.add_signal_handler(signal.SIGINT, menu.wake)
+    loop.add_signal_handler(signal.SIGWINCH, _menu_signals.on_winch)
+    try:
+        thread.start()
+        while live is not None and not future.done():
+            await asyncio.wait({future}, timeout=MENU_LIVE_INTERVAL)
+            if not future.done():
                 try:
-                    dt = datetime(*v['published'][:6]).strftime("%m-%d %H:%M")
-                except:
-                    dt = "??-?? ??:??"
+                    changed = await live()
+                except BaseException:
+                    # Closing the menu first, so its thread doesn't outlive the pipes
+                    menu.wake()
+                    await asyncio.wait({future})
+                    raise
+                if changed is not None:
+                    menu.update(*changed)
+        return await future
+    finally:
+        # Cancelled while the menu is open: it has to leave show(), which
+        # restores the terminal, before anything else writes to it
+        if thread.is_alive():
+            menu.wake()
+            thread.join(MENU_CLOSE_TIMEOUT)
+        loop.remove_signal_handler(signal.SIGINT)
+        loop.remove_signal_handler(signal.SIGWINCH)
+        # A menu that is somehow still reading keeps its pipes
+        if not thread.is_alive():
+            menu.close()
 
-            seen_mark = "✔" if v['is_seen'] else " "
-            shorts_mark = "[SHORTS] " if v.get('is_shorts') else ""
-            duration = v.get('duration', '??:??')
-            
-            safe_title = clean_title(v['title'])
-            
-            entry = f"[{seen_mark}] {dt}  {duration:<6}  {v['channel'][:12]:<12}  {shorts_mark}{safe_title}"
-            menu_entries.append(entry)
-        
-        menu_entries.append("[Go back]")
-        
+def video_menu_entries(videos, has_more=False):
+    entries = [video_row(v) for v in videos]
+    if has_more:
+        entries.append("[Load more]")
+    entries.append("[Go back]")
+    return entries
+
+async def choose_playlist_ui(playlists, title):
+    """Lets the user pick one of the given playlist rows. Returns the row or None."""
+    names = [f"{name} ({count})" for _, name, count, _ in playlists]
+    names.append("[Cancel]")
+    idx = await show_menu(BackgroundMenu(names, title=title))
+    if idx is None or idx >= len(playlists):
+        return None
+    return playlists[idx]
+
+def notify(text):
+    """Shows text on the next menu drawn, instead of pausing so it can be read."""
+    global menu_notice
+    menu_notice = text
+
+def take_notice():
+    global menu_notice
+    text, menu_notice = menu_notice, ""
+    return text
+
+async def request_metadata(videos):
+    """Queues duration lookups for videos about to be shown, and starts on the first rows now."""
+    missing = [v for v in videos if v.seconds is None]
+    if not missing:
+        return
+    # Let the background queue work on this list first
+    await prioritize_metadata_jobs([(v.id, v.link) for v in missing])
+    to_fetch = [(v.id, v.link) for v in missing[:40] if not metadata_backing_off(v.id)]
+    if to_fetch:
+        # Not awaited: open menus show the durations as they come in
+        asyncio.ensure_future(resolve_metadata(to_fetch))
+
+def play_video(link):
+    subprocess.run(["wl-copy", link])
+    subprocess.run([QUICKTUBE_CMD])
+
+async def show_video_menu(videos, playlist_id=None, load_more=None):
+    """Shows a list of videos. load_more, if given, returns (page, has_more) for the next page.
+
+    The list opens straight away. Durations, seen marks and Shorts found
+    through their durations update on screen while it is open.
+    """
+    global SHOW_SHORTS
+
+    videos = list(videos)
+    await request_metadata(videos)
+    has_more = load_more is not None
+    notice = ""
+    shown_rows = None
+
+    def view():
+        """Returns (rows, title, the videos the rows are for)."""
+        update_from_metadata([v for v in videos if v.seconds is None])
+        shown = [v for v in videos if SHOW_SHORTS or not v.is_shorts]
         title_suffix = "(Shorts hidden)" if not SHOW_SHORTS else ""
-        menu_title = f"Select video {title_suffix} (Press '/' to search, 'l' for Watch Later, 'b' for Browser)"
-        if playlist_name:
-             menu_title += ", 'd' to remove"
+        title = f"Select video {title_suffix} (Press '/' to search, 'l' for Watch Later, 'p' for playlist, 'b' for Browser)"
+        if playlist_id is not None:
+            title += ", 'd' to remove"
+        return video_menu_entries(shown, has_more), f"{title}\n{notice}", shown
+
+    async def live():
+        nonlocal shown_rows
+        rows, title, shown = view()
+        if (rows, title) == shown_rows:
+            return None
+        shown_rows = rows, title
+        return rows, title, shown
+
+    current_cursor_index = 0
+    while True:
+        rows, title, shown = view()
+        if not shown and not has_more:
+            if videos:
+                notify("No videos to show (Shorts are hidden).")
+            break
+        shown_rows = rows, title
 
-        menu = TerminalMenu(
-            menu_entries, 
-            title=menu_title,
+        menu = BackgroundMenu(
+            rows,
+            title=title,
             search_key="/",
             cursor_index=current_cursor_index,
-            accept_keys=["enter", "l", "d", "b"]
+            accept_keys=["enter", "l", "p", "d", "b"],
+            data=shown
         )
-        idx = menu.show()
-        
-        if idx is None or idx == len(videos):
+        idx = await show_menu(menu, live)
+        # The rows the choice was made from, which may have changed while the menu was open
+        shown = menu.data
+
+        if idx is None or idx == len(shown) + has_more:
             break
-        
+
         # Preserve cursor position
         current_cursor_index = idx
-        video = videos[idx]
+        notice = ""
+        if idx == len(shown):
+            page, has_more = await load_more()
+            await request_metadata(page)
+            videos.extend(page)
+            continue
+
+        video = shown[idx]
         key = menu.chosen_accept_key
 
         if key == 'b':
-            print(f"Opening in browser: {video['title']}")
-            webbrowser.open(video['link'])
-            mark_as_seen(video['id'], video['title'])
-            video['is_seen'] = True
-            await asyncio.sleep(0.5)
+            import webbrowser
+            await asyncio.to_thread(webbrowser.open, video.link)
+            mark_video_seen(video)
+            notice = f"Opened in browser: {video.title}"
             continue
 
         if key == 'l':
-            if add_to_playlist("Watch Later", video):
-                print(f"Added '{video['title'][:30]}...' to Watch Later.")
+            if await add_to_playlist(watch_later_id, video):
+                notice = f"Added '{video.title[:30]}...' to Watch Later."
             else:
-                print("Failed to add to Watch Later.")
-            await asyncio.sleep(0.5)
+                notice = "Failed to add to Watch Later."
+            continue
+
+        if key == 'p':
+            target = await choose_playlist_ui(await get_playlists(), "Add to playlist:")
+            if target is not None:
+                if await add_to_playlist(target[0], video):
+                    notice = f"Added '{video.title[:30]}...' to {target[1]}."
+                else:
+                    notice = f"Failed to add to {target[1]}."
             continue
             
-        if key == 'd' and playlist_name:
-            if remove_from_playlist(playlist_name, video['id']):
-                print("Removed from playlist.")
-                del videos[idx]
+        if key == 'd' and playlist_id is not None:
+            if await remove_from_playlist(playlist_id, video.id):
+                notice = "Removed from playlist."
+                videos.remove(video)
                 if not videos: break # List empty
-                if current_cursor_index >= len(videos):
-                    current_cursor_index = len(videos) - 1
+                if current_cursor_index >= len(shown) - 1:
+                    current_cursor_index = max(len(shown) - 2, 0)
             else:
-                print("Could not remove.")
-            await asyncio.sleep(0.5)
+                notice = "Could not remove."
             continue
 
         # Enter = Play
-        mark_as_seen(video['id'], video['title'])
-        video['is_seen'] = True
+        mark_video_seen(video)
         
-        print(f"Starting QuickTube for: {video['title']}")
+        print(f"Starting QuickTube for: {video.title}")
         try:
-            subprocess.run(["wl-copy", video['link']])
-            subprocess.run([QUICKTUBE_CMD])
+            await asyncio.to_thread(play_video, video.link)
         except Exception as e:
-            print(f"Error launching: {e}")
+            notice = f"Error launching: {e}"
+
+async def show_playlist(playlist_id, name):
+    load_page = playlist_pager(playlist_id)
+    videos, has_more = await load_page()
+    if not videos:
+        notify(f"{name} is empty.")
+        return
+    await show_video_menu(videos, playlist_id=playlist_id, load_more=load_page if has_more else None)
+
+async def show_search():
+    """Asks for a query and shows the ranked matches from the whole video history."""
+    print(SEARCH_SYNTAX)
+    text = (await asyncio.to_thread(input, "Search: ")).strip()
+    if not text:
+        return
+    try:
+        words, filters = parse_search_terms(text)
+    except ValueError as e:
+        notify(str(e))
+        return
+    load_page = search_pager(words, filters)
+    videos, has_more = await load_page()
+    if not videos:
+        notify("No matches.")
+        return
+    await show_video_menu(videos, load_more=load_page if has_more else None)
+
+async def show_all_videos(all_videos_by_channel):
+    """Shows every channel's videos mixed newest first, a page at a time."""
+    load_page = all_videos_pager(all_videos_by_channel)
+    videos, has_more = await load_page()
+    if not videos:
+        notify("No videos yet.")
+        return
+    await show_video_menu(videos, load_more=load_page if has_more else None)
+
+async def load_state():
+    """Opens the DB and loads the caches every command needs."""
+    global metadata_cache, watch_later_id, feed_schedule
+    await init_db()
+    watch_later_id = next(pl_id for pl_id, _, _, is_system in await get_playlists() if is_system)
+    await init_seen_prefilter()
+    metadata_cache = await get_cached_metadata()
+    metadata_failures.update(await get_metadata_failures())
+    feed_schedule = await get_feed_schedule()
+
+def build_main_menu(playlists, channel_names, stale_channels, refreshing):
+    """Returns the main menu rows and {row index: (playlist id, name)}."""
+    menu_options = []
+
+    # --- PLAYLISTS ---
+    playlist_rows = {}
+    menu_options.append("--- PLAYLISTS ---")
+    for number, (pl_id, name, count, _) in enumerate(playlists, 1):
+        playlist_rows[len(menu_options)] = (pl_id, name)
+        shortcut = f"[{number}] " if number <= 9 else "    "
+        menu_options.append(f"{shortcut}{name} ({count})")
+
+    menu_options.append(f"--- ALL VIDEOS ({unread_total} new) ---")
+
+    for name in channel_names:
+        stale_mark = " [!]" if name in stale_channels else ""
+        menu_options.append(f"{name} ({unread_by_channel[name]}){stale_mark}")
+
+    menu_options.extend([
+        "-" * 30,
+        "[/] Search",
+        "[h] Search all videos",
+        "[r] Refresh feeds (running...)" if refreshing else "[r] Refresh feeds",
+        "[f] Refresh all feeds",
+        "[a] Add channel",
+        "[d] Delete channel",
+        "[n] New playlist",
+        "[x] Delete playlist",
+        "[m] Mark all as seen",
+        "[?] Help",
+        "[q] Quit"
+    ])
+    return menu_options, playlist_rows
 
 async def main_async():
-    global duration_cache, SHOW_SHORTS
+    global SHOW_SHORTS
     
     # Show archive warning before doing anything else
     show_archive_warning()
     
-    init_db()
-    duration_cache = get_cached_metadata()
-    
-    # Main loop to allow refreshing feeds
-    while True:
-        feeds = load_feeds_from_opml()
-        seen_ids = get_seen_videos()
-        
-        if not feeds:
-            print("\nNo channels found. [a] Add channel.")
-        
-        all_videos_by_channel = {}
-        all_videos_flat = []
+    await load_state()
+
+    # Draw the menu straight from the last-known snapshot and refresh in the background
+    feeds = load_feeds_from_opml()
+    videos_by_feed, feed_titles = await load_snapshot(feeds)
+    all_videos_by_channel = group_videos(videos_by_feed, feed_titles)
+    count_unread(all_videos_by_channel)
+    stale_channels = set()
+    refresh_summary = ""
+    refresh_task, refreshing = start_refresh(feeds)
+    requested_refresh = None  # "due" or "all" once the user asks for another refresh
+    shown_pending = 0  # refresh_pending when the main menu was last rendered
+    notice = ""
+    start_metadata_prefetch()
 
+    if not feeds:
+        notify("No channels found. [a] Add channel.")
+    elif not videos_by_feed:
+        # Nothing stored yet (first run): the menu opens once the first feeds are in,
+        # and the rest stream into it
         print("Fetching feeds...")
-        async with aiohttp.ClientSession() as session:
-            tasks = [fetch_feed(session, url) for url in feeds]
-            results = await asyncio.gather(*tasks)
-
-        for xml_data in results:
-            if not xml_data: continue
-            d = feedparser.parse(xml_data)
-            ch_name = d.feed.get('title', 'Unknown')
-            
-            ch_videos = []
-            for entry in d.entries:
-                vid_id = entry.get('id', entry.link)
-                title = entry.title
-                
-                is_shorts = "#shorts" in title.lower() or "#shorts" in entry.get('summary', '').lower()
-                    
-                v = {
-                    'id': vid_id,
-                    'title': title,
-                    'link': entry.link,
-                    'published': entry.get('published_parsed'),
-                    'channel': ch_name,
-                    'is_seen': vid_id in seen_ids,
-                    'is_shorts': is_shorts,
-                    'duration': duration_cache.get(vid_id, "??:??")
-                }
-                
-                if v['duration'] != "??:??":
-                     try:
-                        parts = v['duration'].split(':')
-                        if len(parts) == 2:
-                            m, s = int(parts[0]), int(parts[1])
-                            if m == 0 or (m == 1 and s == 0):
-                                v['is_shorts'] = True
-                                is_shorts = True
-                     except: pass
-
-                if v['published']:
-                    ch_videos.append(v)
-                    all_videos_flat.append(v)
-            
-            all_videos_by_channel[ch_name] = ch_videos
-        
-        all_videos_flat.sort(key=lambda x: x['published'], reverse=True)
+        while not refreshed_feeds and not refresh_task.done():
+            await asyncio.sleep(FIRST_RESULTS_POLL)
 
-        # Menu logic
-        should_refresh = False
+    async def apply_refresh_progress():
+        """Merges the feeds the refresh resolved so far. Returns whether there were any, or it finished."""
+        nonlocal refresh_task, refresh_summary, all_videos_by_channel, stale_channels
+        finished = refresh_task is not None and refresh_task.done()
+        # Feeds a cancelled refresh resolved after their channel was removed are dropped
+        resolved = {url: feed for url, feed in take_refreshed_feeds().items() if url in feeds}
+        if not finished and not resolved:
+            return False
+        if finished:
+            try:
+                refresh_task.result()
+            except Exception as e:
+                refresh_summary = f"Refresh failed: {e}"
+            else:
+                refresh_summary = feed_status_summary(feeds)
+            refresh_task = None
+
+        await apply_refresh(resolved, videos_by_feed, feed_titles)
+        all_videos_by_channel = group_videos(videos_by_feed, feed_titles)
+        count_unread(all_videos_by_channel)
+        stale_channels = {feed_titles[url] for url in feeds if url in feed_titles and feed_failing(url)}
+        return True
+
+    async def main_menu_view():
+        """Returns (rows, title, (rows, playlist rows, playlists, channel names))."""
+        nonlocal shown_pending
+        shown_pending = refresh_pending
+        channel_names = sorted(all_videos_by_channel.keys())
+        playlists = await get_playlists()
+        menu_options, playlist_rows = build_main_menu(playlists, channel_names, stale_channels,
+                                                      refresh_task is not None)
+        # Color indicators for the title
+        shorts_status = f"\033[92mON\033[0m" if SHOW_SHORTS else f"\033[91mOFF\033[0m"
+        if refresh_task is not None and refresh_pending:
+            status = f"Refreshing in the background: {refresh_pending} of {refreshing} feeds pending..."
+        elif refresh_task is not None:
+            status = f"Refreshing {refreshing} of {len(feeds)} feeds in the background..."
+        else:
+            status = refresh_summary
+        title = f"YTRSS (Shorts: {shorts_status})\n{status}\n{notice}"
+        return menu_options, title, (menu_options, playlist_rows, playlists, channel_names)
+
+    async def live():
+        # Feeds that arrive while the menu is open update the channels and counts in place
+        if await apply_refresh_progress() or refresh_pending != shown_pending:
+            return await main_menu_view()
+        return None
+
+    while True:
+        await apply_refresh_progress()
+        if requested_refresh and refresh_task is None:
+            refresh_task, refreshing = start_refresh(feeds, force=requested_refresh == "all")
+            requested_refresh = None
+
+        notice = take_notice()
+        menu_options, title, data = await main_menu_view()
         
-        while not should_refresh:
-            # Update unread count if we marked things as seen
-            
-            channel_names = sorted(all_videos_by_channel.keys())
-            menu_options = []
-            
-            unread_total = len([v for v in all_videos_flat if not v['is_seen']])
+        # What `clear` prints, without starting a shell and a process for every redraw
+        sys.stdout.write("\033[H\033[2J\033[3J")
+        
+        main_menu = BackgroundMenu(
+            menu_options, 
+            title=title,
+            search_key="/",
+            accept_keys=["enter", "s"],
+            data=data
+        )
+        choice_idx = await show_menu(main_menu, live)
+        
+        if choice_idx is None: 
+            sys.exit()
             
-            # --- PLAYLISTS ---
-            wl_count = len(get_playlist_videos("Watch Later"))
-            menu_options.append("--- PLAYLISTS ---")
-            menu_options.append(f"[1] Watch Later ({wl_count})")
+        if main_menu.chosen_accept_key == "s":
+            SHOW_SHORTS = not SHOW_SHORTS
+            continue
 
-            menu_options.append(f"--- ALL VIDEOS ({unread_total} new) ---")
-            
+        # The rows the choice was made from, which may have changed while the menu was open
+        menu_options, playlist_rows, playlists, channel_names = main_menu.data
+        choice_text = menu_options[choice_idx]
+        
+        if choice_idx in playlist_rows:
+            await show_playlist(*playlist_rows[choice_idx])
+        elif choice_text == "[q] Quit":
+            sys.exit()
+        elif choice_text == "[?] Help":
+            await asyncio.to_thread(show_help)
+        elif choice_text == "[/] Search":
+            continue # Selecting this just closes the menu, but search is handled by search_key
+        elif choice_text == "[h] Search all videos":
+            await show_search()
+        elif choice_text == "[n] New playlist":
+            name = (await asyncio.to_thread(input, "Playlist name: ")).strip()
+            if name and not await create_playlist(name):
+                notify(f"A playlist named '{name}' already exists.")
+        elif choice_text == "[x] Delete playlist":
+            target = await choose_playlist_ui([p for p in playlists if not p[3]], "Select playlist to delete:")
+            if target is not None:
+                await delete_playlist(target[0])
+        elif choice_text.startswith("[r] Refresh feeds") or choice_text == "[f] Refresh all feeds":
+            # Started at the top of the loop, after a refresh that just finished is applied
+            if refresh_task is None or refresh_task.done():
+                requested_refresh = "all" if choice_text.startswith("[f]") else "due"
+        elif choice_text == "[m] Mark all as seen":
+            unseen = [v for videos in all_videos_by_channel.values() for v in videos if not v.is_seen] if unread_total else []
+            if unseen:
+                mark_all_as_seen(unseen)
+                for v in unseen:
+                    v.is_seen = True
+                count_unread(all_videos_by_channel)
+            else:
+                notify("No new videos to mark.")
+            # Continue loop to refresh menu numbers
+        elif server_url and choice_text in ("[a] Add channel", "[d] Delete channel"):
+            notify(f"Channels are managed on {server_url}.")
+        elif choice_text == "[a] Add channel":
+            text = await asyncio.to_thread(input, "Paste feed/channel URLs, channel IDs or @handles, or a file to import: ")
+            text = text.strip()
+            if text:
+                path = os.path.expanduser(text)
+                try:
+                    if os.path.isfile(path):
+                        with open(path, encoding='utf-8') as f:
+                            entries = read_subscriptions(f.read())
+                    else:
+                        entries = read_subscriptions("\n".join(text.split()))
+                except (OSError, UnicodeDecodeError, ET.ParseError) as e:
+                    notify(f"Could not read {text}: {e}")
+                    entries = []
+                if entries:
+                    notify(import_summary(await import_subscriptions(entries)))
+            feeds, refresh_task, refreshing = restart_refresh(refresh_task, videos_by_feed)
+        elif choice_text == "[d] Delete channel":
+            await remove_channel_ui()
+            feeds, refresh_task, refreshing = restart_refresh(refresh_task, videos_by_feed)
+            all_videos_by_channel = group_videos(videos_by_feed, feed_titles)
+            count_unread(all_videos_by_channel)
+        elif "--- ALL VIDEOS" in choice_text:
+            await show_all_videos(all_videos_by_channel)
+        elif choice_text.startswith("-"):
+            continue
+        else:
+            found_name = None
             for name in channel_names:
-                unread_count = len([v for v in all_videos_by_channel[name] if not v['is_seen']])
-                menu_options.append(f"{name} ({unread_count})")
-                
-            menu_options.extend([
-                "-" * 30, 
-                "[/] Search",
-                "[r] Refresh feeds",
-                "[a] Add channel", 
-                "[d] Delete channel",
-                "[m] Mark all as seen",
-                "[?] Help",
-                "[q] Quit"
-            ])
-            
-            os.system('clear')
-            
-            # Color indicators for the title
-            shorts_status = f"\033[92mON\033[0m" if SHOW_SHORTS else f"\033[91mOFF\033[0m"
-            print(f"YTRSS (Shorts: {shorts_status})")
+                if choice_text.startswith(name + " ("):
+                    found_name = name
+                    break
             
-            main_menu = TerminalMenu(
-                menu_options, 
-                title=None,
-                search_key="/",
-                accept_keys=["enter", "s"]
-            )
-            choice_idx = main_menu.show()
-            
-            if choice_idx is None: 
-                sys.exit()
-                
-            if main_menu.chosen_accept_key == "s":
-                SHOW_SHORTS = not SHOW_SHORTS
-                continue
+            if found_name and found_name in all_videos_by_channel:
+                await show_video_menu(all_videos_by_channel[found_name])
 
-            choice_text = menu_options[choice_idx]
-            
-            if choice_text == "[q] Quit":
-                sys.exit()
-            elif choice_text == "[?] Help":
-                show_help()
-            elif choice_text == "[/] Search":
-                continue # Selecting this just closes the menu, but search is handled by search_key
-            elif choice_text.startswith("[1] Watch Later"):
-                wl_videos = get_playlist_videos("Watch Later")
-                if not wl_videos:
-                    print("Watch Later is empty.")
-                    await asyncio.sleep(1)
-                else:
-                    # Sync seen status
-                    current_seen = get_seen_videos()
-                    for v in wl_videos:
-                        v['is_seen'] = v['id'] in current_seen
-                    await show_video_menu(wl_videos, playlist_name="Watch Later")
-            elif choice_text == "[r] Refresh feeds":
-                should_refresh = True
-                break
-            elif choice_text == "[m] Mark all as seen":
-                unseen = [v for v in all_videos_flat if not v['is_seen']]
-                if unseen:
-                    print(f"Marking {len(unseen)} videos as seen...")
-                    mark_all_as_seen(unseen)
-                    for v in unseen:
-                        v['is_seen'] = True
-                else:
-                    print("No new videos to mark.")
-                # Continue loop to refresh menu numbers
-            elif choice_text == "[a] Add channel":
-                url = await asyncio.to_thread(input, "Paste RSS URL: ")
-                url = url.strip()
-                if url: add_feed_to_opml(url)
-                should_refresh = True # Update after add
-                break
-            elif choice_text == "[d] Delete channel":
-                remove_channel_ui()
-                should_refresh = True # Update after remove
-                break
-            elif "--- ALL VIDEOS" in choice_text:
-                await show_video_menu(all_videos_flat[:50])
-            elif choice_text.startswith("-"):
-                continue
+# Functions use_server() replaces with their server_<name> versions, which
+# ask a `ytrss serve` daemon instead of the local feeds and DB
+SERVER_FUNCTIONS = [
+    "load_state", "load_feeds_from_opml", "load_snapshot", "start_refresh", "apply_refresh", "feed_failing",
+    "start_metadata_prefetch", "prioritize_metadata_jobs", "resolve_metadata", "mark_ids_as_seen",
+    "get_playlists", "create_playlist", "delete_playlist", "add_to_playlist", "remove_from_playlist",
+    "get_playlist_videos", "search_videos",
+]
+
+def use_server(url, user=None, token=None):
+    """Makes the menu (and search/mark-seen) a thin client of the daemon at url."""
+    global server_url, server_user, server_token
+    server_url, server_user, server_token = url.rstrip("/"), user, token
+    module = globals()
+    for name in SERVER_FUNCTIONS:
+        module[name] = module[f"server_{name}"]
+
+async def server_request(method, path, params=None, payload=None, timeout=SERVE_REQUEST_TIMEOUT):
+    """Calls the daemon's API. Returns the decoded answer, or None after printing what went wrong.
+
+    GET answers are revalidated with their ETag, so unchanged ones aren't sent again.
+    A 409 Conflict isn't printed; the caller reports it.
+    """
+    import aiohttp
+    params = {key: str(value) for key, value in (params or {}).items()}
+    headers = {}
+    if server_user:
+        headers["X-Ytrss-User"] = server_user
+    if server_token:
+        headers["Authorization"] = f"Bearer {server_token}"
+    key = (path, tuple(sorted(params.items())))
+    cached = _server_etags.get(key) if method == "GET" else None
+    if cached:
+        headers["If-None-Match"] = cached[0]
+    try:
+        async with get_http_session().request(method, server_url + path, params=params, json=payload,
+                                              headers=headers,
+                                              timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status == 304 and cached:
+                return cached[1]
+            if resp.status >= 400:
+                if resp.status != 409:
+                    print(f"{method} {path} failed: {resp.status} {(await resp.text())[:200]}")
+                return None
+            data = await resp.json()
+            if method == "GET" and "ETag" in resp.headers:
+                _server_etags[key] = (resp.headers["ETag"], data)
+            return data
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        print(f"Could not reach {server_url}: {e or type(e).__name__}")
+        return None
+
+async def server_fetch_snapshot():
+    """Loads the daemon's feed lists and feed status. Returns False if it couldn't be reached."""
+    data = await server_request("GET", "/api/snapshot")
+    if data is None:
+        return False
+    server_feeds.clear()
+    for feed in data['feeds']:
+        server_feeds[feed['url']] = feed
+        feed_status[feed['url']] = feed['status']
+    return True
+
+def server_fill_lists(videos_by_feed, feed_titles):
+    videos_by_feed.clear()
+    feed_titles.clear()
+    for url, feed in server_feeds.items():
+        feed_titles[url] = feed['title']
+        videos_by_feed[url] = [video_from_record(record) for record in feed['videos']]
+
+async def server_load_state():
+    global watch_later_id
+    data = await server_request("GET", "/api/playlists")
+    if data is None or not await server_fetch_snapshot():
+        sys.exit(1)
+    watch_later_id = next(p['id'] for p in data['playlists'] if p['system'])
+
+def server_load_feeds_from_opml():
+    return list(server_feeds)
+
+async def server_load_snapshot(feeds):
+    videos_by_feed, feed_titles = {}, {}
+    server_fill_lists(videos_by_feed, feed_titles)
+    return videos_by_feed, feed_titles
+
+def server_start_refresh(feeds, force=False):
+    # The daemon knows which feeds are due; it refreshes those and answers when done
+    return asyncio.ensure_future(server_refresh(force)), len(feeds)
+
+async def server_refresh(force):
+    if await server_request("POST", "/api/refresh", payload={'all': force}, timeout=SERVE_REFRESH_TIMEOUT) is None:
+        raise RuntimeError(f"{server_url} did not refresh")
+    await server_fetch_snapshot()
+    return {}
+
+async def server_apply_refresh(resolved, videos_by_feed, feed_titles):
+    server_fill_lists(videos_by_feed, feed_titles)
+    return []
+
+def server_feed_failing(url):
+    return url in server_feeds and server_feeds[url]['failing']
+
+def server_start_metadata_prefetch():
+    pass  # The daemon resolves durations
+
+async def server_prioritize_metadata_jobs(items):
+    await server_resolve_metadata(items, 0)
+
+async def server_resolve_metadata(items, wait=METADATA_MENU_WAIT):
+    data = await server_request("POST", "/api/metadata", payload={'ids': [video_id for video_id, _ in items],
+                                                                  'wait': wait})
+    if data:
+        metadata_cache.update(data['metadata'])
+
+def server_mark_ids_as_seen(video_ids, user=None):
+    """Queues IDs for the daemon's seen list; they are sent together shortly after."""
+    global _server_flush_handle
+    video_ids = [video_id for video_id in video_ids if video_id]  # The daemon keeps non-YouTube IDs too
+    _server_pending_seen.extend(video_ids)
+    if _server_flush_handle is None and _server_pending_seen:
+        _server_flush_handle = asyncio.get_running_loop().call_later(
+            DB_FLUSH_DELAY, lambda: asyncio.ensure_future(server_flush()))
+    return len(video_ids)
+
+async def server_flush():
+    """Sends the IDs marked seen since the last flush."""
+    global _server_flush_handle
+    if _server_flush_handle is not None:
+        _server_flush_handle.cancel()
+        _server_flush_handle = None
+    if _server_pending_seen:
+        video_ids = _server_pending_seen[:]
+        _server_pending_seen.clear()
+        await server_request("POST", "/api/seen", payload={'ids': video_ids})
+
+async def server_get_playlists():
+    data = await server_request("GET", "/api/playlists")
+    if data is None:
+        return []
+    return [(p['id'], p['name'], p['count'], p['system']) for p in data['playlists']]
+
+async def server_create_playlist(name):
+    return await server_request("POST", "/api/playlists", payload={'name': name}) is not None
+
+async def server_delete_playlist(playlist_id):
+    return await server_request("DELETE", f"/api/playlists/{playlist_id}") is not None
+
+async def server_add_to_playlist(playlist_id, video):
+    return await server_request("POST", f"/api/playlists/{playlist_id}/videos", payload=video_record(video)) is not None
+
+async def server_remove_from_playlist(playlist_id, video_id):
+    return await server_request("DELETE", f"/api/playlists/{playlist_id}/videos/{video_id}") is not None
+
+async def server_get_playlist_videos(playlist_id, after=None, limit=PLAYLIST_PAGE_SIZE, user=None):
+    params = {'limit': limit}
+    if after:
+        params['after'], params['after_id'] = after
+    data = await server_request("GET", f"/api/playlists/{playlist_id}/videos", params)
+    return [video_from_record(record) for record in data['videos']] if data else []
+
+async def server_search_videos(words, filters, limit=SEARCH_PAGE_SIZE, offset=0, user=None):
+    params = {key: value for key, value in filters.items() if value is not None}
+    params.update(q=words, limit=limit, offset=offset)
+    data = await server_request("GET", "/api/search", params)
+    return [video_from_record(record) for record in data['videos']] if data else []
+
+# Functions enable_tracing() wraps in timing spans: (name, category, describe).
+# describe, if given, maps the call's arguments to (span name, trace args).
+TRACE_POINTS = [
+    ("fetch_feed", "net", lambda session, url, cached=None: ("fetch_feed", {"url": url})),
+    ("fetch_feeds", "net", None),
+    ("parse_feeds", "parse", lambda bodies: ("parse_feeds", {"feeds": len(bodies)})),
+    ("parse_feed", "parse", None),
+    ("resolve_feeds", "parse", None),
+    ("refresh_feeds", "refresh", lambda feeds, due=None, stream=False: (
+        "refresh_feeds", {"feeds": len(feeds), "due": len(feeds if due is None else due)})),
+    ("classify_shorts", "net", None),
+    ("renew_websub", "net", None),
+    ("ingest_push", "refresh", lambda url, *_: ("ingest_push", {"url": url})),
+    ("apply_refresh", "refresh", None),
+    ("merge_feeds", "refresh", None),
+    ("load_state", "db", None),
+    ("load_snapshot", "db", None),
+    ("search_videos", "db", None),
+    ("db_call", "db", lambda fn, *args: (f"db_call:{getattr(fn, '__name__', 'flush')}", None)),
+    ("run_db_job", "db", lambda writes, fn, args: (f"db:{getattr(fn, '__name__', 'flush')}",
+                                                    {"queued_writes": len(writes)})),
+    ("resolve_metadata", "metadata", lambda items: ("resolve_metadata", {"videos": len(items)})),
+    ("resolve_metadata_batch", "metadata", lambda batch: ("resolve_metadata_batch", {"videos": len(batch)})),
+    ("run_ytdlp_batch", "metadata", lambda urls: ("run_ytdlp_batch", {"videos": len(urls)})),
+    ("extract_metadata_batch", "metadata", lambda urls: ("extract_metadata_batch", {"videos": len(urls)})),
+    ("group_videos", "menu", None),
+    ("count_unread", "menu", None),
+    ("build_main_menu", "menu", None),
+    ("video_menu_entries", "menu", None),
+]
+# Called too often for an event each; they only show up in the summary
+TRACE_HOT_POINTS = ["clean_title", "video_row", "make_video"]
+
+def record_span(name, category, start, end, trace_args=None, is_async=False, detailed=True):
+    global _trace_next_id
+    duration = end - start
+    with _trace_lock:
+        totals = _trace_totals.get(name)
+        if totals is None:
+            totals = _trace_totals[name] = [0, 0, 0]
+        totals[0] += 1
+        totals[1] += duration
+        totals[2] = max(totals[2], duration)
+        if not detailed:
+            return
+        event = {"name": name, "cat": category, "pid": os.getpid(), "tid": threading.get_ident(),
+                 "ts": start / 1000, "args": trace_args or {}}
+        if is_async:
+            # Coroutines overlap on one thread, so they go on async tracks
+            _trace_next_id += 1
+            _trace_events.append(dict(event, ph="b", id=_trace_next_id))
+            _trace_events.append(dict(event, ph="e", id=_trace_next_id, ts=end / 1000))
+        else:
+            _trace_events.append(dict(event, ph="X", dur=duration / 1000))
+
+def traced(fn, name, category, describe=None, detailed=True):
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            span, trace_args = describe(*args, **kwargs) if describe else (name, None)
+            start = time.perf_counter_ns()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                record_span(span, category, start, time.perf_counter_ns(), trace_args, True, detailed)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        span, trace_args = describe(*args, **kwargs) if describe else (name, None)
+        start = time.perf_counter_ns()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record_span(span, category, start, time.perf_counter_ns(), trace_args, False, detailed)
+    return wrapper
+
+def enable_tracing():
+    """Wraps the TRACE_POINTS functions in timing spans.
+
+    Nothing is wrapped unless this is called, so tracing costs nothing when
+    it's off. Calls inside this module look functions up by name, so the
+    wrappers take effect everywhere.
+    """
+    global _trace_events
+    if _trace_events is not None:
+        return
+    _trace_events = []
+    module = globals()
+    for name, category, describe in TRACE_POINTS:
+        module[name] = traced(module[name], name, category, describe)
+    for name in TRACE_HOT_POINTS:
+        module[name] = traced(module[name], name, "hot", detailed=False)
+
+def write_trace(path):
+    """Writes the recorded spans as Chrome trace JSON (chrome://tracing, ui.perfetto.dev)."""
+    events = list(_trace_events)
+    for thread in threading.enumerate():
+        events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident,
+                       "args": {"name": thread.name}})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    print(f"Trace written to {path}", file=sys.stderr)
+
+def print_trace_summary():
+    rows = sorted(_trace_totals.items(), key=lambda item: item[1][1], reverse=True)
+    print(f"\n{'span':<40} {'calls':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9}", file=sys.stderr)
+    for name, (calls, total, longest) in rows:
+        print(f"{name[:40]:<40} {calls:>8} {total / 1e6:>10.1f} {total / calls / 1e6:>9.2f} {longest / 1e6:>9.1f}",
+              file=sys.stderr)
+    print("(spans of concurrent coroutines overlap, so totals can exceed the wall time)", file=sys.stderr)
+
+def start_profiling(args):
+    """Turns on the diagnostics asked for by --profile/--trace/--cprofile/--tracemalloc or YTRSS_TRACE."""
+    trace_env = os.environ.get("YTRSS_TRACE", "")
+    if trace_env and not args.trace and trace_env.lower() not in ("1", "true", "summary"):
+        args.trace = trace_env
+    if trace_env or args.profile or args.trace:
+        enable_tracing()
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start(25)
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+def finish_profiling(args, profiler):
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+        print(f"cProfile stats written to {args.cprofile} (python -m pstats {args.cprofile})", file=sys.stderr)
+    if args.tracemalloc:
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot.dump(args.tracemalloc)
+        print(f"\nPython heap: {current / 2**20:.1f} MiB now, {peak / 2**20:.1f} MiB peak. Top allocations:",
+              file=sys.stderr)
+        for stat in snapshot.statistics("lineno")[:15]:
+            print(f"  {stat}", file=sys.stderr)
+        print(f"tracemalloc snapshot written to {args.tracemalloc}", file=sys.stderr)
+    if _trace_events is not None:
+        if args.trace:
+            write_trace(args.trace)
+        if args.profile or not args.trace:
+            print_trace_summary()
+
+YOUTUBE_ID_RE = re.compile(r'(?:v=|youtu\.be/|shorts/|yt:video:)([A-Za-z0-9_-]{11})')
+
+def normalize_video_id(text):
+    """Accepts a bare YouTube ID, a yt:video: ID or a watch/shorts URL."""
+    text = text.strip()
+    if re.fullmatch(r'[A-Za-z0-9_-]{11}', text):
+        return f"yt:video:{text}"
+    m = YOUTUBE_ID_RE.search(text)
+    if m:
+        return f"yt:video:{m.group(1)}"
+    return text or None
+
+async def cmd_fetch(args):
+    """Refreshes the due feeds (or all with --all) and stores new videos, without any UI."""
+    await load_state()
+    feeds = load_feeds_from_opml()
+    if not feeds:
+        print("No channels found.", file=sys.stderr)
+        return 1
+    videos_by_feed, feed_titles = await load_snapshot(feeds)
+    due = feeds if args.all else due_feeds(feeds)
+    resolved = await refresh_feeds(feeds, due)
+    added = await apply_refresh(resolved, videos_by_feed, feed_titles)
+    if not args.quiet:
+        print_feed_status(feeds)
+        print(f"{len(added)} new videos.")
+    if args.metadata:
+        await drain_metadata_jobs()
+    failed = sum(1 for url in due if feed_status.get(url, "").startswith("failed"))
+    return 1 if due and failed == len(due) else 0
+
+async def cmd_push(args):
+    """Receives new uploads from the WebSub hub instead of polling, until stopped.
+
+    Every WEBSUB_CHECK_INTERVAL the OPML is re-read, subscriptions are
+    renewed, and the feeds that are due anyway (no live subscription yet,
+    or the daily safety poll) are fetched the usual way.
+    """
+    await load_state()
+    feeds = load_feeds_from_opml()
+    if not feeds:
+        print("No channels found.", file=sys.stderr)
+        return 1
+    host, _, port = args.listen.rpartition(":")
+    callback_base = args.callback.rstrip("/")
+    videos_by_feed, feed_titles = await load_snapshot(feeds)
+    runner = await start_websub_receiver(host or "127.0.0.1", int(port), videos_by_feed, feed_titles, args.quiet)
+    if not args.quiet:
+        print(f"Listening on {host or '127.0.0.1'}:{port}, callbacks under {callback_base}/websub/")
+    start_metadata_prefetch()
+    # SIGTERM (e.g. from systemd) stops the loop so pending writes are flushed on the way out
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        while not stop.is_set():
+            await renew_websub(feeds, args.hub, callback_base)
+            due = due_feeds(feeds)
+            if due:
+                resolved = await refresh_feeds(feeds, due)
+                added = await apply_refresh(resolved, videos_by_feed, feed_titles)
+                for url in due:
+                    if websub_active(url):
+                        defer_poll(url)
+                await db_flush()
+                if not args.quiet:
+                    print(f"Polled {len(due)} feeds without a live subscription: {len(added)} new videos.", flush=True)
+            try:
+                await asyncio.wait_for(stop.wait(), WEBSUB_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            feeds = load_feeds_from_opml()
+    finally:
+        await runner.cleanup()
+    return 0
+
+async def cmd_serve(args):
+    """Fetches, parses and resolves durations for every client and answers the JSON API, until stopped."""
+    from aiohttp import web
+    await load_state()
+    feeds = load_feeds_from_opml()
+    videos_by_feed, feed_titles = await load_snapshot(feeds)
+    state = {'feeds': feeds, 'videos_by_feed': videos_by_feed, 'feed_titles': feed_titles,
+             'channels': group_videos(videos_by_feed, feed_titles), 'refresh': None, 'summary': ""}
+    count_unread(state['channels'])
+    host, _, port = args.listen.rpartition(":")
+    runner = web.AppRunner(make_server_app(state, args.token), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host or "127.0.0.1", int(port)).start()
+    if not args.quiet:
+        print(f"Serving {len(feeds)} feeds on {host or '127.0.0.1'}:{port}")
+    start_metadata_prefetch()
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        while not stop.is_set():
+            try:
+                added = await serve_refresh(state)
+            except Exception as e:
+                print(f"Refresh failed: {e}", file=sys.stderr, flush=True)
             else:
-                found_name = None
-                for name in channel_names:
-                    if choice_text.startswith(name + " ("):
-                        found_name = name
-                        break
-                
-                if found_name and found_name in all_videos_by_channel:
-                    videos = sorted(all_videos_by_channel[found_name], key=lambda x: x['published'], reverse=True)
-                    await show_video_menu(videos)
+                if not args.quiet:
+                    print(f"{datetime.now():%H:%M:%S}  {state['summary']} {len(added)} new videos.", flush=True)
+            try:
+                await asyncio.wait_for(stop.wait(), SERVE_REFRESH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await runner.cleanup()
+    return 0
+
+def video_record(v):
+    """A video as the JSON object `ytrss list --json` prints and `ytrss serve` sends."""
+    published = v.published
+    record = {'id': v.id, 'title': v.title, 'channel': v.channel, 'link': v.link,
+              'published': datetime.fromtimestamp(published).isoformat() if published else None,
+              'published_ts': published, 'is_shorts': v.is_shorts, 'duration': v.duration,
+              'duration_seconds': v.seconds, 'is_seen': v.is_seen}
+    if v.feed_url:
+        record['feed_url'] = v.feed_url
+    if v.added_at:
+        record['added_at'] = v.added_at
+    return record
+
+def video_from_record(record):
+    return Video(record['id'], record.get('title') or "", record.get('link'), record.get('published_ts'),
+                 record.get('channel'), bool(record.get('is_shorts')), bool(record.get('is_seen')),
+                 record.get('duration_seconds'), record.get('feed_url'), record.get('added_at'))
+
+def format_video_line(v, as_json=False):
+    """Formats a stored video for the list/search commands."""
+    published = v.published
+    if as_json:
+        return json.dumps(video_record(v), ensure_ascii=False)
+    dt = datetime.fromtimestamp(published).strftime("%Y-%m-%d %H:%M") if published else "????-??-?? ??:??"
+    seen_mark = "✔" if v.is_seen else " "
+    return f"[{seen_mark}] {dt}  {v.duration:<6}  {(v.channel or '')[:20]:<20}  {v.title}  {v.link}"
+
+def discard_stdout():
+    """Points stdout at /dev/null once its reader has gone away.
+
+    Python flushes stdout again on exit, which would hit the broken pipe a second time.
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+
+async def cmd_list(args):
+    """Streams stored videos, newest first, as text or JSON lines."""
+    await load_state()
+    feeds = set(load_feeds_from_opml())
+    channels = [c.lower() for c in args.channel or []]
+    count = 0
+    async for v in iter_stored_videos():
+        if v.feed_url not in feeds:
+            continue
+        if channels and not any(c in (v.channel or "").lower() for c in channels):
+            continue
+        if args.shorts == "hide" and v.is_shorts or args.shorts == "only" and not v.is_shorts:
+            continue
+        if args.seen == "unseen" and v.is_seen or args.seen == "seen" and not v.is_seen:
+            continue
+
+        try:
+            print(format_video_line(v, args.json), flush=args.json)
+        except BrokenPipeError:
+            # Reader went away (e.g. piped into head)
+            discard_stdout()
+            return 1
+
+        count += 1
+        if args.limit and count >= args.limit:
+            break
+    return 0
+
+async def cmd_search(args):
+    """Prints the stored videos that best match a query, as text or JSON lines."""
+    words, options = split_search_terms(" ".join(args.query))
+    # Flags win over key:value words in the query
+    options.update((key, getattr(args, key)) for key in SEARCH_FILTER_KEYS if getattr(args, key) is not None)
+    try:
+        filters = search_filters(**options)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    await load_state()
+    videos = await search_videos(words, filters, args.limit)
+    for v in videos:
+        try:
+            print(format_video_line(v, args.json), flush=args.json)
+        except BrokenPipeError:
+            discard_stdout()
+            return 1
+    return 0 if videos else 1
+
+async def cmd_mark_seen(args):
+    """Marks the video IDs/URLs given as arguments, or one per line on stdin, as seen."""
+    await load_state()
+    lines = args.ids or sys.stdin
+    video_ids = {vid for vid in (normalize_video_id(line) for line in lines) if vid}
+    marked = mark_ids_as_seen(video_ids)
+    await db_flush()
+    print(f"Marked {marked} videos as seen.", file=sys.stderr)
+    return 0
+
+async def cmd_import(args):
+    """Adds subscriptions from OPML, CSV or URL list files (or stdin)."""
+    entries = []
+    for name in args.files:
+        try:
+            if name == "-":
+                text = sys.stdin.read()
+            else:
+                with open(name, encoding='utf-8-sig') as f:
+                    text = f.read()
+            entries.extend(read_subscriptions(text))
+        except (OSError, UnicodeDecodeError, ET.ParseError) as e:
+            print(f"Could not read {name}: {e}", file=sys.stderr)
+            return 2
+    result = await import_subscriptions(entries, args.dry_run)
+    print_import_summary(result, args.dry_run)
+    return 1 if result['failed'] else 0
+
+async def cmd_export(args):
+    """Writes ALL VIDEOS and every playlist as Atom and M3U files; later changes patch them."""
+    await load_state()
+    names = await export_outputs()
+    if not args.quiet:
+        for name in names:
+            print("  ".join(output_paths(name)))
+    return 0
+
+def _compact_db(conn, cutoff, keep_per_feed):
+    """Forgets old history. Returns (videos removed, seen entries removed)."""
+    with conn:
+        # Old videos beyond each feed's snapshot window, unless a playlist still holds them
+        videos_removed = conn.execute('''DELETE FROM videos WHERE video_id IN (
+                                   SELECT video_id FROM (
+                                       SELECT video_id, published_ts, ROW_NUMBER() OVER (
+                                           PARTITION BY feed_url ORDER BY published_ts DESC) AS rn
+                                       FROM videos WHERE feed_url IS NOT NULL)
+                                   WHERE rn > ? AND published_ts < ?)
+                               AND video_id NOT IN (SELECT video_id FROM playlist_items)''',
+                            (keep_per_feed, cutoff)).rowcount
+        conn.execute("DELETE FROM video_metadata WHERE video_id NOT IN (SELECT video_id FROM videos)")
+        conn.execute("DELETE FROM metadata_jobs WHERE video_id NOT IN (SELECT video_id FROM videos)")
+
+        # Seen entries only matter while their video can still show up
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_seen (vid INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM keep_seen")
+        conn.execute("INSERT OR IGNORE INTO keep_seen SELECT yt_id(video_id) FROM videos WHERE yt_id(video_id) IS NOT NULL")
+        seen_removed = conn.execute('''DELETE FROM seen WHERE seen_ts < ?
+                                      AND vid NOT IN (SELECT vid FROM keep_seen)''', (cutoff,)).rowcount
+        seen_removed += conn.execute('''DELETE FROM user_seen WHERE seen_ts < ?
+                                       AND vid NOT IN (SELECT vid FROM keep_seen)''', (cutoff,)).rowcount
+        seen_removed += conn.execute('''DELETE FROM seen_other WHERE seen_ts < ?
+                                       AND video_id NOT IN (SELECT video_id FROM videos)''', (cutoff,)).rowcount
+        conn.execute("DROP TABLE keep_seen")
+
+        # Text-keyed table from older versions, already copied into seen and seen_other
+        conn.execute("DROP TABLE IF EXISTS seen_videos")
+    conn.execute("VACUUM")
+    # VACUUM may renumber the rowids the search index refers to
+    with conn:
+        conn.execute("INSERT INTO video_search (video_search) VALUES ('rebuild')")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return videos_removed, seen_removed
+
+async def cmd_compact(args):
+    """Drops history older than --keep-days and shrinks the database file."""
+    await load_state()
+    cutoff = int(time.time()) - args.keep_days * 86400
+    size_before = os.path.getsize(DB_FILE)
+    videos_removed, seen_removed = await db_call(_compact_db, cutoff, SNAPSHOT_CHANNEL_LIMIT)
+    size_after = os.path.getsize(DB_FILE)
+    print(f"Removed {videos_removed} stored videos and {seen_removed} seen entries; "
+          f"database {size_before // 1024} KiB -> {size_after // 1024} KiB.")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ytrss",
+        description="Browse YouTube subscriptions via RSS. Without a command the interactive menu starts.")
+    parser.add_argument("--profile", action="store_true",
+                        help="time network, parsing, DB, yt-dlp and menu work and print a summary on exit")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write timing spans as Chrome trace JSON (also: YTRSS_TRACE=FILE)")
+    parser.add_argument("--cprofile", metavar="FILE", help="run under cProfile and save the stats")
+    parser.add_argument("--tracemalloc", metavar="FILE",
+                        help="trace Python allocations, print the top sites and save the snapshot")
+    parser.add_argument("--server", metavar="URL", default=os.environ.get("YTRSS_SERVER"),
+                        help="use a `ytrss serve` daemon instead of the local feeds and database "
+                             "(menu, search and mark-seen; also: YTRSS_SERVER=URL)")
+    parser.add_argument("--user", default=os.environ.get("YTRSS_USER"),
+                        help="with --server: whose seen videos to use (default: the daemon's own; also: YTRSS_USER)")
+    parser.add_argument("--token", default=os.environ.get("YTRSS_TOKEN"),
+                        help="API token that `serve` requires and --server sends (also: YTRSS_TOKEN)")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+
+    fetch_parser = subparsers.add_parser("fetch", help="refresh the feeds that are due and store new videos")
+    fetch_parser.add_argument("--all", action="store_true",
+                              help="fetch every feed, whether it's due or not")
+    fetch_parser.add_argument("--metadata", action="store_true",
+                              help="also resolve durations for videos that are missing them")
+    fetch_parser.add_argument("-q", "--quiet", action="store_true", help="don't print a summary")
+    fetch_parser.set_defaults(func=cmd_fetch)
+
+    list_parser = subparsers.add_parser("list", help="print stored videos, newest first")
+    list_parser.add_argument("--json", action="store_true", help="print one JSON object per line")
+    list_parser.add_argument("--channel", action="append", metavar="NAME",
+                             help="only channels whose name contains NAME (repeatable)")
+    list_parser.add_argument("--shorts", choices=["show", "hide", "only"], default="show")
+    list_parser.add_argument("--seen", choices=["unseen", "seen", "all"], default="unseen",
+                             help="filter by seen status (default: unseen)")
+    list_parser.add_argument("--limit", type=int, default=0, help="stop after N videos")
+    list_parser.set_defaults(func=cmd_list)
+
+    search_parser = subparsers.add_parser("search", help="full-text search over all stored videos, best matches first",
+                                          description=SEARCH_SYNTAX)
+    search_parser.add_argument("query", nargs="*", metavar="WORD")
+    search_parser.add_argument("--channel", metavar="NAME", help="only channels whose name contains NAME")
+    search_parser.add_argument("--since", metavar="YYYY-MM-DD", help="published on or after this day")
+    search_parser.add_argument("--until", metavar="YYYY-MM-DD", help="published on or before this day")
+    search_parser.add_argument("--longer", metavar="MIN", help="at least MIN minutes long")
+    search_parser.add_argument("--shorter", metavar="MIN", help="at most MIN minutes long")
+    search_parser.add_argument("--shorts", choices=["show", "hide", "only"])
+    search_parser.add_argument("--seen", choices=["all", "unseen", "seen"])
+    search_parser.add_argument("--limit", type=int, default=SEARCH_PAGE_SIZE, help="print at most N matches")
+    search_parser.add_argument("--json", action="store_true", help="print one JSON object per line")
+    search_parser.set_defaults(func=cmd_search)
+
+    seen_parser = subparsers.add_parser("mark-seen", help="mark videos as seen (IDs or URLs, or one per line on stdin)")
+    seen_parser.add_argument("ids", nargs="*", metavar="ID")
+    seen_parser.set_defaults(func=cmd_mark_seen)
+
+    import_parser = subparsers.add_parser(
+        "import", help="add subscriptions from OPML, CSV (e.g. YouTube Takeout) or lists of URLs/@handles")
+    import_parser.add_argument("files", nargs="+", metavar="FILE", help="file to import, - for stdin")
+    import_parser.add_argument("--dry-run", action="store_true", help="check everything but don't change the OPML")
+    import_parser.set_defaults(func=cmd_import)
+
+    push_parser = subparsers.add_parser(
+        "push", help="receive new uploads from YouTube's WebSub hub instead of polling (runs until stopped)")
+    push_parser.add_argument("--callback", required=True, metavar="URL",
+                             help="public URL the hub can reach this receiver's --listen address at")
+    push_parser.add_argument("--listen", default=f"127.0.0.1:{WEBSUB_PORT}", metavar="HOST:PORT",
+                             help=f"address to serve callbacks on (default: 127.0.0.1:{WEBSUB_PORT})")
+    push_parser.add_argument("--hub", default=WEBSUB_HUB, metavar="URL", help="WebSub hub to subscribe at")
+    push_parser.add_argument("-q", "--quiet", action="store_true", help="don't print incoming videos")
+    push_parser.set_defaults(func=cmd_push)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="run the shared daemon that fetches for everyone and answers a JSON API (runs until stopped)")
+    serve_parser.add_argument("--listen", default=f"127.0.0.1:{SERVE_PORT}", metavar="HOST:PORT",
+                              help=f"address to answer on (default: 127.0.0.1:{SERVE_PORT})")
+    serve_parser.add_argument("-q", "--quiet", action="store_true", help="don't print refresh summaries")
+    serve_parser.set_defaults(func=cmd_serve)
+
+    export_parser = subparsers.add_parser(
+        "export", help="write ALL VIDEOS and the playlists as Atom and M3U files, kept up to date from then on")
+    export_parser.add_argument("-q", "--quiet", action="store_true", help="don't print the files written")
+    export_parser.set_defaults(func=cmd_export)
+
+    compact_parser = subparsers.add_parser("compact", help="forget old history and shrink the database")
+    compact_parser.add_argument("--keep-days", type=int, default=COMPACT_KEEP_DAYS, metavar="N",
+                                help=f"keep history of the last N days (default: {COMPACT_KEEP_DAYS})")
+    compact_parser.set_defaults(func=cmd_compact)
+
+    args = parser.parse_args(argv)
+    if args.server and args.command not in (None, "search", "mark-seen"):
+        parser.error(f"{args.command} works on the local feeds and database, not with --server")
+    if args.user and not SERVE_USER_RE.fullmatch(args.user):
+        parser.error(f"not a valid user name: {args.user}")
+    return args
+
+async def run(coro):
+    """Runs a top-level coroutine and releases shared resources afterwards."""
+    try:
+        return await coro
+    finally:
+        if server_url:
+            await server_flush()
+        await stop_metadata_prefetch()
+        await close_http_session()
+        await close_db()
+        shutdown_metadata_workers()
 
 if __name__ == "__main__":
+    if getattr(sys, 'frozen', False):
+        # Lets the parse pool's spawned workers start from a PyInstaller binary
+        import multiprocessing
+        multiprocessing.freeze_support()
+    args = parse_args()
+    if args.server:
+        use_server(args.server, args.user, args.token)
+    profiler = start_profiling(args)
+    exit_code = 0
     try:
-        asyncio.run(main_async())
+        if args.command is None:
+            asyncio.run(run(main_async()))
+        else:
+            exit_code = asyncio.run(run(args.func(args)))
     except KeyboardInterrupt:
-        pass
+        exit_code = 130 if args.command else 0
+    except SystemExit as e:
+        exit_code = e.code
+    finally:
+        shutdown_parse_pool()
+        finish_profiling(args, profiler)
+    sys.exit(exit_code)